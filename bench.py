@@ -0,0 +1,810 @@
+# Microbenchmarks for the bot's hot paths.
+#
+#   python bench.py keyboards
+#   python bench.py dispatch
+#   python bench.py loadtest --users 1000 --output run.json
+#   python bench.py sharded --workers 4 --users 1000
+#   python bench.py reminders
+#   python bench.py practice --bank 20000
+#   python bench.py startup --bank 50000
+#   python bench.py mock --users 10000
+#   python bench.py sheet --questions 100
+#
+# The benchmarks point the bot at a throwaway database and a dummy token
+# (only fake Bot APIs are ever called). Load-test exams are 20 questions
+# long unless POLICE_BOT_EXAM_QUESTIONS says otherwise.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('POLICE_BOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('POLICE_BOT_EXAM_QUESTIONS', '20')
+os.environ.setdefault('POLICE_BOT_TOKEN', '123456:bench')
+
+import srcpython as bot
+from datetime import datetime
+from telegram import (
+    CallbackQuery, Chat, InlineKeyboardButton, InlineKeyboardMarkup, Message, Update, User
+)
+from telegram.ext import (
+    CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler, filters
+)
+from telegram.request import BaseRequest
+from aiohttp import ClientSession, web
+
+# Time per call and bytes still allocated per call when every result is kept
+def measure(func, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    kept = [func(i) for i in range(calls)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return elapsed / calls * 1e6, size / calls
+
+def report(name, rebuilt, cached):
+    print(f"{name:<12} rebuilt {rebuilt[0]:7.2f} us {rebuilt[1]:7.0f} B/call   "
+          f"cached {cached[0]:7.2f} us {cached[1]:7.0f} B/call")
+
+# Keyboards rebuilt per call, as before, against the shared/cached markups.
+# Question keyboards come from back-to-back exams, each a fresh random
+# paper of --questions IDs from a --bank question bank, and the cache hit
+# rate over those exams is reported.
+def bench_keyboards(args):
+    options = ["पर्याय एक", "पर्याय दोन", "पर्याय तीन", "पर्याय चार"]
+
+    def rebuilt_question(i):
+        keyboard = [
+            [InlineKeyboardButton(f"{n+1}. {option}", callback_data=f"answer_{n}")]
+            for n, option in enumerate(options)
+        ]
+        keyboard.append([InlineKeyboardButton("🚪 परीक्षा सोडा", callback_data="exit_exam")])
+        return InlineKeyboardMarkup(keyboard)
+
+    paper = []
+
+    def next_question(i):
+        if i % args.questions == 0:
+            paper[:] = random.sample(range(args.bank), args.questions)
+        return paper[i % args.questions]
+
+    def cached_question(i):
+        return bot.question_keyboard(next_question(i), options)
+
+    # Warm up over as many exams as the timed run, counting cache hits
+    hits = 0
+    for i in range(args.calls):
+        question_id = next_question(i)
+        hits += (question_id, False) in bot._question_keyboards
+        bot.question_keyboard(question_id, options)
+    report("main menu",
+           measure(lambda i: bot.main_menu_keyboard.__wrapped__(), args.calls),
+           measure(lambda i: bot.main_menu_keyboard(), args.calls))
+    report("subjects",
+           measure(lambda i: bot.subject_keyboard.__wrapped__(), args.calls),
+           measure(lambda i: bot.subject_keyboard(), args.calls))
+    report("question",
+           measure(rebuilt_question, args.calls),
+           measure(cached_question, args.calls))
+    print(f"question cache hit rate {hits / args.calls:.1%} "
+          f"({args.bank} question bank, {bot.KEYBOARD_CACHE_SIZE} cached keyboards)")
+
+def message_update(text):
+    user = User(1, 'U', False)
+    message = Message(1, datetime.now(), Chat(1, Chat.PRIVATE), from_user=user, text=text)
+    return Update(1, message=message)
+
+def callback_update(data):
+    user = User(1, 'U', False)
+    return Update(1, callback_query=CallbackQuery('1', user, 'x', data=data))
+
+# The handler PTB would pick: the first in the group whose check passes
+def first_match(handlers, update):
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+# Handlers as registered before the menu router and callback dispatcher
+def legacy_handlers(application):
+    async def noop(update, context):
+        pass
+    handlers = list(application.handlers[0][:3])
+    handlers.insert(1, CommandHandler("start", noop))
+    for label in bot.MENU_ROUTES:
+        handlers.append(MessageHandler(filters.Regex(f"^{label}$"), noop))
+    for pattern in ("^subject_", "^main_menu$", "^answer_", "^exit_exam$", "^confirm_exit$", "^cancel_exit$"):
+        handlers.append(CallbackQueryHandler(noop, pattern=pattern))
+    handlers.append(ConversationHandler(
+        entry_points=[MessageHandler(filters.Regex("^⏰ रिमाइंडर सेट करा$"), noop)],
+        states={}, fallbacks=[]
+    ))
+    return handlers
+
+# Cost of finding the handler for menu presses, free text and buttons, with
+# the old regex chain against the current router and dispatcher. For the
+# dispatcher this includes decoding the callback data.
+def bench_dispatch(args):
+    application = bot.build_application()
+    current = application.handlers[0]
+    legacy = legacy_handlers(application)
+
+    menu = [message_update(label) for label in bot.MENU_ROUTES]
+    text = [message_update("उद्या सकाळी अभ्यास")]
+    legacy_buttons = [callback_update(data) for data in ("answer_2", "cancel_exit")]
+    buttons = [callback_update(bot.encode_callback(bot.CB_ANSWER, 12345, 2)),
+               callback_update(bot.encode_callback(bot.CB_CANCEL_EXIT, 2**31))]
+
+    def cost(handlers, updates, decode=False):
+        def run(i):
+            update = updates[i % len(updates)]
+            if decode:
+                decoded = bot.decode_callback(update.callback_query.data)
+                bot.CALLBACK_HANDLERS.get(decoded[0])
+            return first_match(handlers, update)
+        return measure(run, args.calls)
+
+    for name, old, new in (
+        ("menu button", cost(legacy, menu), cost(current, menu)),
+        ("free text", cost(legacy, text), cost(current, text)),
+        ("inline button", cost(legacy, legacy_buttons), cost(current, buttons, decode=True)),
+    ):
+        print(f"{name:<14} regex chain {old[0]:6.2f} us   router {new[0]:6.2f} us")
+
+# Local stand-in for the Bot API: answers every call the way Telegram
+# would, after an optional simulated round trip
+class FakeBotAPI(BaseRequest):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[1]
+        params = request_data.parameters if request_data else {}
+        result = fake_api_result(endpoint, params, self._message_ids)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+def fake_api_result(endpoint, params, message_ids):
+    if endpoint == 'getMe':
+        return {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+    if endpoint in ('sendMessage', 'editMessageText'):
+        return {
+            'message_id': int(params.get('message_id') or next(message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id')), 'type': 'private'},
+            'text': params.get('text', '')
+        }
+    return True
+
+# Raw update payloads, as Telegram would POST them
+_update_ids = itertools.count(1)
+
+def message_payload(user_id, text):
+    payload = {
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': next(_update_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Examinee'},
+            'text': text
+        }
+    }
+    if text.startswith('/'):
+        payload['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return payload
+
+def callback_payload(user_id, data):
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'chat_instance': str(user_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Examinee'},
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'bench'},
+                'text': 'question'
+            }
+        }
+    }
+
+def percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p99': None, 'max': None}
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000
+    return {'p50': round(pick(0.50), 3), 'p99': round(pick(0.99), 3), 'max': round(ordered[-1] * 1000, 3)}
+
+# One examinee: register, pick the subject, start the exam and answer every
+# question, waiting for the next one to appear like a real user would
+async def examinee(application, user_id, subject_id, think, latencies):
+    async def send(payload):
+        update = Update.de_json(payload, application.bot)
+        start = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - start)
+
+    await send(message_payload(user_id, '/start'))
+    await send(message_payload(user_id, f'Examinee {user_id}'))
+    await send(callback_payload(user_id, bot.encode_callback(bot.CB_SUBJECT, subject_id)))
+    await send(message_payload(user_id, bot.MAIN_MENU[0][0][0]))
+    user_data = application.user_data[user_id]
+    while 'question_ids' in user_data:
+        position = user_data['current_question']
+        question_id = user_data['question_ids'][position]
+        answer = bot.encode_callback(bot.CB_ANSWER, question_id, random.randrange(4))
+        await send(callback_payload(user_id, answer))
+        await asyncio.sleep(think)
+        while 'question_ids' in user_data and user_data['current_question'] == position:
+            await asyncio.sleep(think)
+
+# Start exams without answering, to see what an open session costs
+async def open_sessions(application, user_ids, subject_id):
+    for user_id in user_ids:
+        for payload in (
+            message_payload(user_id, '/start'),
+            message_payload(user_id, f'Examinee {user_id}'),
+            callback_payload(user_id, bot.encode_callback(bot.CB_SUBJECT, subject_id)),
+            message_payload(user_id, bot.MAIN_MENU[0][0][0]),
+        ):
+            await application.process_update(Update.de_json(payload, application.bot))
+
+async def watch_loop_lag(samples, interval=0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+# Drive the real Application and handlers with simulated examinees against
+# a fake Bot API and report latency, throughput, SQLite writes, memory per
+# session and event-loop lag as JSON
+async def run_loadtest(args):
+    bot.FEEDBACK_DELAY_CORRECT = bot.FEEDBACK_DELAY_WRONG = bot.FEEDBACK_DELAY_CELEBRATION = 0
+    if not args.telegram_limits:
+        bot.outbox = bot.OutboundQueue(global_rate=1e9, chat_rate=1e9, max_pending=10 ** 7)
+    api = FakeBotAPI(args.api_latency / 1000)
+    application = bot.build_application(request=api)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    await bot.question_store.loaded.wait()
+
+    subject = bot.SUBJECTS[3]
+    await bot.load_question_bank({subject: [
+        {'question': f'प्रश्न {i}', 'options': ['अ', 'ब', 'क', 'ड'],
+         'correct_answer': i % 4, 'difficulty': 1 + i % 3}
+        for i in range(args.bank)
+    ]})
+    subject_id = bot.SUBJECTS.index(subject)
+
+    latencies, lag = [], []
+    lag_task = asyncio.create_task(watch_loop_lag(lag))
+    written = bot.write_behind.metrics['written']
+    started = time.perf_counter()
+    examinees = []
+    for n in range(args.users):
+        examinees.append(asyncio.create_task(
+            examinee(application, 10 ** 6 + n, subject_id, args.think, latencies)
+        ))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / args.users)
+    await asyncio.gather(*examinees)
+    await bot.write_behind.flush()
+    elapsed = time.perf_counter() - started
+    lag_task.cancel()
+    written = bot.write_behind.metrics['written'] - written
+
+    # Memory held per open exam, measured on a separate cohort
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    await open_sessions(application, range(2 * 10 ** 6, 2 * 10 ** 6 + args.sessions), subject_id)
+    await asyncio.sleep(0.2)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    report = {
+        'users': args.users,
+        'questions_per_exam': bot.EXAM_QUESTION_COUNT,
+        'updates': len(latencies),
+        'duration_s': round(elapsed, 3),
+        'updates_per_s': round(len(latencies) / elapsed, 1),
+        'handler_latency_ms': percentiles(latencies),
+        'loop_lag_ms': percentiles(lag),
+        'sqlite': {
+            'rows_written': written,
+            'rows_per_s': round(written / elapsed, 1),
+            'flushes': bot.write_behind.metrics['flushes'],
+            'coalesced': bot.write_behind.metrics['coalesced'],
+        },
+        'memory_per_session_bytes': round((after - before) / max(args.sessions, 1)),
+        'bot_api_calls': api.calls,
+        'outbox': dict(bot.outbox.metrics),
+    }
+
+    await application.stop()
+    await application.post_stop(application)
+    await application.shutdown()
+    await application.post_shutdown(application)
+    return report
+
+def bench_loadtest(args):
+    report = asyncio.run(run_loadtest(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+# The same fake Bot API over HTTP, for bots running in other processes.
+# Every inline keyboard sent to a chat is handed to that chat's queue, so
+# a simulated user can tap what the bot actually showed them.
+class FakeBotAPIServer:
+    def __init__(self):
+        self.calls = 0
+        self.chats = {}
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    def chat(self, chat_id):
+        if chat_id not in self.chats:
+            self.chats[chat_id] = asyncio.Queue()
+        return self.chats[chat_id]
+
+    async def handle(self, request):
+        self.calls += 1
+        endpoint = request.match_info['tail'].rsplit('/', 1)[-1]
+        params = dict(await request.post())
+        if 'reply_markup' in params or 'text' in params:
+            markup = json.loads(params.get('reply_markup') or '{}')
+            buttons = [row[0] for row in markup.get('inline_keyboard', [])]
+            if buttons or params.get('text', '').startswith('📊'):
+                self.chat(int(params['chat_id'])).put_nowait(buttons)
+        result = fake_api_result(endpoint, params, self._message_ids)
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post('/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# One examinee against the sharded deployment: every answer is timed from
+# the webhook POST until the next question reaches the fake Bot API. An
+# examinee whose next question does not arrive within `timeout` seconds
+# gives up, so a stuck deployment fails the run instead of hanging it.
+async def sharded_examinee(session, url, api, user_id, latencies, timeout):
+    async def post(payload):
+        async with session.post(url, json=payload) as response:
+            return response.status
+
+    keyboards = api.chat(user_id)
+    await post(message_payload(user_id, '/start'))
+    await post(message_payload(user_id, f'Examinee {user_id}'))
+    await post(callback_payload(user_id, bot.encode_callback(bot.CB_SUBJECT, 3)))
+    await post(message_payload(user_id, bot.MAIN_MENU[0][0][0]))
+    try:
+        buttons = await asyncio.wait_for(keyboards.get(), timeout)
+        while buttons:
+            answer = buttons[0]['callback_data']
+            if bot.decode_callback(answer)[0] != bot.CB_ANSWER:
+                return True
+            start = time.perf_counter()
+            while await post(callback_payload(user_id, answer)) == 503:
+                await asyncio.sleep(0.05)
+            buttons = await asyncio.wait_for(keyboards.get(), timeout)
+            latencies.append(time.perf_counter() - start)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+# End-to-end run of the sharded mode on this box: the bot runs as a
+# separate process tree (front plus --workers workers) against a fake Bot
+# API served from here, and simulated users talk to it through the webhook
+async def run_sharded(args):
+    workdir = tempfile.mkdtemp()
+    questions = os.path.join(workdir, 'questions.json')
+    with open(questions, 'w', encoding='utf-8') as f:
+        json.dump({bot.SUBJECTS[3]: [
+            {'question': f'प्रश्न {i}', 'options': ['अ', 'ब', 'क', 'ड'], 'correct_answer': i % 4}
+            for i in range(args.bank)
+        ]}, f, ensure_ascii=False)
+
+    api = FakeBotAPIServer()
+    api_port, webhook_port = free_port(), free_port()
+    await api.start(api_port)
+    env = dict(
+        os.environ,
+        POLICE_BOT_MODE='sharded',
+        POLICE_BOT_WORKERS=str(args.workers),
+        POLICE_BOT_DB=os.path.join(workdir, 'bot.db'),
+        POLICE_BOT_QUESTIONS=questions,
+        POLICE_BOT_API_URL=f'http://127.0.0.1:{api_port}',
+        POLICE_BOT_WEBHOOK_LISTEN='127.0.0.1',
+        POLICE_BOT_WEBHOOK_PORT=str(webhook_port),
+        POLICE_BOT_GLOBAL_RATE='1000000',
+        POLICE_BOT_CHAT_RATE='1000000',
+        POLICE_BOT_CONCURRENT_UPDATES='256',
+        POLICE_BOT_FEEDBACK_CORRECT='0',
+        POLICE_BOT_FEEDBACK_CELEBRATION='0',
+        POLICE_BOT_FEEDBACK_WRONG='0',
+    )
+    env.pop('POLICE_BOT_WEBHOOK_URL', None)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'srcpython.py')
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, script, env=env, cwd=workdir,
+        stdout=asyncio.subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'bot.log'), 'w')
+    )
+
+    base = f'http://127.0.0.1:{webhook_port}'
+    latencies = []
+    async with ClientSession() as session:
+        for _ in range(300):
+            try:
+                async with session.get(base + '/readyz') as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                pass
+            await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError(f"bot did not become ready, see {workdir}/bot.log")
+
+        started = time.perf_counter()
+        finished = await asyncio.gather(*(
+            sharded_examinee(session, base + bot.WEBHOOK_PATH, api, 10 ** 6 + n, latencies, args.timeout)
+            for n in range(args.users)
+        ))
+        elapsed = time.perf_counter() - started
+
+    process.send_signal(signal.SIGTERM)
+    await process.wait()
+    await api.stop()
+
+    with sqlite3.connect(env['POLICE_BOT_DB']) as conn:
+        results = conn.execute("SELECT COUNT(*) FROM user_progress").fetchone()[0]
+    return {
+        'workers': args.workers,
+        'users': args.users,
+        'questions_per_exam': bot.EXAM_QUESTION_COUNT,
+        'answers': len(latencies),
+        'duration_s': round(elapsed, 3),
+        'answers_per_s': round(len(latencies) / elapsed, 1),
+        'answer_to_next_question_ms': percentiles(latencies),
+        'results_stored': results,
+        'stalled_users': finished.count(False),
+        'bot_api_calls': api.calls,
+        'exit_code': process.returncode,
+    }
+
+def bench_sharded(args):
+    report = asyncio.run(run_sharded(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if report['stalled_users'] or report['results_stored'] != args.users or report['exit_code'] != 0:
+        sys.exit(1)
+
+# Reminder phrasings and the time each should resolve to, from a fixed
+# Saturday morning. Doubles as the parser's regression corpus.
+REMINDER_NOW = datetime(2026, 10, 17, 10, 30)
+REMINDER_CORPUS = [
+    ("उद्या सकाळी ९ वाजता अभ्यास सुरू करा", "2026-10-18 09:00"),
+    ("आज संध्याकाळी ६:३० वाजता सराव परीक्षा", "2026-10-17 18:30"),
+    ("आज सकाळी ९ वाजता", "2026-10-18 09:00"),
+    ("आज दुपारी", "2026-10-17 14:00"),
+    ("५ वाजता धावण्याचा सराव", "2026-10-17 17:00"),
+    ("९ वाजता", "2026-10-17 21:00"),
+    ("11 वाजता", "2026-10-17 11:00"),
+    ("साडे सात वाजता", "2026-10-17 19:30"),
+    ("सव्वा आठ वाजता", "2026-10-17 20:15"),
+    ("पावणे दहा वाजता", "2026-10-17 21:45"),
+    ("दीड वाजता", "2026-10-17 13:30"),
+    ("अडीच वाजता", "2026-10-17 14:30"),
+    ("९ वाजून १५ मिनिटांनी", "2026-10-17 21:15"),
+    ("सोमवारी दुपारी ३ वाजता", "2026-10-19 15:00"),
+    ("बुधवारी पहाटे ५ वाजता", "2026-10-21 05:00"),
+    ("शनिवारी सकाळी", "2026-10-24 09:00"),
+    ("रविवारी", "2026-10-18 09:00"),
+    ("२ तासांनी", "2026-10-17 12:30"),
+    ("एका तासाने पाणी प्या", "2026-10-17 11:30"),
+    ("३० मिनिटांनी", "2026-10-17 11:00"),
+    ("३ दिवसांनी", "2026-10-20 09:00"),
+    ("परवा", "2026-10-19 09:00"),
+    ("परवा रात्री १० वाजता", "2026-10-19 22:00"),
+    ("रात्री १२ वाजता", "2026-10-18 00:00"),
+    ("रात्री २ वाजता", "2026-10-18 02:00"),
+    ("पुढच्या आठवड्यात", "2026-10-24 09:00"),
+    ("उद्या 7.45", "2026-10-18 07:45"),
+    ("उद्या सकाळी ७:४५ ला व्यायाम", "2026-10-18 07:45"),
+    ("संध्याकाळी सात वाजता", "2026-10-17 19:00"),
+    ("अभ्यास करा", "2026-10-17 11:30"),
+    ("अभ्यास ५ प्रश्न", "2026-10-17 11:30"),
+]
+
+# Check the corpus, then time reminder parsing with a cold cache (every
+# message parsed from scratch) and warm (repeated phrasings)
+def bench_reminders(args):
+    failures = 0
+    for text, expected in REMINDER_CORPUS:
+        got = bot.parse_reminder_time(text, REMINDER_NOW).strftime('%Y-%m-%d %H:%M')
+        if got != expected:
+            failures += 1
+            print(f"MISMATCH {text!r}: got {got}, expected {expected}")
+    print(f"corpus       {len(REMINDER_CORPUS) - failures}/{len(REMINDER_CORPUS)} phrasings resolved as expected")
+
+    texts = [text for text, _ in REMINDER_CORPUS]
+
+    def cold(i):
+        spec = bot.parse_reminder_spec.__wrapped__(texts[i % len(texts)])
+        return bot.resolve_reminder_time(spec, REMINDER_NOW)
+
+    def warm(i):
+        return bot.parse_reminder_time(texts[i % len(texts)], REMINDER_NOW)
+
+    for name, func in (("cold", cold), ("cached", warm)):
+        per_call, _ = measure(func, args.calls)
+        print(f"{name:<12} {per_call:7.2f} us/message   {1e6 / per_call:10.0f} messages/s")
+    if failures:
+        sys.exit(1)
+
+# Cost of choosing the next practice question. A synthetic bank spread
+# over 20 topics, and one user who answers two questions out of three
+# right, 30 seconds apart, so reviews come due along the way.
+async def run_practice(args):
+    await asyncio.to_thread(bot.migrate_database)
+    subject = bot.SUBJECTS[3]
+    await bot.load_question_bank({subject: [
+        {'question': f'प्रश्न {i}', 'options': ['अ', 'ब', 'क', 'ड'],
+         'correct_answer': i % 4, 'difficulty': 1 + i % 3, 'topic': f'घटक {i % 20}'}
+        for i in range(args.bank)
+    ]})
+    await bot.question_difficulty.load()
+    topic_of = {
+        question_id: topic
+        for topic, ids in bot.question_store.topic_buckets(subject).items()
+        for question_id in ids
+    }
+
+    started = time.perf_counter()
+    bot.practice_engine.ladders(subject)
+    ladders = time.perf_counter() - started
+    started = time.perf_counter()
+    session = await bot.practice_engine.open(1, subject)
+    opened = time.perf_counter() - started
+
+    rng = random.Random(1)
+    now = time.time()
+    picks, reviews = [], 0
+    for _ in range(args.calls):
+        started = time.perf_counter()
+        question_id = session.next_question(now)
+        picks.append(time.perf_counter() - started)
+        if question_id is None:
+            break
+        reviews += question_id in session.boxes
+        session.record(question_id, topic_of[question_id], rng.random() < 2 / 3, now)
+        now += 30
+    return {
+        'bank': args.bank,
+        'ladders_ms': round(ladders * 1000, 3),
+        'open_ms': round(opened * 1000, 3),
+        'picks': len(picks),
+        'reviews': reviews,
+        'pick_ms': percentiles(picks),
+    }
+
+def bench_practice(args):
+    print(json.dumps(asyncio.run(run_practice(args)), indent=2))
+
+# Runs in a fresh interpreter: time the module import, the startup
+# pipeline up to serving updates, and the background content load
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import srcpython as bot
+imported = time.perf_counter() - started
+import asyncio
+from bench import FakeBotAPI
+
+async def main():
+    application = bot.build_application(request=FakeBotAPI())
+    await application.initialize()
+    started = time.perf_counter()
+    await application.post_init(application)
+    serving = time.perf_counter() - started
+    await bot.question_store.loaded.wait()
+    ready = time.perf_counter() - started
+    await application.post_stop(application)
+    await application.shutdown()
+    await application.post_shutdown(application)
+    return serving, ready
+
+serving, ready = asyncio.run(main())
+print(json.dumps({
+    'import_ms': round(imported * 1000, 1),
+    'serving_ms': round(serving * 1000, 1),
+    'content_ready_ms': round(ready * 1000, 1),
+    'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in bot.startup_timings.items()},
+}))
+"""
+
+# Cold start (empty database, no snapshot) and warm start (schema current,
+# snapshot in place) for a bank a tenth of --bank and one of --bank
+# questions, each in its own process
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for size in (max(args.bank // 10, 1), args.bank):
+        workdir = tempfile.mkdtemp()
+        questions = os.path.join(workdir, 'questions.json')
+        with open(questions, 'w', encoding='utf-8') as f:
+            json.dump({subject: [
+                {'question': f'{subject} प्रश्न {i}', 'options': ['अ', 'ब', 'क', 'ड'],
+                 'correct_answer': i % 4, 'difficulty': 1 + i % 3, 'topic': f'घटक {i % 20}'}
+                for i in range(size // len(bot.SUBJECTS))
+            ] for subject in bot.SUBJECTS}, f, ensure_ascii=False)
+        env = dict(os.environ, PYTHONPATH=here, POLICE_BOT_QUESTIONS=questions,
+                   POLICE_BOT_DB=os.path.join(workdir, 'bot.db'), POLICE_BOT_BROADCAST_TIME='')
+        runs = {}
+        for run in ('cold', 'warm'):
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP_PROBE], env=env, cwd=workdir,
+                capture_output=True, text=True, check=True
+            ).stdout
+            runs[run] = json.loads(output.strip().splitlines()[-1])
+        results[size] = runs
+    print(json.dumps(results, indent=2))
+
+# Start spike of a mock exam: every user joins and answers the first
+# question. Per-user exam state (own paper copy, answer bitmap and two
+# wheel timers each, as start_exam sets up) against one shared paper,
+# slots in a MockSessionTable and three wheel entries for the whole exam.
+def bench_mock(args):
+    paper = bot.array('I', range(args.questions))
+    deadline = time.time() + bot.EXAM_DURATION
+
+    def per_user():
+        wheel = bot.TimerWheel()
+        sessions = {}
+        for user_id in range(args.users):
+            sessions[user_id] = {
+                'question_ids': bot.array('q', paper),
+                'answers': bytearray((len(paper) + 7) // 8),
+                'exam_end_time': datetime.fromtimestamp(deadline),
+                'current_question': 1,
+                'score': 1,
+                'correct_streak': 1,
+                'total_questions': len(paper),
+            }
+            wheel.schedule((bot.EXAM_WARNING, user_id), deadline - bot.EXAM_WARNING_BEFORE, (user_id, user_id))
+            wheel.schedule((bot.EXAM_EXPIRY, user_id), deadline, (user_id, user_id))
+        return sessions, wheel
+
+    def shared():
+        wheel = bot.TimerWheel()
+        for key in (bot.MOCK_START, bot.MOCK_WARNING, bot.MOCK_EXPIRY):
+            wheel.schedule((key, 1), deadline, (1,))
+        table = bot.MockSessionTable(len(paper), args.users)
+        for user_id in range(args.users):
+            table.record(table.slot(user_id), True)
+        return table, wheel
+
+    results = {'users': args.users, 'questions': args.questions}
+    for name, func in (("per_user", per_user), ("shared", shared)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        state = func()
+        elapsed = time.perf_counter() - started
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            'ms': round(elapsed * 1000, 2),
+            'bytes_per_user': round(size / args.users),
+            'timers': len(state[1]),
+        }
+        del state
+    print(json.dumps(results, indent=2))
+
+# Grading a --questions answer sheet: parse the message and mark it in
+# one pass, against a per-question loop over the same sheet
+def bench_sheet(args):
+    rng = random.Random(1)
+    key = bytes(rng.randrange(4) for _ in range(args.questions))
+    text = " ".join(f"{i + 1}{'ABCD'[rng.randrange(4)]}" for i in range(args.questions))
+    sheet, _ = bot.parse_answer_sheet(text, args.questions)
+
+    def per_question(i):
+        score = 0
+        for position in range(len(sheet)):
+            if sheet[position] != bot.SHEET_BLANK and sheet[position] == key[position]:
+                score += 1
+        return score
+
+    for name, func in (
+        ("parse", lambda i: bot.parse_answer_sheet(text, args.questions)),
+        ("loop", per_question),
+        ("one pass", lambda i: bot.grade_sheet(sheet, key).count(1)),
+    ):
+        per_call, _ = measure(func, args.calls)
+        print(f"{name:<12} {per_call:7.2f} us/sheet")
+
+BENCHMARKS = {
+    'keyboards': bench_keyboards,
+    'dispatch': bench_dispatch,
+    'loadtest': bench_loadtest,
+    'sharded': bench_sharded,
+    'reminders': bench_reminders,
+    'practice': bench_practice,
+    'startup': bench_startup,
+    'mock': bench_mock,
+    'sheet': bench_sheet,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Police bot microbenchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--calls', type=int, default=10000)
+    parser.add_argument('--questions', type=int, default=100)
+    loadtest = parser.add_argument_group('loadtest')
+    loadtest.add_argument('--users', type=int, default=500, help="simulated examinees")
+    loadtest.add_argument('--ramp', type=float, default=1.0, help="seconds over which users arrive")
+    loadtest.add_argument('--think', type=float, default=0.02, help="seconds between answers")
+    loadtest.add_argument('--bank', type=int, default=2000, help="questions in the synthetic bank")
+    loadtest.add_argument('--sessions', type=int, default=200, help="open exams for the memory figure")
+    loadtest.add_argument('--api-latency', type=float, default=0.0, help="simulated Bot API round trip, ms")
+    loadtest.add_argument('--telegram-limits', action='store_true', help="keep the outbound rate limits")
+    loadtest.add_argument('--output', help="also write the JSON report to this file")
+    loadtest.add_argument('--workers', type=int, default=2, help="worker processes (sharded)")
+    loadtest.add_argument('--timeout', type=float, default=30.0,
+                          help="seconds to wait for a user's next question before giving up (sharded)")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,27 @@
 import asyncio
+import base64
+import bisect
+import functools
+import hashlib
+import heapq
+import hmac
+import itertools
 import sqlite3
 import json
 import logging
+import marshal
+import multiprocessing
+import operator
+import os
+import queue
 import re
+import signal
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 from typing import Dict, List, Tuple, Optional
 import random
@@ -22,21 +41,190 @@ from telegram.ext import (
     CallbackQueryHandler, 
     MessageHandler,
     filters,
-    JobQueue
+    JobQueue,
+    BaseUpdateProcessor
 )
 from telegram.constants import ParseMode
+from aiohttp import web
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.request import BaseRequest, HTTPXRequest
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Database setup
-def init_database():
-    conn = sqlite3.connect('maharashtra_police_bot.db')
-    cursor = conn.cursor()
-    
+# Enable logging; called by main() and shard workers, not on import
+def configure_logging():
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    )
+    # The timer wheel job runs every second; keep the scheduler from logging each run
+    logging.getLogger("apscheduler").setLevel(logging.WARNING)
+
+# Bot API token, only ever taken from the environment
+BOT_TOKEN = os.environ.get('POLICE_BOT_TOKEN')
+
+# Database file and connection tuning
+DB_PATH = os.environ.get('POLICE_BOT_DB', 'maharashtra_police_bot.db')
+DB_READERS = int(os.environ.get('POLICE_BOT_DB_READERS', '4'))
+
+# Write-behind flush thresholds; setting a journal path enables crash-safe mode.
+# After WRITE_BEHIND_ATTEMPTS failed flushes in a row, rows are written one
+# by one and those that still fail are dropped.
+WRITE_BEHIND_BATCH = int(os.environ.get('POLICE_BOT_WRITE_BATCH', '500'))
+WRITE_BEHIND_INTERVAL = float(os.environ.get('POLICE_BOT_WRITE_INTERVAL', '1.0'))
+WRITE_BEHIND_JOURNAL = os.environ.get('POLICE_BOT_WRITE_JOURNAL')
+WRITE_BEHIND_ATTEMPTS = int(os.environ.get('POLICE_BOT_WRITE_ATTEMPTS', '3'))
+
+# Question bank source and how many parsed questions to keep in memory
+QUESTIONS_PATH = os.environ.get('POLICE_BOT_QUESTIONS', 'questions.json')
+QUESTION_CACHE_SIZE = int(os.environ.get('POLICE_BOT_QUESTION_CACHE', '4096'))
+
+# Binary snapshot of the imported bank's ID lists, reused at startup while
+# the question file and the database's bank version are unchanged
+BANK_SNAPSHOT_PATH = os.environ.get('POLICE_BOT_BANK_SNAPSHOT', DB_PATH + '.bank')
+KEYBOARD_CACHE_SIZE = int(os.environ.get('POLICE_BOT_KEYBOARD_CACHE', '4096'))
+
+# Optional thoughts.json / news.json overrides, and how often to look for changes
+CONTENT_DIR = os.environ.get('POLICE_BOT_CONTENT_DIR', 'content')
+CONTENT_POLL_INTERVAL = float(os.environ.get('POLICE_BOT_CONTENT_POLL', '5'))
+
+# Exam paper shape: 100 questions in 60 minutes, mixed by difficulty (1 easy .. 3 hard)
+EXAM_QUESTION_COUNT = int(os.environ.get('POLICE_BOT_EXAM_QUESTIONS', '100'))
+EXAM_DURATION = int(os.environ.get('POLICE_BOT_EXAM_SECONDS', '3600'))
+EXAM_DIFFICULTY_MIX = {1: 0.3, 2: 0.5, 3: 0.2}
+# Questions a paper must take from given topics, per subject, as JSON:
+# {"<subject>": {"<topic>": count, ...}, ...}; the rest follows the mix
+EXAM_TOPIC_QUOTA = json.loads(os.environ.get('POLICE_BOT_TOPIC_QUOTA') or '{}')
+SEEN_CACHE_SIZE = int(os.environ.get('POLICE_BOT_SEEN_CACHE', '10000'))
+EXAM_WARNING_BEFORE = 600  # 10 minutes before end
+
+# Timer wheel resolution in seconds and number of slots
+TIMER_TICK = float(os.environ.get('POLICE_BOT_TIMER_TICK', '1'))
+TIMER_WHEEL_SLOTS = 512
+
+# Outbound Telegram limits: ~30 messages/s overall, ~1 message/s per chat
+OUTBOUND_GLOBAL_RATE = float(os.environ.get('POLICE_BOT_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.environ.get('POLICE_BOT_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = 3
+OUTBOUND_MAX_PENDING = int(os.environ.get('POLICE_BOT_OUTBOUND_MAX', '10000'))
+OUTBOUND_CONCURRENCY = 32
+
+# Weight of the latest exam in the rolling average, and leaderboard length
+STATS_AVERAGE_WEIGHT = 0.3
+LEADERBOARD_SIZE = 10
+
+# Practice mode: weight of the latest answer in a topic's mastery, the
+# spaced-repetition interval (seconds) of each review box, and how long a
+# topic's difficulty-ordered question list is used before it is re-sorted
+TOPIC_MASTERY_WEIGHT = 0.2
+REVIEW_INTERVALS = (600, 86400, 3 * 86400, 7 * 86400, 21 * 86400)
+PRACTICE_LADDER_TTL = int(os.environ.get('POLICE_BOT_PRACTICE_LADDER_TTL', '3600'))
+
+# Reminders due within this many seconds are kept on the timer wheel
+REMINDER_WINDOW = int(os.environ.get('POLICE_BOT_REMINDER_WINDOW', '300'))
+REMINDER_PARSE_CACHE = int(os.environ.get('POLICE_BOT_REMINDER_PARSE_CACHE', '4096'))
+
+# Daily thought and news push to every user ("HH:MM" local time, empty to
+# disable), and how many recipients are read and checkpointed at a time
+BROADCAST_TIME = os.environ.get('POLICE_BOT_BROADCAST_TIME', '07:00')
+BROADCAST_CHUNK = int(os.environ.get('POLICE_BOT_BROADCAST_CHUNK', '500'))
+
+# Scheduled mock exams for every user: start time ("HH:MM" local time,
+# empty to disable), days (0 = Sunday .. 6 = Saturday), and how many
+# seconds ahead of the start the shared paper is drawn
+MOCK_EXAM_TIME = os.environ.get('POLICE_BOT_MOCK_TIME', '10:00')
+MOCK_EXAM_DAYS = tuple(int(day) for day in os.environ.get('POLICE_BOT_MOCK_DAYS', '0').split(','))
+MOCK_EXAM_LEAD = int(os.environ.get('POLICE_BOT_MOCK_LEAD', '900'))
+
+# Updates processed in parallel (1 = sequential); per-chat order is kept either way
+CONCURRENT_UPDATES = int(os.environ.get('POLICE_BOT_CONCURRENT_UPDATES', '1'))
+
+# Bounded queue between update sources (polling or webhook) and the handlers
+UPDATE_QUEUE_SIZE = int(os.environ.get('POLICE_BOT_UPDATE_QUEUE', '1000'))
+
+# Serving mode: "polling", "webhook" or "sharded"; webhook settings apply to the
+# latter two. WEBHOOK_URL is the public base URL registered with Telegram, if any.
+BOT_MODE = os.environ.get('POLICE_BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.environ.get('POLICE_BOT_WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('POLICE_BOT_WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.environ.get('POLICE_BOT_WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.environ.get('POLICE_BOT_WEBHOOK_URL')
+WEBHOOK_SECRET = os.environ.get('POLICE_BOT_WEBHOOK_SECRET')
+
+# Sharded mode: worker processes behind the webhook front, and how many
+# updates may wait for each worker before the front answers 503
+SHARD_WORKERS = int(os.environ.get('POLICE_BOT_WORKERS', str(os.cpu_count() or 2)))
+SHARD_QUEUE_SIZE = int(os.environ.get('POLICE_BOT_WORKER_QUEUE', '1000'))
+
+# The users this process serves: user_id % SHARD_COUNT == SHARD_INDEX,
+# and whether it imports the question bank or only loads the versions the
+# sharded-mode front imported. Only sharded-mode workers change these.
+SHARD_INDEX, SHARD_COUNT = 0, 1
+BANK_IMPORTER = True
+
+# Bot API server to talk to instead of api.telegram.org (local Bot API
+# server, or a fake one for load tests)
+BOT_API_URL = os.environ.get('POLICE_BOT_API_URL')
+
+# Local metrics endpoint; metrics are off, and instrumentation a no-op, unless a port is set
+METRICS_LISTEN = os.environ.get('POLICE_BOT_METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('POLICE_BOT_METRICS_PORT', '0'))
+METRICS_ENABLED = METRICS_PORT > 0
+LOOP_LAG_INTERVAL = 0.5
+
+# How long answer feedback stays on screen before the next question
+FEEDBACK_DELAY_CORRECT = float(os.environ.get('POLICE_BOT_FEEDBACK_CORRECT', '1'))
+FEEDBACK_DELAY_CELEBRATION = float(os.environ.get('POLICE_BOT_FEEDBACK_CELEBRATION', '2'))
+FEEDBACK_DELAY_WRONG = float(os.environ.get('POLICE_BOT_FEEDBACK_WRONG', '2'))
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Open a connection with the bot's pragmas applied
+def open_connection(path=DB_PATH):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# Add a column to an existing table unless it is already there
+def add_column_if_missing(cursor, table, column, declaration):
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+# Leaderboard rows rebuilt from user_progress: each user's best percentage
+# per subject and week, achieved_at being when that best was first
+# scored. Old rows may lack a user, subject or score; those without a
+# user or subject are skipped and a missing score counts as 0. `moment` turns exam_date into an SQLite time value in UTC;
+# weeks and times come out in local time, as ISO weeks like week_key()
+# gives (the Thursday of a Monday-Sunday week fixes its year and number).
+def leaderboard_backfill(subject, moment):
+    thursday = f"date({moment}, 'localtime', '-3 days', 'weekday 4')"
+    week = f"strftime('%Y', {thursday}) || '-W' || printf('%02d', (strftime('%j', {thursday}) - 1) / 7 + 1)"
+    return f'''
+        SELECT {subject}, week, user_id, percentage, achieved_at FROM (
+            SELECT {subject}, {week} AS week, user_id,
+                   100.0 * COALESCE(score, 0) / total_questions AS percentage,
+                   datetime({moment}, 'localtime') AS achieved_at,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY {subject}, {week}, user_id
+                       ORDER BY 100.0 * COALESCE(score, 0) / total_questions DESC, exam_date
+                   ) AS position
+            FROM user_progress
+            WHERE total_questions > 0 AND user_id IS NOT NULL AND {subject} IS NOT NULL
+        ) WHERE position = 1
+    '''
+
+# Schema version 1: every table as it was before migrations were
+# versioned. Written to be safe on databases that already have some or
+# all of it.
+def migrate_baseline(cursor):
     # Create users table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -73,19 +261,1040 @@ def init_database():
     )
     ''')
     
-    conn.commit()
-    conn.close()
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_progress_user ON user_progress (user_id, subject, exam_date)"
+    )
+    
+    # Per-user per-subject aggregates, kept up to date on every result
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_subject_stats (
+        user_id INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        best_percentage REAL NOT NULL,
+        avg_percentage REAL NOT NULL,
+        last_attempt DATETIME NOT NULL,
+        PRIMARY KEY (user_id, subject)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Best result per user, subject and ISO week
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS leaderboard (
+        subject TEXT NOT NULL,
+        week TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        best_percentage REAL NOT NULL,
+        achieved_at DATETIME NOT NULL,
+        PRIMARY KEY (subject, week, user_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_leaderboard_rank "
+        "ON leaderboard (subject, week, best_percentage DESC, achieved_at)"
+    )
+    
+    # Build the aggregates once from results stored before they existed
+    if cursor.execute("SELECT 1 FROM user_subject_stats LIMIT 1").fetchone() is None:
+        cursor.execute('''
+        INSERT INTO user_subject_stats
+        SELECT user_id, subject, COUNT(*), MAX(100.0 * COALESCE(score, 0) / total_questions),
+               AVG(100.0 * COALESCE(score, 0) / total_questions), MAX(exam_date)
+        FROM user_progress
+        WHERE total_questions > 0 AND user_id IS NOT NULL AND subject IS NOT NULL
+        GROUP BY user_id, subject
+        ''')
+        cursor.execute("INSERT INTO leaderboard " + leaderboard_backfill('subject', 'exam_date'))
+    
+    # Delivery tracking for reminders (status: 0 pending, 1 sent, 2 failed)
+    add_column_if_missing(cursor, 'reminders', 'chat_id', 'INTEGER')
+    add_column_if_missing(cursor, 'reminders', 'status', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(cursor, 'reminders', 'sent_at', 'DATETIME')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (status, reminder_time)"
+    )
+    
+    # Question bank: immutable, content-addressed questions plus one
+    # ordered list of question IDs per subject for every bank version
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY,
+        content_hash TEXT NOT NULL UNIQUE,
+        subject TEXT NOT NULL,
+        question TEXT NOT NULL,
+        options TEXT NOT NULL,
+        correct_answer INTEGER NOT NULL,
+        difficulty INTEGER NOT NULL DEFAULT 2,
+        topic TEXT
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS question_banks (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        checksum TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS bank_questions (
+        version INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        PRIMARY KEY (version, subject, position)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Per-user bitmap over question IDs already served
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_seen (
+        user_id INTEGER PRIMARY KEY,
+        bitmap BLOB NOT NULL
+    )
+    ''')
+    
+    # One compact record per user for the exam in progress: question IDs
+    # (uint32 array), bitmap of correct answers, cursor and deadline
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exam_sessions (
+        user_id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        bank_version INTEGER,
+        question_ids BLOB NOT NULL,
+        answers BLOB NOT NULL,
+        cursor INTEGER NOT NULL,
+        deadline REAL NOT NULL,
+        active INTEGER NOT NULL DEFAULT 1
+    )
+    ''')
+    
+    # Every answer as one compact row. Append-only and unindexed, so the
+    # batched inserts stay cheap; reads go to the aggregates below.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS answer_events (
+        user_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        response_ms INTEGER NOT NULL,
+        answered_at INTEGER NOT NULL
+    )
+    ''')
+    
+    # Answer counts per question, for its difficulty estimate
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS question_stats (
+        question_id INTEGER PRIMARY KEY,
+        attempts INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        total_ms INTEGER NOT NULL
+    )
+    ''')
+    
+    # Mastery (moving average of correct answers) per user, subject and topic
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_topic_stats (
+        user_id INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        mastery REAL NOT NULL,
+        PRIMARY KEY (user_id, subject, topic)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Spaced-repetition schedule: review box and next due time (epoch
+    # seconds) of every question a user got wrong in practice or exams
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_reviews (
+        user_id INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        question_id INTEGER NOT NULL,
+        box INTEGER NOT NULL,
+        due REAL NOT NULL,
+        PRIMARY KEY (user_id, subject, question_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Broadcasts: one row per (kind, day, shard) with the last user_id
+    # done, and one delivery row per recipient. Users who blocked the bot
+    # get blocked_at and are skipped until they /start again.
+    add_column_if_missing(cursor, 'users', 'blocked_at', 'DATETIME')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        day TEXT NOT NULL,
+        shard INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        cursor INTEGER NOT NULL DEFAULT 0,
+        status INTEGER NOT NULL DEFAULT 0,
+        started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME,
+        UNIQUE (kind, day, shard)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+        broadcast_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        sent_at DATETIME NOT NULL,
+        PRIMARY KEY (broadcast_id, user_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Highest write-behind journal sequence already applied
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS write_behind_log (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_seq INTEGER NOT NULL
+    )
+    ''')
+
+# Table options for tables of integer-coded data. STRICT (SQLite 3.37+)
+# rejects a value of the wrong type instead of storing it.
+STRICT_TABLE = " STRICT" if sqlite3.sqlite_version_info >= (3, 37, 0) else ""
+STRICT_WITHOUT_ROWID = " WITHOUT ROWID" + ("," + STRICT_TABLE if STRICT_TABLE else "")
+
+# Integer ID of a subject name, used in SQL in place of a ? parameter
+SUBJECT_ID = "(SELECT id FROM subjects WHERE name = ?)"
+
+# Replace a table with a new definition, filled by a SELECT on the old one
+def rebuild_table(cursor, table, definition, select):
+    cursor.execute(f"CREATE TABLE {table}_new {definition}")
+    cursor.execute(f"INSERT INTO {table}_new {select}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+# Schema version 2: subjects become integer IDs from a lookup table and
+# gender an integer code; user_progress keeps epoch seconds with a
+# covering index for per-user range queries, and reminders get a
+# per-user index. The question bank tables keep subject names.
+def migrate_integer_keys(cursor):
+    cursor.execute(f"CREATE TABLE subjects (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE){STRICT_TABLE}")
+    cursor.executemany("INSERT OR IGNORE INTO subjects (name) VALUES (?)", [(name,) for name in SUBJECTS])
+    for table in ('questions', 'user_progress', 'user_subject_stats', 'leaderboard',
+                  'user_topic_stats', 'user_reviews'):
+        cursor.execute(
+            f"INSERT OR IGNORE INTO subjects (name) "
+            f"SELECT DISTINCT subject FROM {table} WHERE subject IS NOT NULL ORDER BY subject"
+        )
+    
+    rebuild_table(cursor, 'users', '''(
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        full_name TEXT,
+        gender INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        blocked_at DATETIME
+    )''', f'''
+        SELECT user_id, username, full_name,
+               CASE gender WHEN 'पुरुष' THEN {GENDER_MALE} WHEN 'स्त्री' THEN {GENDER_FEMALE}
+               ELSE {GENDER_OTHER} END,
+               created_at, blocked_at
+        FROM users
+    ''')
+    
+    rebuild_table(cursor, 'user_progress', f'''(
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        total_questions INTEGER NOT NULL,
+        exam_date INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    ){STRICT_TABLE}''', '''
+        SELECT p.id, p.user_id, s.id, COALESCE(p.score, 0), COALESCE(p.total_questions, 0),
+               COALESCE(CAST(strftime('%s', p.exam_date) AS INTEGER), 0)
+        FROM user_progress p JOIN subjects s ON s.name = p.subject
+        WHERE p.user_id IS NOT NULL
+    ''')
+    cursor.execute(
+        "CREATE INDEX idx_user_progress_user "
+        "ON user_progress (user_id, subject_id, exam_date, score, total_questions)"
+    )
+    
+    rebuild_table(cursor, 'user_subject_stats', f'''(
+        user_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL,
+        best_percentage REAL NOT NULL,
+        avg_percentage REAL NOT NULL,
+        last_attempt TEXT NOT NULL,
+        PRIMARY KEY (user_id, subject_id)
+    ){STRICT_WITHOUT_ROWID}''', '''
+        SELECT t.user_id, s.id, t.attempts, t.best_percentage, t.avg_percentage, t.last_attempt
+        FROM user_subject_stats t JOIN subjects s ON s.name = t.subject
+    ''')
+    
+    rebuild_table(cursor, 'leaderboard', f'''(
+        subject_id INTEGER NOT NULL,
+        week TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        best_percentage REAL NOT NULL,
+        achieved_at TEXT NOT NULL,
+        PRIMARY KEY (subject_id, week, user_id)
+    ){STRICT_WITHOUT_ROWID}''', '''
+        SELECT s.id, l.week, l.user_id, l.best_percentage, l.achieved_at
+        FROM leaderboard l JOIN subjects s ON s.name = l.subject
+    ''')
+    cursor.execute(
+        "CREATE INDEX idx_leaderboard_rank "
+        "ON leaderboard (subject_id, week, best_percentage DESC, achieved_at)"
+    )
+    
+    rebuild_table(cursor, 'user_topic_stats', f'''(
+        user_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        mastery REAL NOT NULL,
+        PRIMARY KEY (user_id, subject_id, topic)
+    ){STRICT_WITHOUT_ROWID}''', '''
+        SELECT t.user_id, s.id, t.topic, t.attempts, t.correct, t.mastery
+        FROM user_topic_stats t JOIN subjects s ON s.name = t.subject
+    ''')
+    
+    rebuild_table(cursor, 'user_reviews', f'''(
+        user_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        box INTEGER NOT NULL,
+        due REAL NOT NULL,
+        PRIMARY KEY (user_id, subject_id, question_id)
+    ){STRICT_WITHOUT_ROWID}''', '''
+        SELECT r.user_id, s.id, r.question_id, r.box, r.due
+        FROM user_reviews r JOIN subjects s ON s.name = r.subject
+    ''')
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user_id, status)")
+
+# Schema version 3: scheduled mock exams with their shared paper, the
+# state of every participant, and inline buttons on broadcasts
+def migrate_mock_exams(cursor):
+    cursor.execute(f'''
+    CREATE TABLE mock_exams (
+        id INTEGER PRIMARY KEY,
+        starts_at INTEGER NOT NULL UNIQUE,
+        ends_at INTEGER NOT NULL,
+        question_ids BLOB NOT NULL
+    ){STRICT_TABLE}
+    ''')
+    cursor.execute(f'''
+    CREATE TABLE mock_sessions (
+        mock_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        cursor INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        answers BLOB NOT NULL,
+        finished INTEGER NOT NULL,
+        PRIMARY KEY (mock_id, user_id)
+    ){STRICT_WITHOUT_ROWID}
+    ''')
+    add_column_if_missing(cursor, 'broadcasts', 'reply_markup', 'TEXT')
+    cursor.execute("INSERT OR IGNORE INTO subjects (name) VALUES (?)", (MOCK_EXAM_SUBJECT,))
+
+# Schema version 4: leaderboard weeks were keyed by strftime('%W') (not
+# ISO weeks), in UTC when backfilled and in local time when live, and
+# backfilled rows dated the first exam of the week rather than the best.
+# The table only holds what user_progress already has, so it is rebuilt.
+def migrate_leaderboard_weeks(cursor):
+    cursor.execute("DELETE FROM leaderboard")
+    cursor.execute("INSERT INTO leaderboard " + leaderboard_backfill('subject_id', "exam_date, 'unixepoch'"))
+
+# Schema migrations in order; migration N brings the schema to version N
+MIGRATIONS = (
+    migrate_baseline,
+    migrate_integer_keys,
+    migrate_mock_exams,
+    migrate_leaderboard_weeks,
+)
+
+# Bring the database schema up to date. The version reached is kept in
+# schema_version, and each migration commits together with its version
+# bump. The version is re-read under a write lock before every step, so
+# processes starting together apply each migration exactly once. An
+# up-to-date database costs one query.
+def migrate_database(path=DB_PATH):
+    conn = open_connection(path)
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+        )
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM schema_version WHERE id = 1").fetchone()
+            version = row[0] if row else 0
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                return version
+            migration = MIGRATIONS[version]
+            try:
+                migration(conn.cursor())
+                conn.execute(
+                    "INSERT OR REPLACE INTO schema_version (id, version) VALUES (1, ?)", (version + 1,)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logger.info("Applied schema migration %d (%s)", version + 1, migration.__name__)
+    finally:
+        conn.close()
+
+# Prometheus text-format metrics. A metric has at most one label, which is
+# all the bot needs, and is only updated from the event loop thread.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def _series_name(name, label, value, extra=''):
+    if label is None:
+        return f"{name}{{{extra}}}" if extra else name
+    pairs = f'{label}="{value}"' + (',' + extra if extra else '')
+    return f"{name}{{{pairs}}}"
+
+class Counter:
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._values = {}
+    
+    def inc(self, value=None, amount=1):
+        self._values[value] = self._values.get(value, 0) + amount
+    
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for value, count in self._values.items():
+            yield f"{_series_name(self.name, self.label, value)} {count}"
+
+class Histogram:
+    def __init__(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self._counts = {}
+        self._sums = {}
+    
+    def observe(self, value, seconds):
+        counts = self._counts.get(value)
+        if counts is None:
+            counts = self._counts[value] = [0] * (len(self.buckets) + 1)
+            self._sums[value] = 0.0
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self._sums[value] += seconds
+    
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for value, counts in self._counts.items():
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                bucket = _series_name(self.name + '_bucket', self.label, value, 'le="%s"' % bound)
+                yield f"{bucket} {total}"
+            yield f"{_series_name(self.name + '_sum', self.label, value)} {self._sums[value]}"
+            yield f"{_series_name(self.name + '_count', self.label, value)} {total}"
+
+# Value read at scrape time; `read` returns a number, or a dict of label
+# value to number when the gauge has a label
+class Gauge:
+    def __init__(self, name, help_text, read, label=None, kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.label = label
+        self.kind = kind
+    
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        values = self.read()
+        if self.label is None:
+            values = {None: values}
+        for value, number in values.items():
+            yield f"{_series_name(self.name, self.label, value)} {number}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+    
+    def counter(self, name, help_text, label=None):
+        metric = self._metrics[name] = Counter(name, help_text, label)
+        return metric
+    
+    def histogram(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        metric = self._metrics[name] = Histogram(name, help_text, label, buckets)
+        return metric
+    
+    # Registering a gauge again replaces the previous reader
+    def gauge(self, name, help_text, read, label=None, kind='gauge'):
+        metric = self._metrics[name] = Gauge(name, help_text, read, label, kind)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+HANDLER_SECONDS = metrics.histogram('policebot_handler_seconds', "Update handler latency", 'handler')
+JOB_SECONDS = metrics.histogram('policebot_job_seconds', "Job and timer callback run time", 'job')
+DB_SECONDS = metrics.histogram('policebot_db_seconds', "Database call latency including queueing", 'op')
+API_SECONDS = metrics.histogram('policebot_bot_api_seconds', "Bot API request latency", 'method')
+API_ERRORS = metrics.counter('policebot_bot_api_errors_total', "Bot API requests that failed", 'method')
+UPDATE_ERRORS = metrics.counter('policebot_update_errors_total', "Updates whose handler raised", 'error')
+LOOP_LAG = metrics.histogram('policebot_event_loop_lag_seconds', "How late the event loop ran a timed callback")
+
+# Record the run time of an async callable in `histogram`, labelled with
+# its name. With metrics disabled the function is returned as is.
+def timed(histogram, name=None):
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+        label = name or func.__name__
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# Apply (sql, rows) statements on one connection. A single row goes
+# through execute() so its lastrowid is known; returns the last
+# statement's (lastrowid, rowcount).
+def apply_statements(conn, batch):
+    cursor = None
+    for sql, rows in batch:
+        cursor = conn.execute(sql, rows[0]) if len(rows) == 1 else conn.executemany(sql, rows)
+    return (cursor.lastrowid, cursor.rowcount) if cursor is not None else (None, 0)
+
+# Errors that come from the row itself, so retrying it can never succeed
+ROW_ERRORS = (
+    sqlite3.IntegrityError, sqlite3.DataError, sqlite3.InterfaceError,
+    sqlite3.ProgrammingError, OverflowError
+)
+
+# apply_statements() with every row in its own savepoint: a row that fails
+# is rolled back alone and the rest still commit. Returns (statement
+# index, row, error) for each failed row.
+def apply_statements_isolated(conn, batch):
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    failed = []
+    for index, (sql, rows) in enumerate(batch):
+        for row in rows:
+            conn.execute("SAVEPOINT write_row")
+            try:
+                conn.execute(sql, row)
+            except ROW_ERRORS as e:
+                conn.execute("ROLLBACK TO write_row")
+                failed.append((index, row, str(e)))
+            conn.execute("RELEASE write_row")
+    return failed
+
+# Shared data-access layer. All writes go through a single writer thread,
+# reads through a small pool of reader threads, so handlers never block
+# the event loop on disk I/O. Every thread keeps its own WAL connection.
+class Database:
+    def __init__(self, path=DB_PATH, readers=DB_READERS):
+        self.path = path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # Shard workers send their writes to the front's writer instead
+        self.remote = None
+    
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = open_connection(self.path)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    async def _run(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        if not METRICS_ENABLED:
+            return await loop.run_in_executor(executor, fn, *args)
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            DB_SECONDS.observe(fn.__name__.lstrip('_'), time.perf_counter() - start)
+    
+    def _fetchone(self, sql, params):
+        return self._connection().execute(sql, params).fetchone()
+    
+    def _fetchall(self, sql, params):
+        return self._connection().execute(sql, params).fetchall()
+    
+    def _transaction(self, fn):
+        conn = self._connection()
+        try:
+            result = fn(conn)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+    
+    async def fetchone(self, sql, params=()):
+        return await self._run(self._readers, self._fetchone, sql, params)
+    
+    async def fetchall(self, sql, params=()):
+        return await self._run(self._readers, self._fetchall, sql, params)
+    
+    # Run fn(conn) on the writer thread inside a single transaction. A
+    # function cannot be sent to another process, so shard workers only
+    # have the statement-based writes below.
+    async def transaction(self, fn):
+        if self.remote is not None:
+            raise RuntimeError("transaction() is not available in a shard worker")
+        return await self._run(self._writer, self._transaction, fn)
+    
+    # Blocking transaction() for threads outside the event loop
+    def run_transaction(self, fn):
+        return self._writer.submit(self._transaction, fn).result()
+    
+    async def execute(self, sql, params=()):
+        if self.remote is not None:
+            lastrowid, _ = await self.remote.write([(sql, [params])])
+            return lastrowid
+        return await self.transaction(lambda conn: conn.execute(sql, params).lastrowid)
+    
+    # Run a list of (sql, rows) executemany calls as one transaction. With
+    # isolate, rows that fail are skipped and returned as
+    # apply_statements_isolated() does.
+    async def write_batch(self, batch, isolate=False):
+        if self.remote is not None:
+            result = await self.remote.write(batch, isolate)
+        else:
+            apply = apply_statements_isolated if isolate else apply_statements
+            result = await self.transaction(functools.partial(apply, batch=batch))
+        return result if isolate else None
+    
+    async def executemany(self, sql, rows):
+        if self.remote is not None:
+            _, rowcount = await self.remote.write([(sql, rows)])
+            return rowcount
+        return await self.transaction(lambda conn: conn.executemany(sql, rows).rowcount)
+    
+    async def get_user(self, user_id):
+        return await self.fetchone(
+            "SELECT user_id, username, full_name, gender FROM users WHERE user_id = ?",
+            (user_id,)
+        )
+    
+    async def add_reminder(self, user_id, chat_id, reminder_text, reminder_time):
+        return await self.execute(
+            "INSERT INTO reminders (user_id, chat_id, reminder_text, reminder_time) VALUES (?, ?, ?, ?)",
+            (user_id, chat_id, reminder_text, reminder_time.strftime('%Y-%m-%d %H:%M:%S'))
+        )
+    
+    # Stop the worker threads and close every connection
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+# BLOB values are journaled as {"$b": base64}
+def _journal_encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'$b': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"cannot journal {type(value).__name__}")
+
+def _journal_decode(obj):
+    if len(obj) == 1 and '$b' in obj:
+        return base64.b64decode(obj['$b'])
+    return obj
+
+# Write-behind buffer. Rows are grouped per stream and written in one
+# transaction when either the batch size or the flush interval is reached.
+# Keyed streams keep only the latest row per key until it is flushed.
+#
+# Crash-safe mode appends every row to a journal before it is buffered.
+# A killed process loses nothing; on power loss at most `max_delay`
+# seconds of rows are lost, because the journal is fsynced on every flush
+# cycle. Replay is idempotent thanks to the sequence number stored in
+# write_behind_log inside the same transaction as the rows.
+#
+# A failed flush is retried with the rows buffered since. Once
+# `max_attempts` flushes in a row have failed, the batch is written row by
+# row and rows that fail on their own are logged and dropped, so one bad
+# row cannot hold back every other write.
+class WriteBehindQueue:
+    def __init__(self, database, max_batch=WRITE_BEHIND_BATCH,
+                 max_delay=WRITE_BEHIND_INTERVAL, journal_path=WRITE_BEHIND_JOURNAL,
+                 max_attempts=WRITE_BEHIND_ATTEMPTS):
+        self.db = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.journal_path = journal_path
+        self.max_attempts = max_attempts
+        self._failures = 0
+        self._statements = {}
+        self._buffers = {}
+        self._inflight = {}
+        self._size = 0
+        self._seq = 0
+        self._journal_fd = None
+        self._journal_lines = []
+        self._journal_dirty = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = None
+        self.metrics = {'buffered': 0, 'coalesced': 0, 'written': 0, 'flushes': 0, 'dropped': 0}
+    
+    # Declare a stream; keyed streams coalesce rows by key, and rows of
+    # non-durable streams are never journaled
+    def register(self, stream, sql, keyed=False, durable=True):
+        self._statements[stream] = (sql, keyed, durable)
+        self._buffers[stream] = {} if keyed else []
+    
+    def add(self, stream, row, key=None):
+        if self._journal_fd is not None and self._statements[stream][2]:
+            self._seq += 1
+            line = (json.dumps(
+                [self._seq, stream, key, row], ensure_ascii=False, default=_journal_encode
+            ) + "\n").encode('utf-8')
+            os.write(self._journal_fd, line)
+            self._journal_lines.append(line)
+            self._journal_dirty = True
+        self._buffer(stream, row, key)
+    
+    def _buffer(self, stream, row, key):
+        buffer = self._buffers[stream]
+        self.metrics['buffered'] += 1
+        if self._statements[stream][1]:
+            if key in buffer:
+                self.metrics['coalesced'] += 1
+            buffer[key] = row
+        else:
+            buffer.append(row)
+        self._size += 1
+        if self._size >= self.max_batch:
+            self._wakeup.set()
+    
+    # Latest unflushed row for a key, if any
+    def pending(self, stream, key):
+        row = self._buffers[stream].get(key)
+        if row is None:
+            row = self._inflight.get(stream, {}).get(key)
+        return row
+    
+    # Every unflushed row of an unkeyed stream, oldest first
+    def pending_rows(self, stream):
+        return self._inflight.get(stream, []) + self._buffers[stream]
+    
+    async def start(self):
+        if self.journal_path:
+            await self.db.transaction(lambda conn: conn.execute("PRAGMA synchronous=FULL"))
+            await self._replay_journal()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+    
+    # Buffer the journal records newer than last_seq. They stay in the
+    # journal until the flush below has committed them: the journal is
+    # rewritten with just those records (dropping a torn final line) and
+    # swapped in atomically, so a failed flush or a crash right after
+    # startup replays them again on the next start.
+    async def _replay_journal(self):
+        row = await self.db.fetchone("SELECT last_seq FROM write_behind_log WHERE id = 1")
+        self._seq = row[0] if row else 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        seq, stream, key, values = json.loads(line, object_hook=_journal_decode)
+                    except ValueError:
+                        # Torn final line from a crash mid-write
+                        continue
+                    if seq <= self._seq or stream not in self._statements:
+                        continue
+                    self._seq = seq
+                    self._buffer(stream, values, key)
+                    self._journal_lines.append(line if line.endswith(b"\n") else line + b"\n")
+        temporary = f"{self.journal_path}.tmp"
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        for line in self._journal_lines:
+            os.write(fd, line)
+        os.fsync(fd)
+        os.replace(temporary, self.journal_path)
+        self._journal_fd = fd
+        if self._journal_lines:
+            logger.info("Replaying %d write-behind journal records", len(self._journal_lines))
+            await self.flush()
+    
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if self._journal_dirty:
+                    self._journal_dirty = False
+                    await asyncio.to_thread(os.fsync, self._journal_fd)
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed, will retry")
+    
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._size:
+                return
+            batch = self._buffers
+            self._buffers = {
+                stream: {} if keyed else [] for stream, (sql, keyed, durable) in self._statements.items()
+            }
+            self._inflight = batch
+            size, self._size = self._size, 0
+            lines, self._journal_lines = self._journal_lines, []
+            streams = [stream for stream, rows in batch.items() if rows]
+            writes = [
+                (self._statements[stream][0], list(rows.values() if isinstance(rows, dict) else rows))
+                for stream, rows in batch.items() if rows
+            ]
+            if self._journal_fd is not None:
+                streams.append('write_behind_log')
+                writes.append((
+                    "INSERT OR REPLACE INTO write_behind_log (id, last_seq) VALUES (1, ?)",
+                    [(self._seq,)]
+                ))
+            
+            failed = ()
+            try:
+                if self._failures >= self.max_attempts:
+                    failed = await self.db.write_batch(writes, isolate=True)
+                else:
+                    await self.db.write_batch(writes)
+            except Exception:
+                self._failures += 1
+                # Put the batch back in front of anything buffered meanwhile
+                for stream, rows in batch.items():
+                    newer = self._buffers[stream]
+                    if isinstance(rows, dict):
+                        rows.update(newer)
+                    else:
+                        rows.extend(newer)
+                    self._buffers[stream] = rows
+                self._size += size
+                self._journal_lines = lines + self._journal_lines
+                raise
+            finally:
+                self._inflight = {}
+            self._failures = 0
+            for index, row, error in failed:
+                logger.error("Dropped write-behind row %r of %s: %s", row, streams[index], error)
+            self.metrics['dropped'] += len(failed)
+            self.metrics['written'] += sum(len(rows) for rows in batch.values()) - len(failed)
+            self.metrics['flushes'] += 1
+            
+            # Everything up to last_seq is durable, keep only newer journal lines
+            if self._journal_fd is not None:
+                os.ftruncate(self._journal_fd, 0)
+                os.lseek(self._journal_fd, 0, os.SEEK_SET)
+                for line in self._journal_lines:
+                    os.write(self._journal_fd, line)
+                await asyncio.to_thread(os.fsync, self._journal_fd)
+    
+    # Stop the flush loop and write out everything still buffered. The loop
+    # is asked to finish rather than cancelled, so no batch is cut in half.
+    async def stop(self):
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._journal_fd is not None:
+            os.fsync(self._journal_fd)
+            os.close(self._journal_fd)
+            self._journal_fd = None
+
+# Shared database handle; no connection is opened until first use
+db = Database()
+write_behind = WriteBehindQueue(db)
+metrics.gauge('policebot_write_behind_events_total', "Write-behind counters",
+              lambda: write_behind.metrics, label='event', kind='counter')
+write_behind.register(
+    'users',
+    "INSERT OR IGNORE INTO users (user_id, username, full_name, gender) VALUES (?, ?, ?, ?)",
+    keyed=True
+)
+write_behind.register(
+    'user_progress',
+    f"INSERT INTO user_progress (user_id, subject_id, score, total_questions) VALUES (?, {SUBJECT_ID}, ?, ?)"
+)
+# Latest state of each user's exam; every answer replaces the pending row
+write_behind.register(
+    'exam_sessions',
+    "INSERT OR REPLACE INTO exam_sessions "
+    "(user_id, chat_id, subject, bank_version, question_ids, answers, cursor, deadline, active) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    keyed=True
+)
+
+# Aggregates are upserted in the same flush transaction as the result rows
+write_behind.register(
+    'user_subject_stats',
+    "INSERT INTO user_subject_stats "
+    "(user_id, subject_id, attempts, best_percentage, avg_percentage, last_attempt) "
+    "VALUES (?, {subject}, 1, ?, ?, ?) "
+    "ON CONFLICT (user_id, subject_id) DO UPDATE SET "
+    "attempts = attempts + 1, "
+    "best_percentage = MAX(best_percentage, excluded.best_percentage), "
+    "avg_percentage = avg_percentage + {weight} * (excluded.avg_percentage - avg_percentage), "
+    "last_attempt = excluded.last_attempt".format(subject=SUBJECT_ID, weight=STATS_AVERAGE_WEIGHT)
+)
+write_behind.register(
+    'leaderboard',
+    "INSERT INTO leaderboard (subject_id, week, user_id, best_percentage, achieved_at) "
+    f"VALUES ({SUBJECT_ID}, ?, ?, ?, ?) "
+    "ON CONFLICT (subject_id, week, user_id) DO UPDATE SET "
+    "achieved_at = CASE WHEN excluded.best_percentage > best_percentage "
+    "THEN excluded.achieved_at ELSE achieved_at END, "
+    "best_percentage = MAX(best_percentage, excluded.best_percentage)"
+)
+
+# Leaderboard week of a local date or time: its ISO week, e.g. 2026-W42,
+# matching leaderboard_backfill()
+def week_key(day):
+    return day.strftime('%G-W%V')
+
+# Weekly leaderboards held as sorted score lists, so a user's rank is a
+# binary search instead of a count over the table. Each (subject, week)
+# board is loaded once from the leaderboard index, then kept current as
+# results come in.
+class LeaderboardCache:
+    def __init__(self, database, write_behind):
+        self.db = database
+        self.write_behind = write_behind
+        self._boards = {}
+        self._tasks = set()
+    
+    # Boards are stored as their loading task, so callers that arrive while
+    # a board is loading wait for the same load instead of each replacing
+    # the board with their own copy
+    async def _board(self, subject, week):
+        key = (subject, week)
+        loading = self._boards.get(key)
+        if loading is None:
+            loading = self._boards[key] = asyncio.ensure_future(self._load(subject, week))
+        try:
+            return await asyncio.shield(loading)
+        except Exception:
+            # Let the next caller try again
+            if self._boards.get(key) is loading:
+                del self._boards[key]
+            raise
+    
+    # Committed results plus those still in the write-behind buffer. The
+    # buffer is read first: rows flushed during the query are then seen
+    # either way, and rows added later arrive through record().
+    async def _load(self, subject, week):
+        pending = [
+            (row[2], row[3]) for row in self.write_behind.pending_rows('leaderboard')
+            if row[0] == subject and row[1] == week
+        ]
+        rows = await self.db.fetchall(
+            f"SELECT user_id, best_percentage FROM leaderboard WHERE subject_id = {SUBJECT_ID} AND week = ?",
+            (subject, week)
+        )
+        best = dict(rows)
+        for user_id, percentage in pending:
+            if percentage > best.get(user_id, -1):
+                best[user_id] = percentage
+        return sorted(-percentage for percentage in best.values()), best
+    
+    async def record(self, subject, week, user_id, percentage):
+        scores, best = await self._board(subject, week)
+        previous = best.get(user_id)
+        if previous is not None:
+            if percentage <= previous:
+                return
+            del scores[bisect.bisect_left(scores, -previous)]
+        best[user_id] = percentage
+        bisect.insort(scores, -percentage)
+    
+    # record() in the background, since the board may need loading first
+    def add(self, subject, week, user_id, percentage):
+        task = asyncio.create_task(self.record(subject, week, user_id, percentage))
+        self._tasks.add(task)
+        task.add_done_callback(self._recorded)
+    
+    def _recorded(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Leaderboard update failed", exc_info=task.exception())
+    
+    # Wait for board updates still in flight; call before the database closes
+    async def stop(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    # 1-based rank of the user's best score, or None if they have no result
+    async def rank(self, subject, week, user_id):
+        scores, best = await self._board(subject, week)
+        if user_id not in best:
+            return None
+        return bisect.bisect_left(scores, -best[user_id]) + 1, len(scores)
+    
+    async def top(self, subject, week, limit=LEADERBOARD_SIZE):
+        return await self.db.fetchall(
+            "SELECT COALESCE(u.full_name, l.user_id), l.best_percentage FROM leaderboard l "
+            "LEFT JOIN users u ON u.user_id = l.user_id "
+            f"WHERE l.subject_id = {SUBJECT_ID} AND l.week = ? "
+            "ORDER BY l.best_percentage DESC, l.achieved_at LIMIT ?",
+            (subject, week, limit)
+        )
+
+leaderboards = LeaderboardCache(db, write_behind)
+
+# Store an exam result together with its aggregate and leaderboard updates
+def record_exam_result(user_id, subject, score, total_questions):
+    now = datetime.now()
+    percentage = 100.0 * score / total_questions
+    timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    write_behind.add('user_progress', [user_id, subject, score, total_questions])
+    write_behind.add('user_subject_stats', [user_id, subject, percentage, percentage, timestamp])
+    week = week_key(now)
+    write_behind.add('leaderboard', [subject, week, user_id, percentage, timestamp])
+    leaderboards.add(subject, week, user_id, percentage)
 
-# Initialize database
-init_database()
+# Look up a user, including registrations that are still buffered
+async def get_registered_user(user_id):
+    pending = write_behind.pending('users', user_id)
+    if pending is not None:
+        return tuple(pending)
+    return await db.get_user(user_id)
 
 # Define states for conversation
-SELECTING_SUBJECT, EXAM_IN_PROGRESS, SETTING_REMINDER = range(3)
+SELECTING_SUBJECT, EXAM_IN_PROGRESS, SETTING_REMINDER, SUBMITTING_SHEET = range(4)
 
 # Load questions from JSON file (you'll need to create this)
 def load_questions():
     try:
-        with open('questions.json', 'r', encoding='utf-8') as f:
+        with open(QUESTIONS_PATH, 'r', encoding='utf-8') as f:
             return json.load(f)
     except FileNotFoundError:
         # Sample questions if file doesn't exist
@@ -134,110 +1343,1343 @@ def load_questions():
             ]
         }
 
-# Load questions
-questions_data = load_questions()
-
-# Load daily thoughts
-daily_thoughts = [
-    {
-        "thought": "जिंकण्याची इच्छा असलेल्या माणसाला कोणीही पराभूत करू शकत नाही.",
-        "author": "छत्रपती शिवाजी महाराज"
-    },
-    {
-        "thought": "शिक्षण हे समाजाचे आधारस्तंभ आहेत आणि ते समाजातील प्रत्येक व्यक्तीपर्यंत पोहोचले पाहिजे.",
-        "author": "डॉ. बाबासाहेब आंबेडकर"
-    },
-    {
-        "thought": "स्वातंत्र्य हा आपला जन्मसिद्ध हक्क आहे आणि आपण तो मिळवणारच.",
-        "author": "लोकमान्य टिळक"
-    },
-    {
-        "thought": "कष्टाचे फळ गोड असते, ते मिळवण्यासाठी कष्ट करणे आवश्यक आहे.",
-        "author": "लालबहादूर शास्त्री"
-    }
-]
-
-# News updates (would typically come from an API)
-news_updates = [
-    "महाराष्ट्र पोलिस भरती २०२३: ५००० जागांसाठी अधिसूचना जारी",
-    "पोलिस भरती परीक्षेच्या तयारीसाठी मार्गदर्शक कार्यशाळा आयोजित",
-    "महाराष्ट्र सरकारमध्ये नवीन पोलिस भरती प्रक्रिया सुरू",
-    "पोलिस भरतीसाठी ऑनलाइन अर्ज प्रक्रिया सुरू"
-]
-
-# Gender detection based on name endings (basic estimation for Marathi names)
-def detect_gender(name):
-    name = name.lower().strip()
-    female_endings = ['ा', 'ी', 'ीत', 'िन', 'िया', 'ना', 'ता', 'ला', 'मा', 'वी']
-    male_endings = ['े', 'य', 'क', 'र', 'स', 'त', 'न', 'प', 'ज', 'व']
+# Question store. Questions live in SQLite and are fetched lazily by ID
+# through a bounded LRU cache; only the ID lists of the current bank
+# version are kept in memory. Question rows are content-addressed and
+# never modified, so an exam holding IDs from an older bank version keeps
+# seeing exactly the questions it started with.
+class QuestionStore:
+    def __init__(self, database, cache_size=QUESTION_CACHE_SIZE):
+        self.db = database
+        self.cache_size = cache_size
+        self.version = None
+        self._subject_ids = {}
+        self._by_difficulty = {}
+        self._by_topic = {}
+        self._cache = OrderedDict()
+        self.loaded = asyncio.Event()
     
-    for ending in female_endings:
-        if name.endswith(ending):
-            return "स्त्री"
+    @staticmethod
+    def _content_hash(subject, item):
+        payload = json.dumps(
+            [subject, item['question'], item['options'], item['correct_answer'],
+             item.get('difficulty', 2), item.get('topic')],
+            ensure_ascii=False
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
     
-    for ending in male_endings:
-        if name.endswith(ending):
-            return "पुरुष"
+    # Store a parsed bank as a new version unless it is unchanged
+    async def import_bank(self, data):
+        checksum = hashlib.sha1(
+            json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        
+        def apply(conn):
+            row = conn.execute(
+                "SELECT version, checksum FROM question_banks ORDER BY version DESC LIMIT 1"
+            ).fetchone()
+            if row and row[1] == checksum:
+                return row[0]
+            version = conn.execute(
+                "INSERT INTO question_banks (checksum) VALUES (?)", (checksum,)
+            ).lastrowid
+            for subject, items in data.items():
+                conn.execute("INSERT OR IGNORE INTO subjects (name) VALUES (?)", (subject,))
+                for position, item in enumerate(items):
+                    content_hash = self._content_hash(subject, item)
+                    conn.execute(
+                        "INSERT OR IGNORE INTO questions "
+                        "(content_hash, subject, question, options, correct_answer, difficulty, topic) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (content_hash, subject, item['question'],
+                         json.dumps(item['options'], ensure_ascii=False),
+                         item['correct_answer'], item.get('difficulty', 2), item.get('topic'))
+                    )
+                    conn.execute(
+                        "INSERT INTO bank_questions (version, subject, position, question_id) "
+                        "SELECT ?, ?, ?, id FROM questions WHERE content_hash = ?",
+                        (version, subject, position, content_hash)
+                    )
+            return version
+        
+        return await self.db.transaction(apply)
     
-    return "अन्य"
-
-# Main menu keyboard
-def main_menu_keyboard():
-    keyboard = [
-        ["📝 परीक्षा सुरू करा", "📘 विषय निवडा"],
-        ["💡 दैनंदिन विचार", "📰 बातम्या"],
-        ["⏰ रिमाइंडर सेट करा", "🕒 वेळ आणि तारीख"]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-# Subject selection keyboard
+    # Make a bank version (the latest by default) current for new exams
+    async def load_version(self, version=None):
+        if version is None:
+            row = await self.db.fetchone("SELECT MAX(version) FROM question_banks")
+            version = row[0]
+        rows = await self.db.fetchall(
+            "SELECT b.subject, b.question_id, q.difficulty, q.topic "
+            "FROM bank_questions b JOIN questions q ON q.id = b.question_id "
+            "WHERE b.version = ? ORDER BY b.subject, b.position",
+            (version,)
+        )
+        subject_ids, by_difficulty, by_topic = {}, {}, {}
+        for subject, question_id, difficulty, topic in rows:
+            subject_ids.setdefault(subject, array('q')).append(question_id)
+            by_difficulty.setdefault(subject, {}).setdefault(difficulty, array('q')).append(question_id)
+            if topic:
+                by_topic.setdefault(subject, {}).setdefault(topic, array('q')).append(question_id)
+        self._subject_ids, self._by_difficulty, self._by_topic = subject_ids, by_difficulty, by_topic
+        self.version = version
+        return version
+    
+    # The current version's ID lists as plain bytes, for the startup snapshot
+    def snapshot(self):
+        return {
+            'version': self.version,
+            'subjects': {subject: ids.tobytes() for subject, ids in self._subject_ids.items()},
+            'difficulty': {
+                subject: {difficulty: ids.tobytes() for difficulty, ids in buckets.items()}
+                for subject, buckets in self._by_difficulty.items()
+            },
+            'topics': {
+                subject: {topic: ids.tobytes() for topic, ids in buckets.items()}
+                for subject, buckets in self._by_topic.items()
+            },
+        }
+    
+    # Make a snapshot's version current without querying the bank tables
+    def install(self, snapshot):
+        def ids(raw):
+            question_ids = array('q')
+            question_ids.frombytes(raw)
+            return question_ids
+        self._subject_ids = {subject: ids(raw) for subject, raw in snapshot['subjects'].items()}
+        self._by_difficulty = {
+            subject: {difficulty: ids(raw) for difficulty, raw in buckets.items()}
+            for subject, buckets in snapshot['difficulty'].items()
+        }
+        self._by_topic = {
+            subject: {topic: ids(raw) for topic, raw in buckets.items()}
+            for subject, buckets in snapshot['topics'].items()
+        }
+        self.version = snapshot['version']
+    
+    # Shared, read-only ID list for a subject in the current version
+    def question_ids(self, subject):
+        return self._subject_ids.get(subject)
+    
+    # ID lists of the current version grouped by difficulty and by topic
+    def difficulty_buckets(self, subject):
+        return self._by_difficulty.get(subject, {})
+    
+    def topic_buckets(self, subject):
+        return self._by_topic.get(subject, {})
+    
+    def subjects(self):
+        return list(self._subject_ids)
+    
+    def _remember(self, row):
+        question = {
+            'id': row[0],
+            'subject': row[1],
+            'question': row[2],
+            'options': json.loads(row[3]),
+            'correct_answer': row[4],
+            'difficulty': row[5],
+            'topic': row[6],
+        }
+        self._cache[question['id']] = question
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return question
+    
+    async def get(self, question_id):
+        question = self._cache.get(question_id)
+        if question is not None:
+            self._cache.move_to_end(question_id)
+            return question
+        row = await self.db.fetchone(
+            "SELECT id, subject, question, options, correct_answer, difficulty, topic "
+            "FROM questions WHERE id = ?",
+            (question_id,)
+        )
+        if row is None:
+            return None
+        return self._remember(row)
+    
+    # A whole paper in order, with every cache miss fetched in one query
+    async def get_many(self, question_ids):
+        found = {}
+        for question_id in question_ids:
+            question = self._cache.get(question_id)
+            if question is not None:
+                self._cache.move_to_end(question_id)
+                found[question_id] = question
+        missing = [question_id for question_id in set(question_ids) if question_id not in found]
+        if missing:
+            rows = await self.db.fetchall(
+                "SELECT id, subject, question, options, correct_answer, difficulty, topic "
+                f"FROM questions WHERE id IN ({','.join('?' * len(missing))})",
+                missing
+            )
+            for row in rows:
+                found[row[0]] = self._remember(row)
+        return [found.get(question_id) for question_id in question_ids]
+    
+    # Load the newest version if another process imported one since
+    async def follow(self):
+        row = await self.db.fetchone("SELECT MAX(version) FROM question_banks")
+        if row[0] is None or row[0] == self.version:
+            return None
+        return await self.load_version(row[0])
+    
+    # Drop ID lists of old versions; question rows themselves are kept
+    async def prune(self, keep=2):
+        await self.db.execute(
+            "DELETE FROM bank_questions WHERE version <= "
+            "(SELECT MAX(version) FROM question_banks) - ?",
+            (keep,)
+        )
+
+question_store = QuestionStore(db)
+
+# Which questions each user has already been served, one bit per question
+# ID. Bitmaps are cached in memory and persisted through the write-behind
+# queue; losing a few updates only means a question may repeat.
+class SeenHistory:
+    def __init__(self, database, queue, cache_size=SEEN_CACHE_SIZE):
+        self.db = database
+        self.queue = queue
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+    
+    async def get(self, user_id):
+        bitmap = self._cache.get(user_id)
+        if bitmap is not None:
+            self._cache.move_to_end(user_id)
+            return bitmap
+        row = await self.db.fetchone("SELECT bitmap FROM user_seen WHERE user_id = ?", (user_id,))
+        bitmap = bytearray(row[0]) if row else bytearray()
+        self._cache[user_id] = bitmap
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return bitmap
+    
+    @staticmethod
+    def is_seen(bitmap, question_id):
+        byte = question_id >> 3
+        return byte < len(bitmap) and bitmap[byte] & (1 << (question_id & 7))
+    
+    @staticmethod
+    def mark(bitmap, question_ids, seen=True):
+        for question_id in question_ids:
+            byte = question_id >> 3
+            if byte >= len(bitmap):
+                if not seen:
+                    continue
+                bitmap.extend(bytes(byte + 1 - len(bitmap)))
+            if seen:
+                bitmap[byte] |= 1 << (question_id & 7)
+            else:
+                bitmap[byte] &= ~(1 << (question_id & 7)) & 0xFF
+    
+    def save(self, user_id, bitmap):
+        self.queue.add('user_seen', [user_id, bytes(bitmap)], key=user_id)
+
+write_behind.register(
+    'user_seen',
+    "INSERT OR REPLACE INTO user_seen (user_id, bitmap) VALUES (?, ?)",
+    keyed=True,
+    durable=False
+)
+seen_history = SeenHistory(db, write_behind)
+
+# Exam paper generator. Draws k questions by rejection sampling random
+# positions, so the cost is O(k) regardless of bank size while the user's
+# history is sparse. Once a pool is nearly exhausted its bits are cleared
+# and the user starts a fresh cycle through it.
+class PaperBuilder:
+    def __init__(self, store, history, rng=None):
+        self.store = store
+        self.history = history
+        self.rng = rng or random.Random()
+    
+    def _sample(self, ids, count, seen, taken):
+        rng = self.rng
+        picked = []
+        tried = set()
+        attempts = 4 * count + 32
+        while len(picked) < count and attempts and len(tried) < len(ids):
+            attempts -= 1
+            position = rng.randrange(len(ids))
+            if position in tried:
+                continue
+            tried.add(position)
+            question_id = ids[position]
+            if question_id not in taken and not SeenHistory.is_seen(seen, question_id):
+                picked.append(question_id)
+                taken.add(question_id)
+        if len(picked) < count:
+            # History is dense in this pool: scan what is left
+            rest = [
+                question_id for question_id in ids
+                if question_id not in taken and not SeenHistory.is_seen(seen, question_id)
+            ]
+            if len(rest) < count - len(picked):
+                SeenHistory.mark(seen, ids, seen=False)
+                rest = [question_id for question_id in ids if question_id not in taken]
+            extra = rng.sample(rest, min(count - len(picked), len(rest)))
+            picked.extend(extra)
+            taken.update(extra)
+        return picked
+    
+    # Split k over the difficulty mix by largest remainder
+    @staticmethod
+    def _allocate(k, mix, available):
+        total = sum(mix.get(d, 0) for d in available) or 1
+        shares = {d: k * mix.get(d, 0) / total for d in available}
+        counts = {d: min(int(share), available[d]) for d, share in shares.items()}
+        for d in sorted(shares, key=lambda d: shares[d] - int(shares[d]), reverse=True):
+            if sum(counts.values()) >= k:
+                break
+            if counts[d] < available[d]:
+                counts[d] += 1
+        return counts
+    
+    async def build(self, user_id, subject, k=EXAM_QUESTION_COUNT,
+                    difficulty_mix=EXAM_DIFFICULTY_MIX, topic_quotas=EXAM_TOPIC_QUOTA):
+        all_ids = self.store.question_ids(subject)
+        if not all_ids:
+            return None
+        k = min(k, len(all_ids))
+        seen = await self.history.get(user_id)
+        taken = set()
+        paper = []
+        
+        # Topic quotas first, then fill the rest by difficulty
+        for topic, count in topic_quotas.get(subject, {}).items():
+            ids = self.store.topic_buckets(subject).get(topic)
+            if ids:
+                paper.extend(self._sample(ids, min(count, k - len(paper)), seen, taken))
+        
+        buckets = self.store.difficulty_buckets(subject)
+        counts = self._allocate(k - len(paper), difficulty_mix, {d: len(ids) for d, ids in buckets.items()})
+        for difficulty, count in counts.items():
+            if count:
+                paper.extend(self._sample(buckets[difficulty], count, seen, taken))
+        
+        # Difficulties without mix weight may still be needed to reach k
+        if len(paper) < k:
+            paper.extend(self._sample(all_ids, k - len(paper), seen, taken))
+        
+        self.rng.shuffle(paper)
+        SeenHistory.mark(seen, paper)
+        self.history.save(user_id, seen)
+        return array('q', paper)
+    
+    # One paper for everyone, like the real recruitment paper: k questions
+    # split evenly over the subjects, one section per subject, each mixed
+    # by difficulty. Nobody's history is read or changed.
+    def build_shared(self, k=EXAM_QUESTION_COUNT, difficulty_mix=EXAM_DIFFICULTY_MIX):
+        available = {
+            subject: len(self.store.question_ids(subject))
+            for subject in self.store.subjects() if self.store.question_ids(subject)
+        }
+        if not available:
+            return None
+        seen, taken = bytearray(), set()
+        paper = []
+        for subject, count in self._allocate(k, dict.fromkeys(available, 1), available).items():
+            if not count:
+                continue
+            buckets = self.store.difficulty_buckets(subject)
+            counts = self._allocate(count, difficulty_mix, {d: len(ids) for d, ids in buckets.items()})
+            section = []
+            for difficulty, part in counts.items():
+                if part:
+                    section.extend(self._sample(buckets[difficulty], part, seen, taken))
+            if len(section) < count:
+                section.extend(self._sample(self.store.question_ids(subject), count - len(section), seen, taken))
+            self.rng.shuffle(section)
+            paper.extend(section)
+        return array('q', paper)
+
+paper_builder = PaperBuilder(question_store, seen_history)
+
+# Per-answer events and the aggregates kept from them. Events are
+# appended in the write-behind batches, and per-question counts and
+# per-user topic mastery are upserted in the same flush, so nothing has
+# to read the event log back.
+write_behind.register(
+    'answer_events',
+    "INSERT INTO answer_events (user_id, question_id, correct, response_ms, answered_at) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+write_behind.register(
+    'question_stats',
+    "INSERT INTO question_stats (question_id, attempts, correct, total_ms) VALUES (?, 1, ?, ?) "
+    "ON CONFLICT (question_id) DO UPDATE SET "
+    "attempts = attempts + 1, "
+    "correct = correct + excluded.correct, "
+    "total_ms = total_ms + excluded.total_ms"
+)
+write_behind.register(
+    'user_topic_stats',
+    "INSERT INTO user_topic_stats (user_id, subject_id, topic, attempts, correct, mastery) "
+    "VALUES (?, {subject}, ?, 1, ?, ?) "
+    "ON CONFLICT (user_id, subject_id, topic) DO UPDATE SET "
+    "attempts = attempts + 1, "
+    "correct = correct + excluded.correct, "
+    "mastery = mastery + {weight} * (excluded.correct - mastery)".format(
+        subject=SUBJECT_ID, weight=TOPIC_MASTERY_WEIGHT
+    )
+)
+write_behind.register(
+    'user_reviews',
+    "INSERT OR REPLACE INTO user_reviews (user_id, subject_id, question_id, box, due) "
+    f"VALUES (?, {SUBJECT_ID}, ?, ?, ?)",
+    keyed=True
+)
+
+# Error rate assumed for each bank difficulty level until a question has
+# answers of its own, and how many answers that assumption is worth
+DIFFICULTY_PRIORS = {1: 0.2, 2: 0.4, 3: 0.6}
+DIFFICULTY_PRIOR_WEIGHT = 5
+TOPIC_PRIOR_MASTERY = 0.5
+
+# Running difficulty of each question: its share of wrong answers,
+# smoothed towards the bank's difficulty level. Counts are loaded once
+# and then updated in memory with every answer.
+class QuestionDifficulty:
+    def __init__(self, database):
+        self.db = database
+        self._counts = {}
+    
+    async def load(self):
+        rows = await self.db.fetchall("SELECT question_id, attempts, correct FROM question_stats")
+        self._counts = {question_id: [attempts, correct] for question_id, attempts, correct in rows}
+    
+    def record(self, question_id, correct):
+        counts = self._counts.get(question_id)
+        if counts is None:
+            counts = self._counts[question_id] = [0, 0]
+        counts[0] += 1
+        counts[1] += correct
+    
+    def estimate(self, question_id, level=2):
+        attempts, correct = self._counts.get(question_id, (0, 0))
+        prior = DIFFICULTY_PRIORS.get(level, DIFFICULTY_PRIORS[2])
+        return (attempts - correct + prior * DIFFICULTY_PRIOR_WEIGHT) / (attempts + DIFFICULTY_PRIOR_WEIGHT)
+
+question_difficulty = QuestionDifficulty(db)
+
+# Topic mastery after one more answer; the user_topic_stats upsert does the same
+def next_mastery(mastery, correct):
+    return mastery + TOPIC_MASTERY_WEIGHT * (correct - mastery)
+
+# Milliseconds since the current question was put on screen
+def response_time_ms(shown_at):
+    return int((time.monotonic() - shown_at) * 1000) if shown_at else 0
+
+# Record one answer given in an exam or in practice
+def record_answer(user_id, subject, question, correct, response_ms):
+    correct = 1 if correct else 0
+    write_behind.add('answer_events', [user_id, question['id'], correct, response_ms, int(time.time())])
+    write_behind.add('question_stats', [question['id'], correct, response_ms])
+    write_behind.add('user_topic_stats', [
+        user_id, subject, question['topic'] or '', correct, next_mastery(TOPIC_PRIOR_MASTERY, correct)
+    ])
+    question_difficulty.record(question['id'], correct)
+
+# Put a question on a user's review schedule (box and due time from PracticeSession.record)
+def save_review(user_id, subject, question_id, box, due):
+    write_behind.add('user_reviews', [user_id, subject, question_id, box, due], key=f"{user_id}/{question_id}")
+
+# One user's practice run in one subject. Two priority queues decide what
+# comes next: reviews by due time, and topics by mastery, weakest first
+# (entries left behind by a mastery update are skipped when they surface).
+# New questions come from the weakest topic's list, easiest first,
+# entered at the user's level, so a pick never scans the answer history.
+class PracticeSession:
+    def __init__(self, subject, ladders, mastery, reviews, seen):
+        self.subject = subject
+        self.ladders = ladders
+        self.mastery = mastery
+        self.seen = seen
+        self.current = None
+        self.shown_at = 0.0
+        self.boxes = {question_id: box for _, question_id, box in reviews}
+        self.reviews = [(due, question_id) for due, question_id, _ in reviews]
+        heapq.heapify(self.reviews)
+        self.topics = [(mastery[topic], topic) for topic in ladders]
+        heapq.heapify(self.topics)
+        self._cursors = {}
+    
+    # Next unseen question of a topic, walking its ladder once from the
+    # position matching the user's mastery and wrapping around
+    def _next_new(self, topic):
+        ladder = self.ladders[topic]
+        cursor = self._cursors.get(topic)
+        if cursor is None:
+            cursor = self._cursors[topic] = [int(self.mastery[topic] * (len(ladder) - 1)), 0]
+        start, taken = cursor
+        while taken < len(ladder):
+            question_id = ladder[(start + taken) % len(ladder)]
+            taken += 1
+            if question_id not in self.boxes and not SeenHistory.is_seen(self.seen, question_id):
+                cursor[1] = taken
+                return question_id
+        cursor[1] = taken
+        return None
+    
+    # Due reviews first, then a new question from the weakest topic; once
+    # every topic is used up, reviews that are not due yet
+    def next_question(self, now):
+        if self.reviews and self.reviews[0][0] <= now:
+            return heapq.heappop(self.reviews)[1]
+        topics = self.topics
+        while topics:
+            mastery, topic = topics[0]
+            if mastery != self.mastery[topic]:
+                heapq.heappop(topics)
+                continue
+            question_id = self._next_new(topic)
+            if question_id is not None:
+                return question_id
+            heapq.heappop(topics)
+        if self.reviews:
+            return heapq.heappop(self.reviews)[1]
+        return None
+    
+    # Update the topic's mastery and the question's review box. Returns
+    # (box, due) to store, or None when the question needs no review. A
+    # wrong answer starts over in box 0; a review answered right moves up
+    # a box, and past the last one it counts as learned.
+    def record(self, question_id, topic, correct, now):
+        mastery = self.mastery[topic] = next_mastery(self.mastery.get(topic, TOPIC_PRIOR_MASTERY), correct)
+        if topic in self.ladders:
+            heapq.heappush(self.topics, (mastery, topic))
+        box = self.boxes.get(question_id)
+        if not correct:
+            box = 0
+        elif box is None:
+            return None
+        else:
+            box += 1
+        if box >= len(REVIEW_INTERVALS):
+            del self.boxes[question_id]
+            return box, 0
+        self.boxes[question_id] = box
+        due = now + REVIEW_INTERVALS[box]
+        heapq.heappush(self.reviews, (due, question_id))
+        return box, due
+
+# Builds practice sessions. Each subject's questions are grouped by topic
+# (questions without one share the '' topic) and sorted by estimated
+# difficulty once, then reused until the bank version changes or the
+# lists are PRACTICE_LADDER_TTL seconds old.
+class PracticeEngine:
+    def __init__(self, database, store, difficulty, history):
+        self.db = database
+        self.store = store
+        self.difficulty = difficulty
+        self.history = history
+        self._ladders = {}
+    
+    def ladders(self, subject):
+        now = time.monotonic()
+        cached = self._ladders.get(subject)
+        if cached is not None and cached[0] == self.store.version and now - cached[1] < PRACTICE_LADDER_TTL:
+            return cached[2]
+        all_ids = self.store.question_ids(subject) or ()
+        level = {
+            question_id: difficulty
+            for difficulty, ids in self.store.difficulty_buckets(subject).items()
+            for question_id in ids
+        }
+        groups = {topic: list(ids) for topic, ids in self.store.topic_buckets(subject).items()}
+        in_topic = {question_id for ids in groups.values() for question_id in ids}
+        untagged = [question_id for question_id in all_ids if question_id not in in_topic]
+        if untagged:
+            groups[''] = untagged
+        estimate = self.difficulty.estimate
+        ladders = {
+            topic: array('q', sorted(ids, key=lambda question_id: estimate(question_id, level.get(question_id, 2))))
+            for topic, ids in groups.items()
+        }
+        self._ladders[subject] = (self.store.version, now, ladders)
+        return ladders
+    
+    async def open(self, user_id, subject):
+        ladders = self.ladders(subject)
+        if not ladders:
+            return None
+        mastery = dict.fromkeys(ladders, TOPIC_PRIOR_MASTERY)
+        mastery.update(await self.db.fetchall(
+            f"SELECT topic, mastery FROM user_topic_stats WHERE user_id = ? AND subject_id = {SUBJECT_ID}",
+            (user_id, subject)
+        ))
+        reviews = await self.db.fetchall(
+            "SELECT due, question_id, box FROM user_reviews "
+            f"WHERE user_id = ? AND subject_id = {SUBJECT_ID} AND box < ?",
+            (user_id, subject, len(REVIEW_INTERVALS))
+        )
+        seen = await self.history.get(user_id)
+        return PracticeSession(subject, ladders, mastery, reviews, seen)
+
+practice_engine = PracticeEngine(db, question_store, question_difficulty, seen_history)
+
+# Reject a question bank that would break exams
+def validate_questions(data):
+    if not isinstance(data, dict) or not data:
+        raise ValueError("question bank must be a non-empty object of subjects")
+    for subject, items in data.items():
+        if not isinstance(items, list):
+            raise ValueError(f"{subject}: questions must be a list")
+        for position, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get('question'), str):
+                raise ValueError(f"{subject}[{position}]: missing question text")
+            options = item.get('options')
+            if not isinstance(options, list) or len(options) < 2:
+                raise ValueError(f"{subject}[{position}]: needs at least two options")
+            correct = item.get('correct_answer')
+            if not isinstance(correct, int) or not 0 <= correct < len(options):
+                raise ValueError(f"{subject}[{position}]: correct_answer out of range")
+    return data
+
+# Read and validate questions.json; runs in a worker thread
+def parse_question_file(path=QUESTIONS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return validate_questions(json.load(f))
+
+# (mtime, size) of a file, or None if it does not exist
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+BANK_SNAPSHOT_FORMAT = 1
+
+# The snapshot is a marshal dump written by the bot itself: the ID lists
+# of one bank version plus the signature of the question file it came from
+def read_bank_snapshot(path=BANK_SNAPSHOT_PATH):
+    try:
+        with open(path, 'rb') as f:
+            snapshot = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('format') != BANK_SNAPSHOT_FORMAT:
+        return None
+    return snapshot
+
+def write_bank_snapshot(snapshot, path=BANK_SNAPSHOT_PATH):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        marshal.dump(snapshot, f)
+    os.replace(temporary, path)
+
+# Import a bank and make it current. New exams pick it up immediately,
+# exams in progress keep the ID list of the version they started with.
+# Without data, the bank comes from QUESTIONS_PATH, and the snapshot is
+# used instead if it was taken from the same file and the database still
+# has that version. That skips parsing, hashing and the ID-list query, so
+# startup does not slow down as the bank grows. `signature` identifies
+# the file `data` was read from; a snapshot is only written when known.
+# Shard workers never import: they take the latest version as it is.
+async def load_question_bank(data=None, signature=None):
+    if data is None:
+        signature = file_signature(QUESTIONS_PATH)
+        snapshot = await asyncio.to_thread(read_bank_snapshot)
+        if snapshot is not None and signature is not None and snapshot['signature'] == signature:
+            row = await db.fetchone("SELECT MAX(version) FROM question_banks")
+            if row[0] == snapshot['version']:
+                question_store.install(snapshot)
+                logger.info("Question bank version %s loaded from snapshot", snapshot['version'])
+                return
+        if not BANK_IMPORTER:
+            version = await question_store.load_version()
+            logger.info("Question bank version %s loaded", version)
+            return
+        data = await asyncio.to_thread(lambda: validate_questions(load_questions()))
+    version = await question_store.import_bank(data)
+    await question_store.load_version(version)
+    await question_store.prune()
+    logger.info("Question bank version %s loaded", version)
+    if signature is not None:
+        snapshot = question_store.snapshot()
+        snapshot.update(format=BANK_SNAPSHOT_FORMAT, signature=signature)
+        try:
+            await asyncio.to_thread(write_bank_snapshot, snapshot)
+        except OSError as e:
+            logger.warning("Could not write bank snapshot %s: %s", BANK_SNAPSHOT_PATH, e)
+
+# Load daily thoughts
+daily_thoughts = [
+    {
+        "thought": "जिंकण्याची इच्छा असलेल्या माणसाला कोणीही पराभूत करू शकत नाही.",
+        "author": "छत्रपती शिवाजी महाराज"
+    },
+    {
+        "thought": "शिक्षण हे समाजाचे आधारस्तंभ आहेत आणि ते समाजातील प्रत्येक व्यक्तीपर्यंत पोहोचले पाहिजे.",
+        "author": "डॉ. बाबासाहेब आंबेडकर"
+    },
+    {
+        "thought": "स्वातंत्र्य हा आपला जन्मसिद्ध हक्क आहे आणि आपण तो मिळवणारच.",
+        "author": "लोकमान्य टिळक"
+    },
+    {
+        "thought": "कष्टाचे फळ गोड असते, ते मिळवण्यासाठी कष्ट करणे आवश्यक आहे.",
+        "author": "लालबहादूर शास्त्री"
+    }
+]
+
+# News updates (would typically come from an API)
+news_items = [
+    "महाराष्ट्र पोलिस भरती २०२३: ५००० जागांसाठी अधिसूचना जारी",
+    "पोलिस भरती परीक्षेच्या तयारीसाठी मार्गदर्शक कार्यशाळा आयोजित",
+    "महाराष्ट्र सरकारमध्ये नवीन पोलिस भरती प्रक्रिया सुरू",
+    "पोलिस भरतीसाठी ऑनलाइन अर्ज प्रक्रिया सुरू"
+]
+
+# Thoughts and news currently served. The whole snapshot is replaced at
+# once on reload, so a handler never sees a half-updated pair of lists.
+class DailyContent:
+    def __init__(self, thoughts, news):
+        self.thoughts = thoughts
+        self.news = news
+
+daily_content = DailyContent(daily_thoughts, news_items)
+
+def validate_daily_content(thoughts, news):
+    if not thoughts or not all(
+        isinstance(t, dict) and isinstance(t.get('thought'), str) and isinstance(t.get('author'), str)
+        for t in thoughts
+    ):
+        raise ValueError("thoughts must be a non-empty list of {thought, author}")
+    if not news or not all(isinstance(n, str) for n in news):
+        raise ValueError("news must be a non-empty list of strings")
+
+# Read content/thoughts.json and content/news.json, falling back to the
+# built-in lists; runs in a worker thread
+def parse_daily_content():
+    def read(name, default):
+        try:
+            with open(os.path.join(CONTENT_DIR, name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+    thoughts = read('thoughts.json', daily_thoughts)
+    news = read('news.json', news_items)
+    validate_daily_content(thoughts, news)
+    return DailyContent(thoughts, news)
+
+async def load_daily_content():
+    global daily_content
+    daily_content = await asyncio.to_thread(parse_daily_content)
+
+# Background watcher for the question bank and daily content files. Files
+# are polled by (mtime, size); changed files are parsed and validated off
+# the event loop and only swapped in when valid. Shard workers leave the
+# question file to the front and just pick up the versions it imports.
+class ContentWatcher:
+    def __init__(self, interval=CONTENT_POLL_INTERVAL):
+        self.interval = interval
+        self._signatures = {}
+        self._task = None
+    
+    def _changed(self, *paths):
+        changed = False
+        for path in paths:
+            signature = file_signature(path)
+            if signature != self._signatures.get(path):
+                self._signatures[path] = signature
+                changed = True
+        return changed
+    
+    async def check(self):
+        if not BANK_IMPORTER:
+            version = await question_store.follow()
+            if version is not None:
+                logger.info("Question bank version %s loaded", version)
+        elif self._changed(QUESTIONS_PATH) and self._signatures[QUESTIONS_PATH] is not None:
+            try:
+                data = await asyncio.to_thread(parse_question_file)
+            except (OSError, ValueError) as e:
+                logger.error("Ignoring invalid question bank %s: %s", QUESTIONS_PATH, e)
+            else:
+                await load_question_bank(data, self._signatures[QUESTIONS_PATH])
+        
+        content_paths = [os.path.join(CONTENT_DIR, name) for name in ('thoughts.json', 'news.json')]
+        if self._changed(*content_paths):
+            try:
+                await load_daily_content()
+            except (OSError, ValueError) as e:
+                logger.error("Ignoring invalid daily content in %s: %s", CONTENT_DIR, e)
+            else:
+                logger.info("Daily content reloaded")
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Content reload failed")
+    
+    # Remember the current files so only later edits trigger a reload
+    def start(self):
+        self._changed(QUESTIONS_PATH)
+        self._changed(*(os.path.join(CONTENT_DIR, name) for name in ('thoughts.json', 'news.json')))
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+content_watcher = ContentWatcher()
+
+# Central scheduler for every exam deadline: a hashed timer wheel advanced
+# by one repeating job instead of one JobQueue job per candidate. Entries
+# hash into slots by due tick; a slot holds all rounds, and only entries
+# whose tick has passed fire. Scheduling and cancelling are dict
+# operations, so finishing an exam cancels its timers in O(1).
+class TimerWheel:
+    def __init__(self, tick=TIMER_TICK, size=TIMER_WHEEL_SLOTS):
+        self.tick = tick
+        self._slots = [{} for _ in range(size)]
+        self._where = {}
+        self._last_tick = None
+    
+    def __len__(self):
+        return len(self._where)
+    
+    def _tick_of(self, when):
+        return int(when // self.tick)
+    
+    # (Re)schedule key to fire at epoch time `when`
+    def schedule(self, key, when, payload):
+        self.cancel(key)
+        if self._last_tick is None:
+            self._last_tick = self._tick_of(time.time()) - 1
+        # Anything already overdue fires on the next tick
+        due_tick = max(self._tick_of(when), self._last_tick + 1)
+        slot = self._slots[due_tick % len(self._slots)]
+        slot[key] = (due_tick, payload)
+        self._where[key] = slot
+    
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del slot[key]
+    
+    # Collect every entry due up to `now`, catching up on missed ticks
+    def advance(self, now):
+        current = self._tick_of(now)
+        if self._last_tick is None:
+            self._last_tick = current - 1
+        first = max(self._last_tick + 1, current - len(self._slots) + 1)
+        due = []
+        for tick in range(first, current + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+            for key in [key for key, (due_tick, _) in slot.items() if due_tick <= current]:
+                due.append((key, slot.pop(key)[1]))
+                del self._where[key]
+        self._last_tick = current
+        return due
+
+timer_wheel = TimerWheel()
+metrics.gauge('policebot_timers_scheduled', "Exam timers and reminders on the timer wheel", lambda: len(timer_wheel))
+
+# Outbound priorities: lower is sent first
+PRIORITY_QUESTION, PRIORITY_FEEDBACK, PRIORITY_COSMETIC, PRIORITY_BULK = 0, 1, 2, 3
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    # Take a token, or return how many seconds until one is available
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class OutboundMessage:
+    __slots__ = ('method', 'chat_id', 'params', 'key', 'future', 'superseded')
+    
+    def __init__(self, method, chat_id, params, key, future):
+        self.method = method
+        self.chat_id = chat_id
+        self.params = params
+        self.key = key
+        self.future = future
+        self.superseded = False
+
+# Per-chat state: a chat is busy while a request is in flight or its bucket is empty
+class ChatLane:
+    __slots__ = ('bucket', 'busy', 'parked')
+    
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.busy = False
+        self.parked = []
+
+def _retrieve_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+# Rate-limit-aware outbound scheduler. Every Bot API call is queued by
+# priority and released under a global and a per-chat token bucket, with
+# at most one request per chat in flight so a chat's messages stay in
+# order. A pending edit of the same message is replaced by a newer one,
+# so only the latest text is sent. Works with any object exposing the
+# Bot methods used, which makes it easy to drive with a fake bot.
+class OutboundQueue:
+    def __init__(self, bot=None, global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE,
+                 chat_burst=OUTBOUND_CHAT_BURST, max_pending=OUTBOUND_MAX_PENDING,
+                 concurrency=OUTBOUND_CONCURRENCY):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self._global = TokenBucket(global_rate, global_rate)
+        self._heap = []
+        self._seq = itertools.count()
+        self._lanes = {}
+        self._edits = {}
+        self._pending = 0
+        self._inflight = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+        self.metrics = {'queued': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'errors': 0, 'retried': 0}
+    
+    # Messages accepted but not yet delivered
+    @property
+    def depth(self):
+        return self._pending
+    
+    def submit(self, method, chat_id, params, priority=PRIORITY_FEEDBACK, key=None):
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_exception)
+        if priority >= PRIORITY_COSMETIC and self._pending >= self.max_pending:
+            self.metrics['dropped'] += 1
+            future.set_result(None)
+            return future
+        if key is not None:
+            previous = self._edits.get(key)
+            if previous is not None and not previous.superseded:
+                previous.superseded = True
+                previous.future.set_result(None)
+                self._pending -= 1
+                self.metrics['coalesced'] += 1
+        item = OutboundMessage(method, chat_id, params, key, future)
+        if key is not None:
+            self._edits[key] = item
+        heapq.heappush(self._heap, (priority, next(self._seq), item))
+        self._pending += 1
+        self.metrics['queued'] += 1
+        self._wakeup.set()
+        return future
+    
+    def send_message(self, chat_id, text, priority=PRIORITY_FEEDBACK, **kwargs):
+        return self.submit('send_message', chat_id, dict(chat_id=chat_id, text=text, **kwargs), priority)
+    
+    # Edits of the same message coalesce while they wait
+    def edit_message_text(self, chat_id, message_id, text, priority=PRIORITY_COSMETIC, **kwargs):
+        return self.submit(
+            'edit_message_text', chat_id,
+            dict(chat_id=chat_id, message_id=message_id, text=text, **kwargs),
+            priority, key=(chat_id, message_id)
+        )
+    
+    def _lane(self, chat_id):
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = ChatLane(self.chat_rate, self.chat_burst)
+        return lane
+    
+    def _park(self, lane, entry, delay=None):
+        lane.parked.append(entry)
+        if delay is not None:
+            lane.busy = True
+            asyncio.get_running_loop().call_later(delay, self._release, entry[2].chat_id)
+    
+    def _release(self, chat_id):
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            return
+        lane.busy = False
+        for entry in lane.parked:
+            heapq.heappush(self._heap, entry)
+        lane.parked.clear()
+        self._wakeup.set()
+    
+    # Forget idle chats whose buckets have refilled
+    def _prune_lanes(self, now):
+        idle = (now - self.chat_burst / self.chat_rate)
+        for chat_id in [c for c, lane in self._lanes.items()
+                        if not lane.busy and not lane.parked and lane.bucket.updated < idle]:
+            del self._lanes[chat_id]
+    
+    async def _run(self):
+        while not (self._stopping and not self._pending):
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            entry = heapq.heappop(self._heap)
+            item = entry[2]
+            if item.superseded:
+                continue
+            lane = self._lane(item.chat_id)
+            if lane.busy:
+                self._park(lane, entry)
+                continue
+            now = time.monotonic()
+            wait = lane.bucket.take(now)
+            if wait:
+                self._park(lane, entry, wait)
+                continue
+            wait = self._global.take(now)
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self._global.take(time.monotonic())
+            while len(self._inflight) >= self.concurrency:
+                await asyncio.wait(self._inflight, return_when=asyncio.FIRST_COMPLETED)
+            # Once in flight an edit can no longer be replaced
+            if item.key is not None and self._edits.get(item.key) is item:
+                del self._edits[item.key]
+            lane.busy = True
+            task = asyncio.create_task(self._send(item, entry))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            if len(self._lanes) > 4 * self.max_pending:
+                self._prune_lanes(now)
+    
+    async def _send(self, item, entry):
+        try:
+            result = await getattr(self.bot, item.method)(**item.params)
+        except RetryAfter as e:
+            # Flood control for this chat: retry the same message later
+            self.metrics['retried'] += 1
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            self._park(self._lanes[item.chat_id], entry, retry_after)
+            return
+        except TelegramError as e:
+            if isinstance(e, BadRequest) and 'not modified' in str(e).lower():
+                self._finish(item, None)
+            else:
+                self.metrics['errors'] += 1
+                logger.warning("Outbound %s to chat %s failed: %s", item.method, item.chat_id, e)
+                self._finish(item, exception=e)
+        except Exception as e:
+            self.metrics['errors'] += 1
+            logger.exception("Outbound %s to chat %s failed", item.method, item.chat_id)
+            self._finish(item, exception=e)
+        else:
+            self.metrics['sent'] += 1
+            self._finish(item, result)
+        self._release(item.chat_id)
+    
+    def _finish(self, item, result=None, exception=None):
+        self._pending -= 1
+        if not item.future.done():
+            if exception is not None:
+                item.future.set_exception(exception)
+            else:
+                item.future.set_result(result)
+    
+    def start(self, bot=None):
+        if bot is not None:
+            self.bot = bot
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+    
+    # Deliver what is queued, giving up after `timeout` seconds
+    async def stop(self, timeout=10):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+        for _, _, item in self._heap + [e for lane in self._lanes.values() for e in lane.parked]:
+            if not item.superseded and not item.future.done():
+                self.metrics['dropped'] += 1
+                item.future.set_result(None)
+        self._heap.clear()
+        self._lanes.clear()
+        self._pending = 0
+
+outbox = OutboundQueue()
+metrics.gauge('policebot_outbox_depth', "Outbound messages waiting to be sent", lambda: outbox.depth)
+metrics.gauge('policebot_outbox_events_total', "Outbound queue counters",
+              lambda: outbox.metrics, label='event', kind='counter')
+
+# Gender codes stored in users.gender
+GENDER_OTHER, GENDER_MALE, GENDER_FEMALE = 0, 1, 2
+
+# Gender detection based on name endings (basic estimation for Marathi names)
+def detect_gender(name):
+    name = name.lower().strip()
+    female_endings = ['ा', 'ी', 'ीत', 'िन', 'िया', 'ना', 'ता', 'ला', 'मा', 'वी']
+    male_endings = ['े', 'य', 'क', 'र', 'स', 'त', 'न', 'प', 'ज', 'व']
+    
+    for ending in female_endings:
+        if name.endswith(ending):
+            return GENDER_FEMALE
+    
+    for ending in male_endings:
+        if name.endswith(ending):
+            return GENDER_MALE
+    
+    return GENDER_OTHER
+
+# Callback data is an action byte followed by unsigned varint arguments,
+# base64url encoded without padding. Subjects, districts and options are
+# sent as indexes. Exam and practice buttons carry the question's ID, which
+# is checked against the question the session is on, so buttons left over
+# from an earlier question or exam are rejected while one markup per
+# question serves every user. The exit confirmation carries the exam's
+# nonce. Mock exam buttons carry the mock exam's ID and the question's
+# position instead.
+(CB_MAIN_MENU, CB_SUBJECT, CB_DISTRICT, CB_ANSWER,
+ CB_EXIT, CB_CONFIRM_EXIT, CB_CANCEL_EXIT,
+ CB_PRACTICE_ANSWER, CB_PRACTICE_STOP,
+ CB_MOCK_ANSWER, CB_MOCK_SUBMIT) = range(1, 12)
+
+SUBJECTS = ("मराठी", "सामान्य ज्ञान", "बुद्धिमत्ता चाचणी", "गणित", "इतिहास/भूगोल/संविधान", "चालू घडामोडी")
+DISTRICTS = ("जालना", "औरंगाबाद", "मुंबई", "पुणे")
+
+# Results of scheduled mock exams are stored under this subject
+MOCK_EXAM_SUBJECT = "मॉक टेस्ट"
+
+def encode_callback(action, *args):
+    data = bytearray((action,))
+    for value in args:
+        while value >= 0x80:
+            data.append(value & 0x7f | 0x80)
+            value >>= 7
+        data.append(value)
+    return base64.urlsafe_b64encode(bytes(data)).rstrip(b'=').decode('ascii')
+
+# Returns (action, args), or None for malformed data. Text payloads of
+# buttons sent before this encoding decode to an unknown action.
+def decode_callback(data):
+    try:
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except ValueError:
+        return None
+    if not raw or not CB_MAIN_MENU <= raw[0] <= CB_MOCK_SUBMIT:
+        return None
+    args = []
+    value = shift = 0
+    for byte in raw[1:]:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            args.append(value)
+            value = shift = 0
+    if shift:
+        return None
+    return raw[0], args
+
+def new_exam_nonce():
+    return random.getrandbits(32)
+
+# Message templates, formatted with the per-user values only
+GREETING_TEMPLATE = (
+    "सुस्वागतम {name}! तुमच्या महाराष्ट्र पोलिस भरती तयारीच्या सफरेत आम्ही तुमच्या सोबत आहोत! {badge}"
+    "\n\nमुख्य मेनू:"
+)
+GREETING_BADGES = {GENDER_FEMALE: "👮‍♀️", GENDER_MALE: "👮‍♂️", GENDER_OTHER: "👮"}
+
+RESULT_TEMPLATE = (
+    "📊 तुमचे परीक्षा निकाल:\n\n"
+    "विषय: {subject}\n"
+    "एकूण प्रश्न: {total_questions}\n"
+    "बरोबर उत्तरे: {score}\n"
+    "टक्केवारी: {percentage:.2f}%\n\n"
+    "{motivation}"
+)
+RESULT_LOW_SCORE = (
+    "💪 घाबरू नका! कष्ट सुरू ठेवा, कुटुंब आणि मित्रांच्या सहकार्याने तुम्ही नक्कीच यशस्वी व्हाल!\n\n"
+    "📚 अधिक सराव करण्यासाठी पुन्हा प्रयत्न करा!"
+)
+RESULT_HIGH_SCORE = (
+    "🎖️ अभिनंदन! उत्तम कामगिरी!\n\n"
+    "वर्दी तुझी वाट पाहत आहे! 👮‍♂️"
+)
+
+# Main menu keyboard. Telegram objects are immutable, so the static
+# keyboards are built once and the same markup is shared by every reply.
+@functools.lru_cache(maxsize=None)
+def main_menu_keyboard():
+    keyboard = [[label for label, _ in row] for row in MAIN_MENU]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+# Subject selection keyboard
+@functools.lru_cache(maxsize=None)
 def subject_keyboard():
     keyboard = [
         [
-            InlineKeyboardButton("📘 मराठी", callback_data="subject_मराठी"),
-            InlineKeyboardButton("📙 सामान्य ज्ञान", callback_data="subject_सामान्य ज्ञान")
+            InlineKeyboardButton("📘 मराठी", callback_data=encode_callback(CB_SUBJECT, 0)),
+            InlineKeyboardButton("📙 सामान्य ज्ञान", callback_data=encode_callback(CB_SUBJECT, 1))
         ],
         [
-            InlineKeyboardButton("📗 बुद्धिमत्ता चाचणी", callback_data="subject_बुद्धिमत्ता चाचणी"),
-            InlineKeyboardButton("📕 गणित", callback_data="subject_गणित")
+            InlineKeyboardButton("📗 बुद्धिमत्ता चाचणी", callback_data=encode_callback(CB_SUBJECT, 2)),
+            InlineKeyboardButton("📕 गणित", callback_data=encode_callback(CB_SUBJECT, 3))
         ],
         [
-            InlineKeyboardButton("📚 इतिहास/भूगोल/संविधान", callback_data="subject_इतिहास/भूगोल/संविधान"),
-            InlineKeyboardButton("📰 चालू घडामोडी", callback_data="subject_चालू घडामोडी")
+            InlineKeyboardButton("📚 इतिहास/भूगोल/संविधान", callback_data=encode_callback(CB_SUBJECT, 4)),
+            InlineKeyboardButton("📰 चालू घडामोडी", callback_data=encode_callback(CB_SUBJECT, 5))
         ],
         [
-            InlineKeyboardButton("🔙 मुख्य मेनू", callback_data="main_menu")
+            InlineKeyboardButton("🔙 मुख्य मेनू", callback_data=encode_callback(CB_MAIN_MENU))
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # District selection keyboard (for future enhancement)
+@functools.lru_cache(maxsize=None)
 def district_keyboard():
     keyboard = [
         [
-            InlineKeyboardButton("जालना", callback_data="district_जालना"),
-            InlineKeyboardButton("औरंगाबाद", callback_data="district_औरंगाबाद")
+            InlineKeyboardButton("जालना", callback_data=encode_callback(CB_DISTRICT, 0)),
+            InlineKeyboardButton("औरंगाबाद", callback_data=encode_callback(CB_DISTRICT, 1))
         ],
         [
-            InlineKeyboardButton("मुंबई", callback_data="district_मुंबई"),
-            InlineKeyboardButton("पुणे", callback_data="district_पुणे")
+            InlineKeyboardButton("मुंबई", callback_data=encode_callback(CB_DISTRICT, 2)),
+            InlineKeyboardButton("पुणे", callback_data=encode_callback(CB_DISTRICT, 3))
         ],
         [
-            InlineKeyboardButton("🔙 मुख्य मेनू", callback_data="main_menu")
+            InlineKeyboardButton("🔙 मुख्य मेनू", callback_data=encode_callback(CB_MAIN_MENU))
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+# Exit confirmation keyboard for one exam
+@functools.lru_cache(maxsize=256)
+def exit_confirm_keyboard(nonce):
+    keyboard = [
+        [InlineKeyboardButton("✅ होय", callback_data=encode_callback(CB_CONFIRM_EXIT, nonce))],
+        [InlineKeyboardButton("❌ नाही", callback_data=encode_callback(CB_CANCEL_EXIT, nonce))]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+# Option keyboards per question ID, least recently used first, shared by
+# every exam and user showing the question. Question IDs are integer
+# rowids of question rows, which are keyed by content hash and never
+# modified, so an ID always means the same options and a cached keyboard
+# never goes stale across bank versions.
+_question_keyboards = OrderedDict()
+
+def question_keyboard(question_id, options, practice=False):
+    key = (question_id, practice)
+    markup = _question_keyboards.get(key)
+    if markup is not None:
+        _question_keyboards.move_to_end(key)
+        return markup
+    
+    answer, leave, label = (
+        (CB_PRACTICE_ANSWER, CB_PRACTICE_STOP, "🛑 सराव थांबवा") if practice
+        else (CB_ANSWER, CB_EXIT, "🚪 परीक्षा सोडा")
+    )
+    keyboard = [
+        [InlineKeyboardButton(f"{i+1}. {option}", callback_data=encode_callback(answer, question_id, i))]
+        for i, option in enumerate(options)
+    ]
+    keyboard.append([InlineKeyboardButton(label, callback_data=encode_callback(leave, question_id))])
+    markup = _question_keyboards[key] = InlineKeyboardMarkup(keyboard)
+    if len(_question_keyboards) > KEYBOARD_CACHE_SIZE:
+        _question_keyboards.popitem(last=False)
+    return markup
+
+# Option keyboard for one question of a mock exam. The markup is the same
+# for every participant, so one cached object serves the whole fan-out.
+def mock_question_keyboard(mock_id, position, options):
+    key = ('mock', mock_id, position)
+    markup = _question_keyboards.get(key)
+    if markup is not None:
+        _question_keyboards.move_to_end(key)
+        return markup
+    
+    keyboard = [
+        [InlineKeyboardButton(f"{i+1}. {option}",
+                              callback_data=encode_callback(CB_MOCK_ANSWER, mock_id, position, i))]
+        for i, option in enumerate(options)
+    ]
+    keyboard.append([InlineKeyboardButton("🏁 पेपर सबमिट करा", callback_data=encode_callback(CB_MOCK_SUBMIT, mock_id))])
+    markup = _question_keyboards[key] = InlineKeyboardMarkup(keyboard)
+    if len(_question_keyboards) > KEYBOARD_CACHE_SIZE:
+        _question_keyboards.popitem(last=False)
+    return markup
+
+# One lock per chat, dropped automatically once nobody holds or waits on it
+_chat_locks = weakref.WeakValueDictionary()
+
+def chat_lock(chat_id):
+    lock = _chat_locks.get(chat_id)
+    if lock is None:
+        lock = _chat_locks[chat_id] = asyncio.Lock()
+    return lock
+
+# Update processor that runs different chats in parallel but each chat's
+# updates one at a time, in arrival order. The lock is taken before the
+# handlers are even looked up, so ConversationHandler states are always
+# set by the previous update of the chat before the next one is checked.
+# The chat lock is taken before a concurrency slot, so a burst from one
+# chat never keeps other chats waiting.
+class ChatSerializedProcessor(BaseUpdateProcessor):
+    async def process_update(self, update, coroutine):
+        key = update_lock_key(update)
+        if key is None:
+            return await super().process_update(update, coroutine)
+        async with chat_lock(key):
+            await super().process_update(update, coroutine)
+    
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+
+# Chat an update belongs to, or its user when there is no chat (e.g. inline
+# queries). A private chat has the same ID as its user, so both keys meet.
+def update_lock_key(update):
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
 # Start command
+@timed(HANDLER_SECONDS)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     context.user_data['user_id'] = user.id
     
     # Check if user exists in database
-    conn = sqlite3.connect('maharashtra_police_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user.id,))
-    existing_user = cursor.fetchone()
+    existing_user = await get_registered_user(user.id)
     
     if not existing_user:
         # Ask for user's name
@@ -248,6 +2690,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return 0
     else:
+        # A returning user may have unblocked the bot; include them in broadcasts again
+        write_behind.add('user_blocked', [None, user.id], key=user.id)
         await update.message.reply_text(
             f"पुन्हा भेटल्यावर आनंद झाला {existing_user[2]}! 😊\n\n"
             "मुख्य मेनू:",
@@ -256,46 +2700,34 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 # Get user's name and detect gender
+@timed(HANDLER_SECONDS)
 async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.text
     gender = detect_gender(user_name)
     
     # Store user data
     user = update.effective_user
-    conn = sqlite3.connect('maharashtra_police_bot.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO users (user_id, username, full_name, gender) VALUES (?, ?, ?, ?)",
-        (user.id, user.username, user_name, gender)
-    )
-    conn.commit()
-    conn.close()
+    write_behind.add('users', [user.id, user.username, user_name, gender], key=user.id)
     
     # Greet based on gender
-    if gender == "स्त्री":
-        greeting = f"सुस्वागतम {user_name}! तुमच्या महाराष्ट्र पोलिस भरती तयारीच्या सफरेत आम्ही तुमच्या सोबत आहोत! 👮‍♀️"
-    elif gender == "पुरुष":
-        greeting = f"सुस्वागतम {user_name}! तुमच्या महाराष्ट्र पोलिस भरती तयारीच्या सफरेत आम्ही तुमच्या सोबत आहोत! 👮‍♂️"
-    else:
-        greeting = f"सुस्वागतम {user_name}! तुमच्या महाराष्ट्र पोलिस भरती तयारीच्या सफरेत आम्ही तुमच्या सोबत आहोत! 👮"
-    
     await update.message.reply_text(
-        greeting + "\n\nमुख्य मेनू:",
+        GREETING_TEMPLATE.format(name=user_name, badge=GREETING_BADGES[gender]),
         reply_markup=main_menu_keyboard()
     )
     return ConversationHandler.END
 
 # Main menu handler
+@timed(HANDLER_SECONDS)
 async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text(
-        "मुख्य मेनू:",
-        reply_markup=main_menu_keyboard()
-    )
+    # A reply keyboard cannot be attached to an edited message; the main
+    # menu keyboard stays on screen from the earlier reply
+    await query.edit_message_text("मुख्य मेनू:")
 
 # Start exam
+@timed(HANDLER_SECONDS)
 async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if user has selected a subject
     if 'current_subject' not in context.user_data:
@@ -307,41 +2739,36 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Start the exam
     subject = context.user_data['current_subject']
+    cancel_exam_timers(update.effective_chat.id)
+    discard_exam(context.user_data)
     context.user_data['current_question'] = 0
     context.user_data['score'] = 0
     context.user_data['correct_streak'] = 0
     
-    # Load questions for the subject
-    if subject in questions_data:
-        context.user_data['questions'] = questions_data[subject]
-        total_questions = len(context.user_data['questions'])
+    # Draw a fresh paper from the current bank version (once it has loaded
+    # after startup); the session holds question IDs only
+    await question_store.loaded.wait()
+    question_ids = await paper_builder.build(update.effective_user.id, subject)
+    if question_ids:
+        context.user_data['bank_version'] = question_store.version
+        context.user_data['exam_nonce'] = new_exam_nonce()
+        context.user_data['question_ids'] = question_ids
+        context.user_data['answers'] = bytearray((len(question_ids) + 7) // 8)
+        context.user_data['exam_chat_id'] = update.effective_chat.id
+        context.user_data['exam_user_id'] = update.effective_user.id
+        total_questions = len(question_ids)
         context.user_data['total_questions'] = total_questions
         
         # Set exam timer (60 minutes for 100 questions)
-        exam_duration = 3600  # 60 minutes in seconds
-        context.user_data['exam_end_time'] = datetime.now() + timedelta(seconds=exam_duration)
+        exam_end_time = datetime.now() + timedelta(seconds=EXAM_DURATION)
+        context.user_data['exam_end_time'] = exam_end_time
+        save_exam_session(context.user_data)
         
         # Start the exam
         await display_question(update, context)
         
-        # Schedule timer updates
-        context.job_queue.run_repeating(
-            update_exam_timer, 
-            interval=10, 
-            first=10, 
-            chat_id=update.effective_chat.id, 
-            name=str(update.effective_chat.id)
-        )
-        
-        # Schedule 10-minute warning
-        warning_time = exam_duration - 600  # 10 minutes before end
-        if warning_time > 0:
-            context.job_queue.run_once(
-                warn_remaining_time, 
-                warning_time, 
-                chat_id=update.effective_chat.id, 
-                name=f"warning_{update.effective_chat.id}"
-            )
+        # Register the deadline and the 10-minute warning with the timer wheel
+        schedule_exam_timers(update.effective_chat.id, update.effective_user.id, exam_end_time)
         
         return EXAM_IN_PROGRESS
     else:
@@ -351,130 +2778,216 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return SELECTING_SUBJECT
 
+# Text and keyboard for the current question
+async def render_question(user_data):
+    question_index = user_data['current_question']
+    question_ids = user_data['question_ids']
+    question_id = question_ids[question_index]
+    question_data = await question_store.get(question_id)
+    user_data['question_shown_at'] = time.monotonic()
+    
+    # Display question with timer
+    remaining_time = user_data['exam_end_time'] - datetime.now()
+    minutes, seconds = divmod(max(int(remaining_time.total_seconds()), 0), 60)
+    
+    message = (
+        f"⏰ उर्वरित वेळ: {minutes:02d}:{seconds:02d}\n\n"
+        f"प्रश्न {question_index + 1}/{len(question_ids)}:\n"
+        f"{question_data['question']}\n\n"
+        "पर्याय:"
+    )
+    return message, question_keyboard(question_id, question_data['options'])
+
 # Display current question
 async def display_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     question_index = context.user_data['current_question']
-    questions = context.user_data['questions']
+    question_ids = context.user_data['question_ids']
     
-    if question_index < len(questions):
-        question_data = questions[question_index]
-        question_text = question_data['question']
-        options = question_data['options']
-        
-        # Create inline keyboard for options
-        keyboard = []
-        for i, option in enumerate(options):
-            keyboard.append([InlineKeyboardButton(f"{i+1}. {option}", callback_data=f"answer_{i}")])
-        
-        # Add exit button
-        keyboard.append([InlineKeyboardButton("🚪 परीक्षा सोडा", callback_data="exit_exam")])
-        
-        # Display question with timer
-        remaining_time = context.user_data['exam_end_time'] - datetime.now()
-        minutes, seconds = divmod(int(remaining_time.total_seconds()), 60)
-        
-        message = (
-            f"⏰ उर्वरित वेळ: {minutes:02d}:{seconds:02d}\n\n"
-            f"प्रश्न {question_index + 1}/{len(questions)}:\n"
-            f"{question_text}\n\n"
-            "पर्याय:"
-        )
+    if question_index < len(question_ids):
+        message, reply_markup = await render_question(context.user_data)
         
+        # Questions go ahead of feedback and cosmetic edits in the outbound queue
+        chat_id = update.effective_chat.id
         if update.callback_query:
-            await update.callback_query.edit_message_text(
-                message, 
-                reply_markup=InlineKeyboardMarkup(keyboard)
+            outbox.edit_message_text(
+                chat_id,
+                update.callback_query.message.message_id,
+                message,
+                priority=PRIORITY_QUESTION,
+                reply_markup=reply_markup
             )
         else:
-            await update.message.reply_text(
-                message, 
-                reply_markup=InlineKeyboardMarkup(keyboard)
+            outbox.send_message(
+                chat_id,
+                message,
+                priority=PRIORITY_QUESTION,
+                reply_markup=reply_markup
             )
     else:
         # Exam finished
         await finish_exam(update, context)
 
-# Update exam timer
-async def update_exam_timer(context: ContextTypes.DEFAULT_TYPE):
-    job = context.job
-    chat_id = job.chat_id
-    
-    if 'exam_end_time' in context.user_data:
-        remaining_time = context.user_data['exam_end_time'] - datetime.now()
-        if remaining_time.total_seconds() <= 0:
-            # Exam time is over
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="⏰ परीक्षेचा वेळ संपला आहे!",
-                reply_markup=main_menu_keyboard()
-            )
-            job.schedule_removal()
-            return ConversationHandler.END
-        
-        minutes, seconds = divmod(int(remaining_time.total_seconds()), 60)
-        
-        # Update the message with remaining time
-        try:
-            await context.bot.edit_message_text(
-                text=f"⏰ उर्वरित वेळ: {minutes:02d}:{seconds:02d}",
-                chat_id=chat_id,
-                message_id=context.user_data.get('timer_message_id')
-            )
-        except:
-            # Message might not be accessible, ignore error
-            pass
+# Persist the running exam as a compact record. Called on start and after
+# every answer; the write-behind queue keeps only the latest row per user.
+def save_exam_session(user_data, active=True):
+    question_ids = user_data['question_ids']
+    write_behind.add('exam_sessions', [
+        user_data['exam_user_id'],
+        user_data['exam_chat_id'],
+        user_data['current_subject'],
+        user_data['bank_version'],
+        array('I', question_ids).tobytes(),
+        bytes(user_data['answers']),
+        min(user_data['current_question'] + (1 if user_data.get('answer_pending') else 0), len(question_ids)),
+        user_data['exam_end_time'].timestamp(),
+        1 if active else 0
+    ], key=user_data['exam_user_id'])
 
-# Warn about remaining time
-async def warn_remaining_time(context: ContextTypes.DEFAULT_TYPE):
-    job = context.job
-    chat_id = job.chat_id
-    
-    # Send warning message
-    warning_msg = await context.bot.send_message(
-        chat_id=chat_id,
-        text="⚠️ सावधान! परीक्षेचा वेळ फक्त १० मिनिटे शिल्लक आहे! ⚠️",
-        parse_mode=ParseMode.HTML
+# Rebuild user_data for every exam that was running when the bot stopped,
+# put its deadline back on the timer wheel and resend its current question
+async def restore_exam_sessions(application: Application):
+    rows = await db.fetchall(
+        "SELECT user_id, chat_id, subject, bank_version, question_ids, answers, cursor, deadline "
+        "FROM exam_sessions WHERE active = 1 AND user_id % ? = ?",
+        (SHARD_COUNT, SHARD_INDEX)
     )
-    
-    # Blink the warning message
-    for _ in range(5):
-        await asyncio.sleep(1)
-        try:
-            await context.bot.edit_message_text(
-                text="<b>⚠️ सावधान! परीक्षेचा वेळ फक्त १० मिनिटे शिल्लक आहे! ⚠️</b>",
-                chat_id=chat_id,
-                message_id=warning_msg.message_id,
-                parse_mode=ParseMode.HTML
-            )
-        except:
-            pass
+    for user_id, chat_id, subject, bank_version, id_blob, answers, cursor, deadline in rows:
+        question_ids = array('I')
+        question_ids.frombytes(id_blob)
+        answers = bytearray(answers)
+        correct = [bool(answers[i >> 3] & (1 << (i & 7))) for i in range(cursor)]
+        streak = 0
+        for answered_correctly in reversed(correct):
+            if not answered_correctly:
+                break
+            streak += 1
         
-        await asyncio.sleep(1)
-        try:
-            await context.bot.edit_message_text(
-                text="⚠️ सावधान! परीक्षेचा वेळ फक्त १० मिनिटे शिल्लक आहे! ⚠️",
-                chat_id=chat_id,
-                message_id=warning_msg.message_id,
-                parse_mode=ParseMode.HTML
-            )
-        except:
-            pass
+        user_data = application.user_data[user_id]
+        discard_exam(user_data)
+        user_data.update({
+            'exam_user_id': user_id,
+            'current_subject': subject,
+            'bank_version': bank_version,
+            'exam_nonce': new_exam_nonce(),
+            'question_ids': array('q', question_ids),
+            'answers': answers,
+            'exam_chat_id': chat_id,
+            'current_question': cursor,
+            'score': sum(correct),
+            'correct_streak': streak,
+            'total_questions': len(question_ids),
+            'exam_end_time': datetime.fromtimestamp(deadline),
+        })
+        if cursor >= len(question_ids):
+            # Every question was answered just before the stop
+            outbox.send_message(chat_id, close_exam(user_data), reply_markup=main_menu_keyboard())
+            continue
+        schedule_exam_timers(chat_id, user_id, user_data['exam_end_time'])
+        if deadline > time.time():
+            message, reply_markup = await render_question(user_data)
+            outbox.send_message(chat_id, message, priority=PRIORITY_QUESTION, reply_markup=reply_markup)
+    if rows:
+        logger.info("Restored %d exam sessions", len(rows))
+
+# Timer wheel keys for a chat's exam
+EXAM_WARNING, EXAM_EXPIRY = 'exam_warning', 'exam_expiry'
+
+def schedule_exam_timers(chat_id, user_id, exam_end_time):
+    deadline = exam_end_time.timestamp()
+    if EXAM_DURATION > EXAM_WARNING_BEFORE:
+        timer_wheel.schedule((EXAM_WARNING, chat_id), deadline - EXAM_WARNING_BEFORE, (chat_id, user_id))
+    timer_wheel.schedule((EXAM_EXPIRY, chat_id), deadline, (chat_id, user_id))
+
+def cancel_exam_timers(chat_id):
+    timer_wheel.cancel((EXAM_WARNING, chat_id))
+    timer_wheel.cancel((EXAM_EXPIRY, chat_id))
+
+# Exam time is over: record what was answered and close the session
+@timed(JOB_SECONDS)
+async def expire_exam(context: ContextTypes.DEFAULT_TYPE, chat_id, user_id):
+    user_data = context.application.user_data.get(user_id)
+    if not user_data or 'question_ids' not in user_data:
+        return
+    result_message = close_exam(user_data)
+    outbox.send_message(
+        chat_id,
+        "⏰ परीक्षेचा वेळ संपला आहे!\n\n" + result_message,
+        priority=PRIORITY_QUESTION,
+        reply_markup=main_menu_keyboard()
+    )
+
+EXAM_WARNING_TEXT = "<b>⚠️ सावधान! परीक्षेचा वेळ फक्त १० मिनिटे शिल्लक आहे! ⚠️</b>"
+
+# Warn about remaining time. Sent once in bold; the old blink loop slept
+# for ten seconds, which would stall every other timer in the batch.
+@timed(JOB_SECONDS)
+async def warn_remaining_time(context: ContextTypes.DEFAULT_TYPE, chat_id, user_id):
+    outbox.send_message(chat_id, EXAM_WARNING_TEXT, parse_mode=ParseMode.HTML)
+
+TIMER_HANDLERS = {
+    EXAM_WARNING: warn_remaining_time,
+    EXAM_EXPIRY: expire_exam,
+}
+
+# The single repeating job: fire everything due on the wheel as one batch
+@timed(JOB_SECONDS)
+async def run_timer_wheel(context: ContextTypes.DEFAULT_TYPE):
+    due = timer_wheel.advance(time.time())
+    if not due:
+        return
+    results = await asyncio.gather(
+        *(TIMER_HANDLERS[kind](context, *payload) for (kind, _), payload in due),
+        return_exceptions=True
+    )
+    for ((kind, chat_id), _), result in zip(due, results):
+        if isinstance(result, Exception):
+            logger.error("Timer %s for chat %s failed", kind, chat_id, exc_info=result)
+
+# ID of the question the running exam is on, or None
+def current_question_id(user_data):
+    question_ids = user_data.get('question_ids')
+    if question_ids is None or user_data['current_question'] >= len(question_ids):
+        return None
+    return question_ids[user_data['current_question']]
 
 # Handle answer selection
-async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@timed(HANDLER_SECONDS)
+async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, question_id, answer_index):
     query = update.callback_query
+    
+    # Reject buttons of an earlier question or an exam that already ended
+    if current_question_id(context.user_data) != question_id:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
     await query.answer()
     
-    answer_index = int(query.data.split('_')[1])
+    # Ignore extra taps while the feedback for this question is still on screen
+    if context.user_data.get('answer_pending'):
+        return
+    context.user_data['answer_pending'] = True
+    
     question_index = context.user_data['current_question']
-    questions = context.user_data['questions']
-    question_data = questions[question_index]
+    question_ids = context.user_data['question_ids']
+    question_data = await question_store.get(question_ids[question_index])
     correct_index = question_data['correct_answer']
     
-    # Check if answer is correct
+    # Feedback edits are replaced by the next question if they are still queued
+    chat_id = update.effective_chat.id
+    message_id = query.message.message_id
+    
+    # Every answer feeds the difficulty, topic and review models
+    user_id = update.effective_user.id
+    subject = context.user_data['current_subject']
+    record_answer(
+        user_id, subject, question_data, answer_index == correct_index,
+        response_time_ms(context.user_data.get('question_shown_at'))
+    )
+    
+    # Check if answer is correct
     if answer_index == correct_index:
         context.user_data['score'] += 1
         context.user_data['correct_streak'] += 1
+        context.user_data['answers'][question_index >> 3] |= 1 << (question_index & 7)
         
         # Celebration for every 10 correct answers
         if context.user_data['correct_streak'] % 10 == 0:
@@ -483,177 +2996,635 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "वाह! 🌟 तुम्ही अप्रतिम प्रगती करत आहात!",
                 "अद्भुत! 💯 तुमच्या कष्टाचे फळ मिळत आहे!"
             ]
-            await query.edit_message_text(
-                text=f"✅ बरोबर उत्तर!\n\n{random.choice(celebration_messages)}"
+            outbox.edit_message_text(
+                chat_id, message_id,
+                f"✅ बरोबर उत्तर!\n\n{random.choice(celebration_messages)}",
+                priority=PRIORITY_FEEDBACK
             )
-            await asyncio.sleep(2)
+            delay = FEEDBACK_DELAY_CELEBRATION
         else:
             # Show correct answer animation
-            await query.edit_message_text(
-                text="✅ बरोबर उत्तर! " + "🎉" * min(context.user_data['correct_streak'], 5)
+            outbox.edit_message_text(
+                chat_id, message_id,
+                "✅ बरोबर उत्तर! " + "🎉" * min(context.user_data['correct_streak'], 5),
+                priority=PRIORITY_FEEDBACK
             )
-            await asyncio.sleep(1)
+            delay = FEEDBACK_DELAY_CORRECT
     else:
         context.user_data['correct_streak'] = 0
         correct_answer = question_data['options'][correct_index]
+        save_review(user_id, subject, question_data['id'], 0, time.time() + REVIEW_INTERVALS[0])
         
         # Show wrong answer animation
-        await query.edit_message_text(
-            text=f"❌ चुकीचे उत्तर!\n\nयोग्य उत्तर: {correct_answer}"
+        outbox.edit_message_text(
+            chat_id, message_id,
+            f"❌ चुकीचे उत्तर!\n\nयोग्य उत्तर: {correct_answer}",
+            priority=PRIORITY_FEEDBACK
         )
-        await asyncio.sleep(2)
+        delay = FEEDBACK_DELAY_WRONG
     
-    # Move to next question
-    context.user_data['current_question'] += 1
-    await display_question(update, context)
+    # Move to next question once the feedback has been shown; the handler
+    # itself returns right away
+    save_exam_session(context.user_data)
+    schedule_next_question(update, context, delay)
 
-# Finish exam and show results
-async def finish_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    score = context.user_data['score']
-    total_questions = context.user_data['total_questions']
-    subject = context.user_data['current_subject']
+# Deferred half of handle_answer. Runs under the chat lock and only if the
+# same exam is still on the same question, so an exit or a new exam
+# started in the meantime is never overwritten.
+def schedule_next_question(update: Update, context: ContextTypes.DEFAULT_TYPE, delay):
+    user_data = context.user_data
+    question_ids = user_data['question_ids']
+    question_index = user_data['current_question']
+    
+    async def advance():
+        await asyncio.sleep(delay)
+        async with chat_lock(update.effective_chat.id):
+            if user_data.get('question_ids') is not question_ids or user_data.get('current_question') != question_index:
+                return
+            user_data['current_question'] += 1
+            user_data.pop('answer_pending', None)
+            await display_question(update, context)
+    
+    context.application.create_task(advance(), update=update)
+
+# Exam state kept in user_data while an exam is running
+EXAM_SESSION_KEYS = (
+    'question_ids', 'bank_version', 'exam_nonce', 'current_question', 'score', 'correct_streak',
+    'total_questions', 'exam_end_time', 'answer_pending', 'answers', 'exam_chat_id', 'exam_user_id',
+    'question_shown_at'
+)
+
+def discard_exam(user_data):
+    if 'question_ids' in user_data:
+        save_exam_session(user_data, active=False)
+    for key in EXAM_SESSION_KEYS:
+        user_data.pop(key, None)
+
+# Record the result of the running exam, end it and build the result message
+def close_exam(user_data):
+    score = user_data['score']
+    total_questions = user_data['total_questions']
+    subject = user_data['current_subject']
     
     # Calculate percentage
     percentage = (score / total_questions) * 100
     
     # Store result in database
-    user_id = context.user_data['user_id']
-    conn = sqlite3.connect('maharashtra_police_bot.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO user_progress (user_id, subject, score, total_questions) VALUES (?, ?, ?, ?)",
-        (user_id, subject, score, total_questions)
-    )
-    conn.commit()
-    conn.close()
+    record_exam_result(user_data['exam_user_id'], subject, score, total_questions)
+    discard_exam(user_data)
     
-    # Prepare result message
-    result_message = (
-        f"📊 तुमचे परीक्षा निकाल:\n\n"
-        f"विषय: {subject}\n"
-        f"एकूण प्रश्न: {total_questions}\n"
-        f"बरोबर उत्तरे: {score}\n"
-        f"टक्केवारी: {percentage:.2f}%\n\n"
+    # Result followed by a motivational message based on score
+    return RESULT_TEMPLATE.format(
+        subject=subject,
+        total_questions=total_questions,
+        score=score,
+        percentage=percentage,
+        motivation=RESULT_LOW_SCORE if percentage < 50 else RESULT_HIGH_SCORE
     )
-    
-    # Add motivational message based on score
-    if percentage < 50:
-        result_message += (
-            "💪 घाबरू नका! कष्ट सुरू ठेवा, कुटुंब आणि मित्रांच्या सहकार्याने तुम्ही नक्कीच यशस्वी व्हाल!\n\n"
-            "📚 अधिक सराव करण्यासाठी पुन्हा प्रयत्न करा!"
-        )
-    else:
-        result_message += (
-            "🎖️ अभिनंदन! उत्तम कामगिरी!\n\n"
-            "वर्दी तुझी वाट पाहत आहे! 👮‍♂️"
-        )
+
+# Finish exam and show results
+async def finish_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cancel_exam_timers(update.effective_chat.id)
+    result_message = close_exam(context.user_data)
     
     # Send result message
+    chat_id = update.effective_chat.id
     if update.callback_query:
-        await update.callback_query.edit_message_text(
+        outbox.edit_message_text(
+            chat_id,
+            update.callback_query.message.message_id,
             result_message,
-            reply_markup=main_menu_keyboard()
+            priority=PRIORITY_QUESTION
         )
     else:
-        await update.message.reply_text(
+        outbox.send_message(
+            chat_id,
             result_message,
+            priority=PRIORITY_QUESTION,
             reply_markup=main_menu_keyboard()
         )
     
-    # Remove exam timer job
-    if 'exam_timer_job' in context.user_data:
-        context.user_data['exam_timer_job'].schedule_removal()
-    
     return ConversationHandler.END
 
 # Exit exam
-async def exit_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@timed(HANDLER_SECONDS)
+async def exit_exam(update: Update, context: ContextTypes.DEFAULT_TYPE, question_id):
     query = update.callback_query
+    if current_question_id(context.user_data) != question_id:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
     await query.answer()
     
     # Confirm exit
-    keyboard = [
-        [InlineKeyboardButton("✅ होय", callback_data="confirm_exit")],
-        [InlineKeyboardButton("❌ नाही", callback_data="cancel_exit")]
-    ]
-    
     await query.edit_message_text(
         "तुम्हाला परीक्षा सोडायची आहे का? सध्या केलेले प्रगती नष्ट होईल.",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=exit_confirm_keyboard(context.user_data['exam_nonce'])
     )
 
 # Confirm exam exit
-async def confirm_exit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@timed(HANDLER_SECONDS)
+async def confirm_exit(update: Update, context: ContextTypes.DEFAULT_TYPE, nonce):
     query = update.callback_query
+    if context.user_data.get('exam_nonce') != nonce:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
     await query.answer()
     
-    await query.edit_message_text(
-        "परीक्षा सोडली आहे. मुख्य मेनूमध्ये परत आलात.",
-        reply_markup=main_menu_keyboard()
-    )
+    # Drop the exam and its timers
+    cancel_exam_timers(update.effective_chat.id)
+    discard_exam(context.user_data)
     
-    # Remove exam timer job
-    if 'exam_timer_job' in context.user_data:
-        context.user_data['exam_timer_job'].schedule_removal()
+    await query.edit_message_text("परीक्षा सोडली आहे. मुख्य मेनूमध्ये परत आलात.")
     
     return ConversationHandler.END
 
 # Cancel exam exit
-async def cancel_exit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@timed(HANDLER_SECONDS)
+async def cancel_exit(update: Update, context: ContextTypes.DEFAULT_TYPE, nonce):
     query = update.callback_query
     await query.answer()
     
     # Return to current question
+    if context.user_data.get('exam_nonce') != nonce:
+        await query.edit_message_text("मुख्य मेनू:")
+        return ConversationHandler.END
     await display_question(update, context)
     return EXAM_IN_PROGRESS
 
+# Show the subject keyboard
+@timed(HANDLER_SECONDS)
+async def choose_subject(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("विषय निवडा:", reply_markup=subject_keyboard())
+
 # Select subject
-async def select_subject(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@timed(HANDLER_SECONDS)
+async def select_subject(update: Update, context: ContextTypes.DEFAULT_TYPE, subject_id):
     query = update.callback_query
+    if subject_id >= len(SUBJECTS):
+        await query.answer(STALE_BUTTON_TEXT)
+        return
     await query.answer()
     
-    if query.data.startswith("subject_"):
-        subject = query.data.split("_")[1]
-        context.user_data['current_subject'] = subject
-        
-        await query.edit_message_text(
-            f"तुम्ही निवडलेला विषय: {subject}\n\n"
-            "परीक्षा सुरू करण्यासाठी '📝 परीक्षा सुरू करा' वर क्लिक करा.",
-            reply_markup=main_menu_keyboard()
+    subject = SUBJECTS[subject_id]
+    context.user_data['current_subject'] = subject
+    
+    await query.edit_message_text(
+        f"तुम्ही निवडलेला विषय: {subject}\n\n"
+        "परीक्षा सुरू करण्यासाठी '📝 परीक्षा सुरू करा' वर क्लिक करा."
+    )
+    
+    return ConversationHandler.END
+
+# Text and keyboard for the next practice question, or None once the
+# subject has nothing left to practise
+async def next_practice_question(session, user_id):
+    question_id = session.next_question(time.time())
+    session.current = question_id
+    if question_id is None:
+        return "🎉 या विषयातील सर्व प्रश्नांचा सराव पूर्ण झाला आहे!", None
+    if question_id not in session.boxes:
+        SeenHistory.mark(session.seen, (question_id,))
+        seen_history.save(user_id, session.seen)
+    question = await question_store.get(question_id)
+    session.shown_at = time.monotonic()
+    topic = question['topic'] or ''
+    message = (
+        f"🎯 सराव: {topic or session.subject} "
+        f"(प्रभुत्व {session.mastery.get(topic, TOPIC_PRIOR_MASTERY) * 100:.0f}%)\n\n"
+        f"{question['question']}\n\n"
+        "पर्याय:"
+    )
+    return message, question_keyboard(question_id, question['options'], practice=True)
+
+# Practise the weakest topics of the chosen subject, with due reviews first
+@timed(HANDLER_SECONDS)
+async def start_practice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if 'current_subject' not in context.user_data:
+        await update.message.reply_text(
+            "कृपया प्रथम विषय निवडा:",
+            reply_markup=subject_keyboard()
         )
-    elif query.data == "main_menu":
-        await query.edit_message_text(
-            "मुख्य मेनू:",
+        return
+    # Write out answers still buffered from an exam that just ended
+    await write_behind.flush()
+    await question_store.loaded.wait()
+    user_id = update.effective_user.id
+    session = await practice_engine.open(user_id, context.user_data['current_subject'])
+    if session is None:
+        await update.message.reply_text(
+            "क्षमस्व, या विषयासाठी प्रश्न उपलब्ध नाहीत. कृपया दुसरा विषय निवडा.",
+            reply_markup=subject_keyboard()
+        )
+        return
+    context.user_data['practice'] = session
+    message, reply_markup = await next_practice_question(session, user_id)
+    outbox.send_message(update.effective_chat.id, message, priority=PRIORITY_QUESTION, reply_markup=reply_markup)
+
+# Practice answer: feedback and the next question go out as one edit
+@timed(HANDLER_SECONDS)
+async def handle_practice_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, question_id, answer_index):
+    query = update.callback_query
+    session = context.user_data.get('practice')
+    if session is None or session.current is None or session.current != question_id:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
+    question = await question_store.get(session.current)
+    if answer_index >= len(question['options']):
+        await query.answer(STALE_BUTTON_TEXT)
+        return
+    await query.answer()
+    
+    user_id = update.effective_user.id
+    correct = answer_index == question['correct_answer']
+    record_answer(user_id, session.subject, question, correct, response_time_ms(session.shown_at))
+    review = session.record(question['id'], question['topic'] or '', correct, time.time())
+    if review is not None:
+        save_review(user_id, session.subject, question['id'], *review)
+    
+    if correct:
+        feedback = "✅ बरोबर उत्तर!"
+    else:
+        feedback = f"❌ चुकीचे उत्तर!\nयोग्य उत्तर: {question['options'][question['correct_answer']]}"
+    message, reply_markup = await next_practice_question(session, user_id)
+    outbox.edit_message_text(
+        update.effective_chat.id,
+        query.message.message_id,
+        f"{feedback}\n\n{message}",
+        priority=PRIORITY_QUESTION,
+        reply_markup=reply_markup
+    )
+
+# Stop practising
+@timed(HANDLER_SECONDS)
+async def stop_practice(update: Update, context: ContextTypes.DEFAULT_TYPE, question_id):
+    query = update.callback_query
+    session = context.user_data.get('practice')
+    if session is None or session.current is None or session.current != question_id:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
+    await query.answer()
+    del context.user_data['practice']
+    await query.edit_message_text("सराव थांबवला आहे. मुख्य मेनूमध्ये परत आलात.")
+
+# Answer-sheet mode: the whole paper is sent at once and the user answers
+# every question in one message, graded in a single pass. Option letters
+# are Latin (A, B, ...) or अ/ब/क/ड; SHEET_BLANK marks an unanswered question.
+SHEET_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+SHEET_CHOICES = {**{letter: i for i, letter in enumerate(SHEET_LETTERS)}, 'अ': 0, 'ब': 1, 'क': 2, 'ड': 3}
+SHEET_BLANK = 0xFF
+SHEET_ENTRY_RE = re.compile(r'(\d+)\s*[-.:)=]?\s*([A-Zअबकड])')
+SHEET_COMPACT_RE = re.compile(r'[\s,;]*(?:[A-Fअबकड-][\s,;]*)+')
+SHEET_MESSAGE_LIMIT = 4000
+SHEET_KEYS = ('sheet_ids', 'sheet_key', 'sheet_subject', 'sheet_deadline', 'sheet_started')
+
+# Parse a sheet for a paper of `length` questions. Numbered entries
+# ("1A 2C 3-B", Devanagari digits too) or, without numbers, one letter
+# (A-F) per question in order with "-" to leave one blank. Returns the
+# chosen option per question and how many entries were out of range, or
+# None when nothing could be read.
+def parse_answer_sheet(text, length):
+    text = text.translate(DEVANAGARI_DIGITS).upper()
+    entries = SHEET_ENTRY_RE.findall(text)
+    if entries:
+        pairs = [(int(number) - 1, letter) for number, letter in entries]
+    elif SHEET_COMPACT_RE.fullmatch(text):
+        pairs = list(enumerate(re.findall(r'[A-Fअबकड-]', text)))
+    else:
+        return None
+    sheet = bytearray([SHEET_BLANK]) * length
+    ignored = 0
+    for position, letter in pairs:
+        if letter == '-':
+            continue
+        if 0 <= position < length:
+            sheet[position] = SHEET_CHOICES[letter]
+        else:
+            ignored += 1
+    if sheet.count(SHEET_BLANK) == length:
+        return None
+    return sheet, ignored
+
+# Grade a sheet against the paper's answer key (correct option per
+# question) in one pass: 1 per correct answer, 0 otherwise
+def grade_sheet(sheet, key):
+    return bytes(map(operator.eq, sheet, key))
+
+# The paper as a few long messages, split between questions
+def answer_sheet_messages(questions, deadline):
+    parts = [
+        f"🧾 उत्तरपत्रिका परीक्षा: {len(questions)} प्रश्न\n"
+        f"⏰ उत्तरे {datetime.fromtimestamp(deadline):%H:%M} पर्यंत पाठवा.\n"
+    ]
+    for number, question in enumerate(questions, start=1):
+        options = "  ".join(
+            f"{SHEET_LETTERS[i]}) {option}" for i, option in enumerate(question['options'])
+        )
+        block = f"\n{number}. {question['question']}\n{options}\n"
+        if len(parts[-1]) + len(block) > SHEET_MESSAGE_LIMIT:
+            parts.append("")
+        parts[-1] += block
+    return parts
+
+def discard_answer_sheet(user_data):
+    for key in SHEET_KEYS:
+        user_data.pop(key, None)
+
+# Send a full paper for the selected subject and wait for the answers
+@timed(HANDLER_SECONDS)
+async def start_answer_sheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if 'current_subject' not in context.user_data:
+        await update.message.reply_text("कृपया प्रथम विषय निवडा:", reply_markup=subject_keyboard())
+        return ConversationHandler.END
+    subject = context.user_data['current_subject']
+    user_id = update.effective_user.id
+    
+    await question_store.loaded.wait()
+    question_ids = await paper_builder.build(user_id, subject)
+    if not question_ids:
+        await update.message.reply_text(
+            "क्षमस्व, या विषयासाठी प्रश्न उपलब्ध नाहीत. कृपया दुसरा विषय निवडा.",
+            reply_markup=subject_keyboard()
+        )
+        return ConversationHandler.END
+    questions = await question_store.get_many(question_ids)
+    deadline = time.time() + EXAM_DURATION
+    context.user_data.update({
+        'sheet_ids': question_ids,
+        'sheet_key': bytes(question['correct_answer'] for question in questions),
+        'sheet_subject': subject,
+        'sheet_deadline': deadline,
+        'sheet_started': time.monotonic(),
+    })
+    
+    chat_id = update.effective_chat.id
+    for part in answer_sheet_messages(questions, deadline):
+        outbox.send_message(chat_id, part, priority=PRIORITY_QUESTION)
+    outbox.send_message(
+        chat_id,
+        "✍️ सर्व उत्तरे एकाच संदेशात पाठवा, उदा: 1A 2C 3B ...\n"
+        "किंवा क्रमाने: ACBD... (न सोडवलेल्या प्रश्नासाठी -)",
+        priority=PRIORITY_QUESTION,
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return SUBMITTING_SHEET
+
+# Grade a submitted sheet. The answer events, review entries and the
+# result are queued together without yielding, so they are written in
+# the same write-behind flush transaction.
+@timed(HANDLER_SECONDS)
+async def handle_answer_sheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_data = context.user_data
+    if 'sheet_ids' not in user_data:
+        return ConversationHandler.END
+    if time.time() > user_data['sheet_deadline']:
+        discard_answer_sheet(user_data)
+        await update.message.reply_text(
+            "⏰ उत्तरपत्रिकेची वेळ संपली आहे. नवीन परीक्षा सुरू करा.",
             reply_markup=main_menu_keyboard()
         )
+        return ConversationHandler.END
+    
+    question_ids, key = user_data['sheet_ids'], user_data['sheet_key']
+    parsed = parse_answer_sheet(update.message.text, len(question_ids))
+    if parsed is None:
+        await update.message.reply_text("उत्तरे वाचता आली नाहीत. कृपया या स्वरूपात पाठवा: 1A 2C 3B ...")
+        return SUBMITTING_SHEET
+    sheet, ignored = parsed
+    questions = await question_store.get_many(question_ids)
     
+    marks = grade_sheet(sheet, key)
+    score = marks.count(1)
+    answered = len(sheet) - sheet.count(SHEET_BLANK)
+    response_ms = int((time.monotonic() - user_data['sheet_started']) * 1000) // answered
+    user_id = update.effective_user.id
+    subject = user_data['sheet_subject']
+    now = time.time()
+    for position, question in enumerate(questions):
+        if sheet[position] == SHEET_BLANK or question is None:
+            continue
+        record_answer(user_id, subject, question, marks[position], response_ms)
+        if not marks[position]:
+            save_review(user_id, subject, question['id'], 0, now + REVIEW_INTERVALS[0])
+    record_exam_result(user_id, subject, score, len(question_ids))
+    discard_answer_sheet(user_data)
+    
+    percentage = 100 * score / len(question_ids)
+    message = RESULT_TEMPLATE.format(
+        subject=subject,
+        total_questions=len(question_ids),
+        score=score,
+        percentage=percentage,
+        motivation=RESULT_LOW_SCORE if percentage < 50 else RESULT_HIGH_SCORE
+    )
+    message += f"\n\nसोडवलेले प्रश्न: {answered}/{len(question_ids)}"
+    if ignored:
+        message += f"\nवगळलेल्या नोंदी (चुकीचा प्रश्न क्रमांक): {ignored}"
+    corrections = [
+        f"{position + 1}{SHEET_LETTERS[key[position]]}"
+        for position in range(len(sheet)) if sheet[position] != SHEET_BLANK and not marks[position]
+    ]
+    if corrections:
+        message += "\nचुकलेल्या प्रश्नांची योग्य उत्तरे: " + " ".join(corrections)
+    await update.message.reply_text(message[:SHEET_MESSAGE_LIMIT], reply_markup=main_menu_keyboard())
     return ConversationHandler.END
 
-# Show daily thought
-async def daily_thought(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Get today's thought (based on day of year for consistency)
-    day_of_year = datetime.now().timetuple().tm_yday
-    thought_index = day_of_year % len(daily_thoughts)
-    thought = daily_thoughts[thought_index]
-    
-    await update.message.reply_text(
+# Callback handlers by action. Each is called with the decoded callback
+# arguments after (update, context).
+CALLBACK_HANDLERS = {
+    CB_MAIN_MENU: main_menu,
+    CB_SUBJECT: select_subject,
+    CB_ANSWER: handle_answer,
+    CB_EXIT: exit_exam,
+    CB_CONFIRM_EXIT: confirm_exit,
+    CB_CANCEL_EXIT: cancel_exit,
+    CB_PRACTICE_ANSWER: handle_practice_answer,
+    CB_PRACTICE_STOP: stop_practice,
+}
+
+STALE_BUTTON_TEXT = "हे बटण आता वापरता येणार नाही."
+
+# Route every callback query with a single table lookup
+async def dispatch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    decoded = decode_callback(query.data or '')
+    handler = CALLBACK_HANDLERS.get(decoded[0]) if decoded else None
+    if handler is None:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
+    return await handler(update, context, *decoded[1])
+
+# The thought for a day (based on day of year for consistency)
+def daily_thought_text(day):
+    thoughts = daily_content.thoughts
+    thought = thoughts[day.timetuple().tm_yday % len(thoughts)]
+    return (
         f"📅 दैनंदिन विचार:\n\n"
         f"{thought['thought']}\n\n"
         f"- {thought['author']}"
     )
 
-# Show news updates
-async def news_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Get today's news (in a real scenario, this would come from an API)
-    today_news = news_updates[datetime.now().day % len(news_updates)]
-    
-    await update.message.reply_text(
+# The news for a day (in a real scenario, this would come from an API)
+def news_text(day):
+    news = daily_content.news
+    return (
         f"📰 अद्यतन बातम्या:\n\n"
-        f"{today_news}\n\n"
-        f"📅 {datetime.now().strftime('%d-%m-%Y')}"
+        f"{news[day.day % len(news)]}\n\n"
+        f"📅 {day.strftime('%d-%m-%Y')}"
     )
 
+# Show daily thought
+@timed(HANDLER_SECONDS)
+async def daily_thought(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(daily_thought_text(date.today()))
+
+# Show news updates
+@timed(HANDLER_SECONDS)
+async def news_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(news_text(date.today()))
+
+# Reminder time parsing. Marathi phrases are split into tokens once and
+# matched against the word tables below; Devanagari digits are mapped to
+# ASCII first, so "९:३०" and "9:30" parse the same way.
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+REMINDER_TOKEN_RE = re.compile(r'\d{1,2}[:.]\d{2}|\d+|[^\W\d_][\wऀ-ॿ]*')
+REMINDER_CLOCK_RE = re.compile(r'(\d{1,2})[:.](\d{2})$')
+REMINDER_DAYS = {'आज': 0, 'उद्या': 1, 'परवा': 2}
+REMINDER_WEEKDAYS = (
+    ('सोमवार', 0), ('मंगळवार', 1), ('बुधवार', 2), ('गुरुवार', 3),
+    ('शुक्रवार', 4), ('शनिवार', 5), ('रविवार', 6),
+)
+REMINDER_NUMBERS = {
+    'एक': 1, 'एका': 1, 'दोन': 2, 'तीन': 3, 'चार': 4, 'पाच': 5, 'सहा': 6,
+    'सात': 7, 'आठ': 8, 'नऊ': 9, 'दहा': 10, 'अकरा': 11, 'बारा': 12,
+}
+# Fraction words: minutes added to the hour that follows them
+REMINDER_FRACTIONS = {'साडे': 30, 'सव्वा': 15, 'पावणे': -15}
+# Words that are a complete time on their own
+REMINDER_HALVES = {'दीड': (1, 30), 'अडीच': (2, 30)}
+# Period stem -> (name, default hour)
+REMINDER_PERIODS = (
+    ('पहाट', ('dawn', 5)), ('सकाळ', ('morning', 9)), ('दुपार', ('afternoon', 14)),
+    ('संध्याकाळ', ('evening', 18)), ('सायंकाळ', ('evening', 18)), ('रात्र', ('night', 21)),
+)
+# Unit stem -> minutes per unit for "N तासांनी" style offsets
+REMINDER_UNITS = (('मिनिट', 1), ('तास', 60), ('दिवस', 1440), ('आठवड', 10080))
+
+# First table entry whose stem starts the token
+def _reminder_stem(token, table):
+    for stem, value in table:
+        if token.startswith(stem):
+            return value
+    return None
+
+# Parse reminder text into a spec independent of the current time:
+# (day offset, weekday, hour, minute, period, offset minutes). Cached,
+# since users send the same few phrasings over and over.
+@functools.lru_cache(maxsize=REMINDER_PARSE_CACHE)
+def parse_reminder_spec(text):
+    tokens = REMINDER_TOKEN_RE.findall(text.translate(DEVANAGARI_DIGITS))
+    days = weekday = hour = minute = period = offset = None
+    fraction = 0
+    after_hour = False
+    # A bare number is only an hour next to "वाजता" or a time-of-day word
+    has_period = any(_reminder_stem(token, REMINDER_PERIODS) for token in tokens)
+    count = len(tokens)
+    i = 0
+    while i < count:
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < count else ''
+        if token in REMINDER_DAYS:
+            days = REMINDER_DAYS[token]
+        elif token in REMINDER_FRACTIONS:
+            fraction = REMINDER_FRACTIONS[token]
+        elif token in REMINDER_HALVES:
+            hour, minute = REMINDER_HALVES[token]
+        elif token.isdigit() or token in REMINDER_NUMBERS:
+            number = int(token) if token.isdigit() else REMINDER_NUMBERS[token]
+            unit = _reminder_stem(following, REMINDER_UNITS)
+            if after_hour and unit == 1:
+                # "९ वाजून १५ मिनिटांनी" is a clock time, not an offset
+                minute = number
+                i += 1
+            elif unit == 1440:
+                days = (days or 0) + number
+                i += 1
+            elif unit is not None:
+                offset = (offset or 0) + number * unit
+                i += 1
+            elif number <= 24 and (fraction or following.startswith('वाज') or (has_period and hour is None)):
+                if fraction < 0:
+                    hour, minute = number - 1, 60 + fraction
+                else:
+                    hour, minute = number, fraction
+                fraction = 0
+                after_hour = following.startswith('वाजून')
+                if after_hour:
+                    i += 1
+        else:
+            clock = REMINDER_CLOCK_RE.match(token)
+            if clock:
+                hour, minute = int(clock.group(1)), int(clock.group(2))
+            elif token.startswith('आठवड') and any(t.startswith('पुढ') for t in tokens[:i]):
+                days = (days or 0) + 7
+            else:
+                found = _reminder_stem(token, REMINDER_PERIODS)
+                if found is not None:
+                    period = found
+                else:
+                    day_of_week = _reminder_stem(token, REMINDER_WEEKDAYS)
+                    if day_of_week is not None:
+                        weekday = day_of_week
+        i += 1
+    if hour is not None and (hour > 24 or minute > 59):
+        hour = minute = None
+    return days, weekday, hour, minute, period, offset
+
+# Turn a parsed spec into a datetime after now. Bare hours are read as the
+# next matching clock time ("५ वाजता" at 10:00 is 17:00), and a time that
+# has already passed rolls over to the next day (or week, for weekdays),
+# so a reminder is never scheduled in the past.
+def resolve_reminder_time(spec, now):
+    days, weekday, hour, minute, period, offset = spec
+    now = now.replace(second=0, microsecond=0)
+    if offset is not None:
+        return now + timedelta(minutes=offset, days=days or 0)
+    explicit_day = days is not None or weekday is not None
+    if hour is None and period is None and not explicit_day:
+        return now + timedelta(hours=1)
+    day = now.date() + timedelta(days=days or 0)
+    if weekday is not None:
+        day += timedelta(days=(weekday - day.weekday()) % 7)
+    extra_day = 0
+    if hour is None:
+        hour, minute = (period[1], 0) if period else (9, 0)
+    elif period is not None:
+        name = period[0]
+        if name in ('afternoon', 'evening') and hour < 12:
+            hour += 12
+        elif name == 'night':
+            if hour == 12 or hour < 5:
+                # "रात्री १२" / "रात्री २" mean the coming midnight hours
+                hour, extra_day = hour % 12, 1
+            elif hour < 12:
+                hour += 12
+        elif name in ('morning', 'dawn') and hour == 12:
+            hour = 0
+    if hour == 24:
+        hour, extra_day = 0, extra_day + 1
+    when = datetime(day.year, day.month, day.day, hour, minute) + timedelta(days=extra_day)
+    if when <= now and period is None and hour < 12 and when + timedelta(hours=12) > now:
+        return when + timedelta(hours=12)
+    step = timedelta(days=7 if weekday is not None else 1)
+    while when <= now:
+        when += step
+    return when
+
+# Parse free reminder text against the current time
+def parse_reminder_time(text, now=None):
+    return resolve_reminder_time(parse_reminder_spec(text), now or datetime.now())
+
 # Set reminder
+@timed(HANDLER_SECONDS)
 async def set_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "⏰ तुम्हाला रिमाइंडर सेट करायचा आहे का?\n\n"
@@ -663,39 +3634,16 @@ async def set_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return SETTING_REMINDER
 
 # Handle reminder input
+@timed(HANDLER_SECONDS)
 async def handle_reminder_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reminder_text = update.message.text
-    user_id = context.user_data['user_id']
+    user_id = update.effective_user.id
     
-    # Simple reminder parsing (in a real scenario, use a proper NLP library)
-    if 'उद्या' in reminder_text:
-        reminder_time = datetime.now() + timedelta(days=1)
-    elif 'आज' in reminder_text:
-        reminder_time = datetime.now()
-    else:
-        reminder_time = datetime.now() + timedelta(hours=1)
+    reminder_time = parse_reminder_time(reminder_text)
     
-    # Set time to 9 AM if not specified
-    reminder_time = reminder_time.replace(hour=9, minute=0, second=0, microsecond=0)
-    
-    # Store reminder in database
-    conn = sqlite3.connect('maharashtra_police_bot.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO reminders (user_id, reminder_text, reminder_time) VALUES (?, ?, ?)",
-        (user_id, reminder_text, reminder_time)
-    )
-    conn.commit()
-    conn.close()
-    
-    # Schedule reminder
-    context.job_queue.run_once(
-        send_reminder, 
-        when=reminder_time, 
-        chat_id=update.effective_chat.id, 
-        data=reminder_text,
-        name=f"reminder_{user_id}_{reminder_time}"
-    )
+    # Store reminder in database; the reminder engine delivers it
+    reminder_id = await db.add_reminder(user_id, update.effective_chat.id, reminder_text, reminder_time)
+    reminder_engine.add(reminder_id, update.effective_chat.id, reminder_text, reminder_time)
     
     await update.message.reply_text(
         f"✅ रिमाइंडर सेट केला आहे!\n\n"
@@ -706,15 +3654,673 @@ async def handle_reminder_input(update: Update, context: ContextTypes.DEFAULT_TY
     
     return ConversationHandler.END
 
+# Reminder status codes
+REMINDER_PENDING, REMINDER_SENT, REMINDER_FAILED = 0, 1, 2
+REMINDER_DUE = 'reminder_due'
+
+# Durable reminder scheduler. The reminders table is the source of truth;
+# only reminders due within the next REMINDER_WINDOW seconds are held in
+# memory, as entries on the shared timer wheel. A periodic refresh pulls
+# the next window through the (status, reminder_time) index. The first
+# refresh after startup also picks up everything missed while the bot
+# was down. Due reminders fire in the wheel's batches, and their status
+# and sent_at are written back through the write-behind queue.
+class ReminderEngine:
+    def __init__(self, database, wheel, queue, window=REMINDER_WINDOW):
+        self.db = database
+        self.wheel = wheel
+        self.queue = queue
+        self.window = window
+        self._scheduled = set()
+    
+    def _schedule(self, reminder_id, chat_id, text, reminder_time):
+        self._scheduled.add(reminder_id)
+        self.wheel.schedule((REMINDER_DUE, reminder_id), reminder_time.timestamp(), (reminder_id, chat_id, text))
+    
+    # A reminder was just stored; hold it now if it falls inside the window
+    def add(self, reminder_id, chat_id, text, reminder_time):
+        if reminder_time.timestamp() <= time.time() + self.window:
+            self._schedule(reminder_id, chat_id, text, reminder_time)
+    
+    async def refresh(self):
+        known = set(self._scheduled)
+        horizon = datetime.now() + timedelta(seconds=self.window)
+        rows = await self.db.fetchall(
+            "SELECT id, COALESCE(chat_id, user_id), reminder_text, reminder_time FROM reminders "
+            "WHERE status = ? AND reminder_time <= ? AND user_id % ? = ? ORDER BY reminder_time",
+            (REMINDER_PENDING, horizon.strftime('%Y-%m-%d %H:%M:%S'), SHARD_COUNT, SHARD_INDEX)
+        )
+        added = 0
+        for reminder_id, chat_id, text, reminder_time in rows:
+            if reminder_id not in self._scheduled:
+                self._schedule(reminder_id, chat_id, text, datetime.fromisoformat(reminder_time))
+                added += 1
+        # Forget reminders whose new status has been committed
+        self._scheduled -= known.difference(row[0] for row in rows)
+        return added
+    
+    @timed(JOB_SECONDS)
+    async def refresh_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.refresh()
+    
+    # The reminder stays in _scheduled until a refresh no longer finds it
+    # pending, so it is not scheduled again while its status update waits
+    # in the write-behind buffer
+    def mark(self, reminder_id, status):
+        self.queue.add(
+            'reminder_status',
+            [status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reminder_id],
+            key=reminder_id
+        )
+    
+    def deliver(self, reminder_id, chat_id, text):
+        future = outbox.send_message(chat_id, f"⏰ रिमाइंडर:\n\n{text}")
+        future.add_done_callback(functools.partial(self._delivered, reminder_id))
+    
+    def _delivered(self, reminder_id, future):
+        if future.cancelled() or (future.exception() is None and future.result() is None):
+            # Dropped at shutdown: stays pending and is caught up on next start
+            self._scheduled.discard(reminder_id)
+        elif future.exception() is not None:
+            self.mark(reminder_id, REMINDER_FAILED)
+        else:
+            self.mark(reminder_id, REMINDER_SENT)
+
+write_behind.register(
+    'reminder_status',
+    "UPDATE reminders SET status = ?, sent_at = ? WHERE id = ?",
+    keyed=True
+)
+reminder_engine = ReminderEngine(db, timer_wheel, write_behind)
+
 # Send reminder
-async def send_reminder(context: ContextTypes.DEFAULT_TYPE):
-    job = context.job
-    await context.bot.send_message(
-        chat_id=job.chat_id,
-        text=f"⏰ रिमाइंडर:\n\n{job.data}"
+@timed(JOB_SECONDS)
+async def send_reminder(context: ContextTypes.DEFAULT_TYPE, reminder_id, chat_id, text):
+    reminder_engine.deliver(reminder_id, chat_id, text)
+
+TIMER_HANDLERS[REMINDER_DUE] = send_reminder
+
+# Broadcast run status, and per-recipient delivery status
+BROADCAST_RUNNING, BROADCAST_DONE = 0, 1
+DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_BLOCKED = 1, 2, 3
+
+write_behind.register(
+    'user_blocked',
+    "UPDATE users SET blocked_at = ? WHERE user_id = ?",
+    keyed=True
+)
+
+# Push one message to every registered user of this shard. Recipients are
+# read in user_id order, a chunk at a time, after a keyset cursor, so
+# memory stays flat however many users there are. Each chunk goes to the
+# outbox at the lowest priority, which keeps the push under Telegram's
+# global limit and behind exam traffic. Once a chunk's sends settle, its
+# delivery rows, newly blocked users and the advanced cursor are
+# committed in one transaction. A run cut short (crash or shutdown) is
+# resumed on the next start from that checkpoint; users that already
+# have a delivery row are not sent to again. Runs are queued and go out
+# one after another.
+class BroadcastEngine:
+    def __init__(self, database, chunk=BROADCAST_CHUNK):
+        self.db = database
+        self.chunk = chunk
+        self._task = None
+        self._queued = []
+        self._stopping = False
+        self.metrics = {'sent': 0, 'failed': 0, 'blocked': 0, 'chunks': 0}
+    
+    async def _open(self, kind, day, text, reply_markup):
+        await self.db.execute(
+            "INSERT OR IGNORE INTO broadcasts (kind, day, shard, text, reply_markup) VALUES (?, ?, ?, ?, ?)",
+            (kind, day, SHARD_INDEX, text,
+             json.dumps(reply_markup.to_dict(), ensure_ascii=False) if reply_markup else None)
+        )
+        return await self.db.fetchone(
+            "SELECT id, text, reply_markup, cursor, status FROM broadcasts "
+            "WHERE kind = ? AND day = ? AND shard = ?",
+            (kind, day, SHARD_INDEX)
+        )
+    
+    # Send `text` (and inline buttons) for (kind, day); a run already
+    # started keeps its own message
+    async def run(self, kind, day, text, reply_markup=None):
+        broadcast_id, text, markup, cursor, status = await self._open(kind, day, text, reply_markup)
+        if status == BROADCAST_DONE:
+            return
+        reply_markup = InlineKeyboardMarkup.de_json(json.loads(markup), None) if markup else None
+        logger.info("Broadcast %s %s starting after user %s", kind, day, cursor)
+        while not self._stopping:
+            rows = await self.db.fetchall(
+                "SELECT user_id FROM users u WHERE user_id > ? AND blocked_at IS NULL AND user_id % ? = ? "
+                "AND NOT EXISTS (SELECT 1 FROM broadcast_deliveries d "
+                "WHERE d.broadcast_id = ? AND d.user_id = u.user_id) "
+                "ORDER BY user_id LIMIT ?",
+                (cursor, SHARD_COUNT, SHARD_INDEX, broadcast_id, self.chunk)
+            )
+            if not rows:
+                await self.db.execute(
+                    "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ?",
+                    (BROADCAST_DONE, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), broadcast_id)
+                )
+                logger.info("Broadcast %s %s finished", kind, day)
+                return
+            # Leave room for interactive traffic in the outbox
+            while outbox.depth + len(rows) > outbox.max_pending and not self._stopping:
+                await asyncio.sleep(1)
+            user_ids = [row[0] for row in rows]
+            results = await asyncio.gather(
+                *(outbox.send_message(user_id, text, priority=PRIORITY_BULK, reply_markup=reply_markup)
+                  for user_id in user_ids),
+                return_exceptions=True
+            )
+            cursor = await self._checkpoint(broadcast_id, cursor, user_ids, results)
+    
+    # Record a chunk's outcome. The cursor only moves past the chunk when
+    # every send settled; messages dropped at shutdown leave it in place.
+    async def _checkpoint(self, broadcast_id, cursor, user_ids, results):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        deliveries, blocked = [], []
+        complete = True
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Forbidden):
+                deliveries.append((broadcast_id, user_id, DELIVERY_BLOCKED, now))
+                blocked.append((now, user_id))
+                self.metrics['blocked'] += 1
+            elif isinstance(result, BaseException):
+                deliveries.append((broadcast_id, user_id, DELIVERY_FAILED, now))
+                self.metrics['failed'] += 1
+            elif result is None:
+                complete = False
+            else:
+                deliveries.append((broadcast_id, user_id, DELIVERY_SENT, now))
+                self.metrics['sent'] += 1
+        if complete:
+            cursor = user_ids[-1]
+        await self.db.write_batch([
+            ("INSERT OR REPLACE INTO broadcast_deliveries (broadcast_id, user_id, status, sent_at) "
+             "VALUES (?, ?, ?, ?)", deliveries),
+            ("UPDATE users SET blocked_at = ? WHERE user_id = ?", blocked),
+            ("UPDATE broadcasts SET cursor = ? WHERE id = ?", [(cursor, broadcast_id)]),
+        ])
+        self.metrics['chunks'] += 1
+        return cursor
+    
+    async def _run_all(self):
+        while self._queued and not self._stopping:
+            kind, day, text, reply_markup = self._queued.pop(0)
+            try:
+                await self.run(kind, day, text, reply_markup)
+            except Exception:
+                logger.exception("Broadcast %s %s failed", kind, day)
+    
+    def _wake(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run_all())
+    
+    # Queue a run; it starts once the runs ahead of it are done
+    def start(self, kind, day, text, reply_markup=None):
+        self._queued.append((kind, day, text, reply_markup))
+        self._wake()
+    
+    # Pick up runs interrupted by a crash or shutdown
+    async def resume(self):
+        rows = await self.db.fetchall(
+            "SELECT kind, day, text FROM broadcasts WHERE status = ? AND shard = ? ORDER BY id",
+            (BROADCAST_RUNNING, SHARD_INDEX)
+        )
+        if rows:
+            self._queued.extend((kind, day, text, None) for kind, day, text in rows)
+            self._wake()
+    
+    # Stop taking new chunks; call before the outbox stops
+    def halt(self):
+        self._stopping = True
+    
+    # Wait for the current chunk to be checkpointed; call after the outbox stopped
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+broadcast_engine = BroadcastEngine(db)
+metrics.gauge('policebot_broadcast_events_total', "Broadcast delivery counters",
+              lambda: broadcast_engine.metrics, label='event', kind='counter')
+
+# Daily job: today's thought and news as one message to every user
+@timed(JOB_SECONDS)
+async def broadcast_daily(context: ContextTypes.DEFAULT_TYPE):
+    day = date.today()
+    broadcast_engine.start(
+        'daily', day.isoformat(), daily_thought_text(day) + "\n\n" + news_text(day)
     )
 
+# Timer wheel keys of a mock exam: first question out, time warning, end
+MOCK_START, MOCK_WARNING, MOCK_EXPIRY = 'mock_start', 'mock_warning', 'mock_expiry'
+
+MOCK_EXAM_INTRO = (
+    "🚨 सर्व उमेदवारांसाठी {subject} सुरू झाली आहे!\n"
+    "एकूण प्रश्न: {total} | वेळ: {minutes} मिनिटे\n\n"
+)
+
+write_behind.register(
+    'mock_sessions',
+    "INSERT OR REPLACE INTO mock_sessions (mock_id, user_id, cursor, score, answers, finished) "
+    "VALUES (?, ?, ?, ?, ?, ?)",
+    keyed=True
+)
+
+# Participants of one mock exam in flat, preallocated arrays indexed by
+# slot: position, score, when the current question was shown, and a
+# fixed-stride answer bitmap. Everyone shares the exam's question ID
+# array, so a participant costs one slot rather than a paper of their
+# own. Capacity starts at the shard's user count and doubles if needed.
+class MockSessionTable:
+    def __init__(self, paper_length, capacity):
+        self.stride = (paper_length + 7) // 8
+        self.capacity = max(capacity, 1)
+        self.slots = {}
+        self.user_ids = array('q', [0]) * self.capacity
+        self.cursor = array('H', [0]) * self.capacity
+        self.score = array('H', [0]) * self.capacity
+        self.shown_at = array('d', [0.0]) * self.capacity
+        self.finished = bytearray(self.capacity)
+        self.answers = bytearray(self.stride * self.capacity)
+    
+    def _grow(self):
+        extra = self.capacity
+        self.user_ids.extend(array('q', [0]) * extra)
+        self.cursor.extend(array('H', [0]) * extra)
+        self.score.extend(array('H', [0]) * extra)
+        self.shown_at.extend(array('d', [0.0]) * extra)
+        self.finished.extend(bytes(extra))
+        self.answers.extend(bytes(self.stride * extra))
+        self.capacity += extra
+    
+    # A participant's slot, taking the next free one on first use
+    def slot(self, user_id):
+        slot = self.slots.get(user_id)
+        if slot is None:
+            slot = len(self.slots)
+            if slot == self.capacity:
+                self._grow()
+            self.slots[user_id] = slot
+            self.user_ids[slot] = user_id
+        return slot
+    
+    # Answer the slot's current question and move it to the next one
+    def record(self, slot, correct):
+        position = self.cursor[slot]
+        if correct:
+            self.score[slot] += 1
+            self.answers[slot * self.stride + (position >> 3)] |= 1 << (position & 7)
+        self.cursor[slot] = position + 1
+    
+    def bitmap(self, slot):
+        return bytes(self.answers[slot * self.stride:(slot + 1) * self.stride])
+    
+    # Put back a participant saved in mock_sessions
+    def restore(self, user_id, cursor, score, answers, finished):
+        slot = self.slot(user_id)
+        self.cursor[slot], self.score[slot], self.finished[slot] = cursor, score, finished
+        self.answers[slot * self.stride:slot * self.stride + len(answers)] = answers
+    
+    # Slots still sitting the exam
+    def active(self):
+        return [slot for slot in self.slots.values() if not self.finished[slot]]
+
+# One scheduled mock exam: its times (epoch seconds), the shared paper as
+# a uint32 ID array, and the participants once it has started
+class MockExam:
+    def __init__(self, mock_id, starts_at, ends_at, id_blob):
+        self.id = mock_id
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.question_ids = array('I')
+        self.question_ids.frombytes(id_blob)
+        self.sessions = None
+
+# Scheduled mock exams for every user. MOCK_EXAM_LEAD seconds ahead of a
+# start the shared paper is drawn and stored under its start time; shards
+# race on that row and all use the one stored first. Start, warning and
+# end are one timer wheel entry each for the whole exam, not timers per
+# candidate. At the start the first question goes to every user as a
+# broadcast with buttons: bulk priority behind interactive traffic, and
+# resumable like any broadcast. Nobody gets a session until their first
+# answer, which takes a slot in the exam's MockSessionTable. At the end
+# every unfinished session is scored and its result sent, in chunks that
+# leave room in the outbox. Sessions are saved through the write-behind
+# queue, so a restart picks up running exams and closes ended ones.
+class MockExamEngine:
+    def __init__(self, database, wheel, queue, chunk=BROADCAST_CHUNK):
+        self.db = database
+        self.wheel = wheel
+        self.queue = queue
+        self.chunk = chunk
+        self.exams = {}
+        self._tasks = set()
+        self._stopping = False
+    
+    def _schedule(self, exam):
+        self.exams[exam.id] = exam
+        self.wheel.schedule((MOCK_START, exam.id), exam.starts_at, (exam.id,))
+        if exam.ends_at - EXAM_WARNING_BEFORE > max(exam.starts_at, time.time()):
+            self.wheel.schedule((MOCK_WARNING, exam.id), exam.ends_at - EXAM_WARNING_BEFORE, (exam.id,))
+        self.wheel.schedule((MOCK_EXPIRY, exam.id), exam.ends_at, (exam.id,))
+    
+    async def _sessions(self, exam):
+        row = await self.db.fetchone(
+            "SELECT COUNT(*) FROM users WHERE blocked_at IS NULL AND user_id % ? = ?",
+            (SHARD_COUNT, SHARD_INDEX)
+        )
+        return MockSessionTable(len(exam.question_ids), row[0])
+    
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    # Wait until the outbox can take `count` more messages
+    async def _room(self, count):
+        while outbox.depth + count > outbox.max_pending and not self._stopping:
+            await asyncio.sleep(1)
+    
+    # Draw and store the paper of the exam starting at `starts_at`
+    async def prepare(self, starts_at):
+        for exam in self.exams.values():
+            if exam.starts_at == starts_at:
+                return exam
+        await question_store.loaded.wait()
+        question_ids = paper_builder.build_shared()
+        if not question_ids:
+            logger.warning("Mock exam at %s skipped: no questions", datetime.fromtimestamp(starts_at))
+            return None
+        await self.db.execute(
+            "INSERT OR IGNORE INTO mock_exams (starts_at, ends_at, question_ids) VALUES (?, ?, ?)",
+            (starts_at, starts_at + EXAM_DURATION, array('I', question_ids).tobytes())
+        )
+        row = await self.db.fetchone(
+            "SELECT id, starts_at, ends_at, question_ids FROM mock_exams WHERE starts_at = ?", (starts_at,)
+        )
+        exam = MockExam(*row)
+        self._schedule(exam)
+        logger.info("Mock exam %d scheduled for %s with %d questions",
+                    exam.id, datetime.fromtimestamp(exam.starts_at), len(exam.question_ids))
+        return exam
+    
+    # Exams of the last day: running ones get their participants back,
+    # ended ones with unfinished sessions are closed right away
+    async def restore(self):
+        now = time.time()
+        rows = await self.db.fetchall(
+            "SELECT id, starts_at, ends_at, question_ids FROM mock_exams WHERE ends_at > ?",
+            (now - 86400,)
+        )
+        for row in rows:
+            exam = MockExam(*row)
+            if exam.starts_at <= now:
+                sessions = await self.db.fetchall(
+                    "SELECT user_id, cursor, score, answers, finished FROM mock_sessions "
+                    "WHERE mock_id = ? AND user_id % ? = ?",
+                    (exam.id, SHARD_COUNT, SHARD_INDEX)
+                )
+                if exam.ends_at <= now and all(finished for *_, finished in sessions):
+                    continue
+                exam.sessions = await self._sessions(exam)
+                for session in sessions:
+                    exam.sessions.restore(*session)
+            self._schedule(exam)
+    
+    # Send the first question to everyone
+    async def start(self, mock_id):
+        exam = self.exams.get(mock_id)
+        if exam is None or time.time() >= exam.ends_at:
+            return
+        if exam.sessions is None:
+            exam.sessions = await self._sessions(exam)
+        text, markup = await render_mock_question(exam, 0)
+        intro = MOCK_EXAM_INTRO.format(
+            subject=MOCK_EXAM_SUBJECT, total=len(exam.question_ids),
+            minutes=(exam.ends_at - exam.starts_at) // 60
+        )
+        broadcast_engine.start('mock', str(exam.id), intro + text, markup)
+    
+    def save(self, exam, slot):
+        sessions = exam.sessions
+        user_id = sessions.user_ids[slot]
+        self.queue.add('mock_sessions', [
+            exam.id, user_id, sessions.cursor[slot], sessions.score[slot],
+            sessions.bitmap(slot), sessions.finished[slot]
+        ], key=f"{exam.id}/{user_id}")
+    
+    # Score a participant's paper and build their result message
+    def finish(self, exam, slot):
+        sessions = exam.sessions
+        sessions.finished[slot] = 1
+        self.save(exam, slot)
+        score, total = sessions.score[slot], len(exam.question_ids)
+        record_exam_result(sessions.user_ids[slot], MOCK_EXAM_SUBJECT, score, total)
+        percentage = 100 * score / total
+        return RESULT_TEMPLATE.format(
+            subject=MOCK_EXAM_SUBJECT,
+            total_questions=total,
+            score=score,
+            percentage=percentage,
+            motivation=RESULT_LOW_SCORE if percentage < 50 else RESULT_HIGH_SCORE
+        )
+    
+    # Message every participant still sitting the exam
+    async def _notify(self, exam, text):
+        slots = exam.sessions.active()
+        for first in range(0, len(slots), self.chunk):
+            chunk = slots[first:first + self.chunk]
+            await self._room(len(chunk))
+            if self._stopping:
+                return
+            for slot in chunk:
+                outbox.send_message(exam.sessions.user_ids[slot], text, priority=PRIORITY_BULK,
+                                    parse_mode=ParseMode.HTML)
+    
+    def warn(self, mock_id):
+        exam = self.exams.get(mock_id)
+        if exam is not None and exam.sessions is not None and time.time() < exam.ends_at:
+            self._spawn(self._notify(exam, EXAM_WARNING_TEXT))
+    
+    async def _close(self, exam):
+        slots = exam.sessions.active() if exam.sessions is not None else []
+        for first in range(0, len(slots), self.chunk):
+            chunk = slots[first:first + self.chunk]
+            await self._room(len(chunk))
+            if self._stopping:
+                return
+            for slot in chunk:
+                if exam.sessions.finished[slot]:
+                    continue
+                outbox.send_message(
+                    exam.sessions.user_ids[slot],
+                    "⏰ परीक्षेचा वेळ संपला आहे!\n\n" + self.finish(exam, slot),
+                    priority=PRIORITY_BULK,
+                    reply_markup=main_menu_keyboard()
+                )
+        self.exams.pop(exam.id, None)
+        logger.info("Mock exam %d closed", exam.id)
+    
+    def expire(self, mock_id):
+        exam = self.exams.get(mock_id)
+        if exam is not None:
+            self._spawn(self._close(exam))
+    
+    # Stop sending; call before the outbox stops
+    def halt(self):
+        self._stopping = True
+    
+    # Wait for notifications and closing in progress; unfinished sessions
+    # are closed after the next start
+    async def stop(self):
+        self._stopping = True
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+mock_exams = MockExamEngine(db, timer_wheel, write_behind)
+metrics.gauge('policebot_mock_exam_participants', "Participants of running mock exams",
+              lambda: sum(len(exam.sessions.slots) for exam in mock_exams.exams.values() if exam.sessions))
+
+# Next scheduled mock exam start after `now`, or None when they are disabled
+def next_mock_start(now):
+    if not MOCK_EXAM_TIME:
+        return None
+    hour, minute = map(int, MOCK_EXAM_TIME.split(':'))
+    for days_ahead in range(8):
+        candidate = (now + timedelta(days=days_ahead)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        # Job queue numbering: 0 = Sunday
+        if candidate > now and (candidate.weekday() + 1) % 7 in MOCK_EXAM_DAYS:
+            return candidate
+    return None
+
+# Text and keyboard of one mock exam question, the same for every participant
+async def render_mock_question(exam, position):
+    question = await question_store.get(exam.question_ids[position])
+    message = (
+        f"📝 {MOCK_EXAM_SUBJECT} | ⏰ समाप्ती: {datetime.fromtimestamp(exam.ends_at):%H:%M}\n\n"
+        f"प्रश्न {position + 1}/{len(exam.question_ids)}:\n"
+        f"{question['question']}\n\n"
+        "पर्याय:"
+    )
+    return message, mock_question_keyboard(exam.id, position, question['options'])
+
+# Every minute: draw the paper once the next mock exam is within MOCK_EXAM_LEAD
+@timed(JOB_SECONDS)
+async def schedule_mock_exams(context: ContextTypes.DEFAULT_TYPE):
+    starts = next_mock_start(datetime.now())
+    if starts is not None and starts.timestamp() - time.time() <= MOCK_EXAM_LEAD:
+        await mock_exams.prepare(int(starts.timestamp()))
+
+@timed(JOB_SECONDS)
+async def start_mock_exam(context: ContextTypes.DEFAULT_TYPE, mock_id):
+    await mock_exams.start(mock_id)
+
+@timed(JOB_SECONDS)
+async def warn_mock_exam(context: ContextTypes.DEFAULT_TYPE, mock_id):
+    mock_exams.warn(mock_id)
+
+@timed(JOB_SECONDS)
+async def expire_mock_exam(context: ContextTypes.DEFAULT_TYPE, mock_id):
+    mock_exams.expire(mock_id)
+
+TIMER_HANDLERS.update({
+    MOCK_START: start_mock_exam,
+    MOCK_WARNING: warn_mock_exam,
+    MOCK_EXPIRY: expire_mock_exam,
+})
+
+# The running mock exam and the user's slot in it, or None for buttons of
+# an exam that is over (or one this process does not know)
+def mock_exam_slot(mock_id, user_id):
+    exam = mock_exams.exams.get(mock_id)
+    if exam is None or exam.sessions is None or time.time() >= exam.ends_at:
+        return None
+    return exam, exam.sessions.slot(user_id)
+
+# Answer a mock exam question: no feedback, straight on to the next one
+@timed(HANDLER_SECONDS)
+async def handle_mock_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, mock_id, position, answer_index):
+    query = update.callback_query
+    user_id = update.effective_user.id
+    exam, slot = mock_exam_slot(mock_id, user_id) or (None, None)
+    if exam is None or exam.sessions.finished[slot] or exam.sessions.cursor[slot] != position:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
+    await query.answer()
+    sessions = exam.sessions
+    
+    # The first question came with the broadcast, which kept no per-user
+    # time; its message date is when it was sent
+    if position == 0:
+        response_ms = max(0, int((time.time() - query.message.date.timestamp()) * 1000))
+    else:
+        response_ms = response_time_ms(sessions.shown_at[slot])
+    question = await question_store.get(exam.question_ids[position])
+    correct = answer_index == question['correct_answer']
+    record_answer(user_id, question['subject'], question, correct, response_ms)
+    if not correct:
+        save_review(user_id, question['subject'], question['id'], 0, time.time() + REVIEW_INTERVALS[0])
+    sessions.record(slot, correct)
+    
+    chat_id, message_id = update.effective_chat.id, query.message.message_id
+    if sessions.cursor[slot] < len(exam.question_ids):
+        mock_exams.save(exam, slot)
+        message, reply_markup = await render_mock_question(exam, sessions.cursor[slot])
+        sessions.shown_at[slot] = time.monotonic()
+        outbox.edit_message_text(chat_id, message_id, message, priority=PRIORITY_QUESTION, reply_markup=reply_markup)
+    else:
+        outbox.edit_message_text(chat_id, message_id, mock_exams.finish(exam, slot), priority=PRIORITY_QUESTION)
+
+# Hand in a mock exam paper before the time is up
+@timed(HANDLER_SECONDS)
+async def submit_mock_exam(update: Update, context: ContextTypes.DEFAULT_TYPE, mock_id):
+    query = update.callback_query
+    exam, slot = mock_exam_slot(mock_id, update.effective_user.id) or (None, None)
+    if exam is None or exam.sessions.finished[slot]:
+        await query.answer(STALE_BUTTON_TEXT)
+        return
+    await query.answer()
+    outbox.edit_message_text(
+        update.effective_chat.id, query.message.message_id, mock_exams.finish(exam, slot),
+        priority=PRIORITY_QUESTION
+    )
+
+CALLBACK_HANDLERS.update({
+    CB_MOCK_ANSWER: handle_mock_answer,
+    CB_MOCK_SUBMIT: submit_mock_exam,
+})
+
+# Show the user's per-subject statistics and this week's rank
+@timed(HANDLER_SECONDS)
+async def my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    rows = await db.fetchall(
+        "SELECT s.name, t.attempts, t.best_percentage, t.avg_percentage, t.last_attempt "
+        "FROM user_subject_stats t JOIN subjects s ON s.id = t.subject_id "
+        "WHERE t.user_id = ? ORDER BY s.name",
+        (user_id,)
+    )
+    if not rows:
+        await update.message.reply_text(
+            "अद्याप कोणतीही परीक्षा दिलेली नाही. '📝 परीक्षा सुरू करा' वर क्लिक करा!",
+            reply_markup=main_menu_keyboard()
+        )
+        return
+    
+    week = week_key(datetime.now())
+    message = "📈 तुमची प्रगती:\n"
+    for subject, attempts, best, average, last_attempt in rows:
+        message += (
+            f"\n📘 {subject}\n"
+            f"प्रयत्न: {attempts} | सर्वोत्तम: {best:.2f}% | सरासरी: {average:.2f}%\n"
+            f"शेवटची परीक्षा: {last_attempt[:16]}\n"
+        )
+        rank = await leaderboards.rank(subject, week, user_id)
+        if rank:
+            message += f"या आठवड्यातील क्रमांक: {rank[0]}/{rank[1]}\n"
+    await update.message.reply_text(message, reply_markup=main_menu_keyboard())
+
+# Show this week's top scores for every subject
+@timed(HANDLER_SECONDS)
+async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    week = week_key(datetime.now())
+    message = "🏆 या आठवड्याचे अव्वल विद्यार्थी:\n"
+    for subject in [*question_store.subjects(), MOCK_EXAM_SUBJECT]:
+        top = await leaderboards.top(subject, week, limit=5)
+        if not top:
+            continue
+        message += f"\n📘 {subject}\n"
+        for position, (name, percentage) in enumerate(top, start=1):
+            message += f"{position}. {name} - {percentage:.2f}%\n"
+    await update.message.reply_text(message, reply_markup=main_menu_keyboard())
+
 # Show current time and date
+@timed(HANDLER_SECONDS)
 async def show_time_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     now = datetime.now()
     await update.message.reply_text(
@@ -725,6 +4331,7 @@ async def show_time_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # Cancel conversation
+@timed(HANDLER_SECONDS)
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "ऑपरेशन रद्द केले आहे.",
@@ -732,20 +4339,587 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
-# Error handler
-async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Reply-keyboard layout and the handler behind each button. The keyboard
+# and the router are both built from this table.
+MAIN_MENU = (
+    (("📝 परीक्षा सुरू करा", start_exam), ("📘 विषय निवडा", choose_subject)),
+    (("💡 दैनंदिन विचार", daily_thought), ("📰 बातम्या", news_updates)),
+    (("⏰ रिमाइंडर सेट करा", set_reminder), ("🕒 वेळ आणि तारीख", show_time_date)),
+    (("🎯 कमकुवत भागांचा सराव", start_practice), ("🧾 उत्तरपत्रिका परीक्षा", start_answer_sheet)),
+)
+MENU_ROUTES = {label: handler for row in MAIN_MENU for label, handler in row}
+
+# States the menu conversation can move into
+MENU_STATES = (SETTING_REMINDER, SUBMITTING_SHEET)
+
+# Matches a menu button press with a single dict lookup
+class MenuButtonFilter(filters.MessageFilter):
+    def filter(self, message):
+        return message.text in MENU_ROUTES
+
+menu_buttons = MenuButtonFilter(name='MenuButtons')
+
+# Run the handler for a menu button. Only set_reminder and
+# start_answer_sheet open a conversation; anything else ends whatever
+# menu conversation was open.
+async def route_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    state = await MENU_ROUTES[update.message.text](update, context)
+    return state if state in MENU_STATES else ConversationHandler.END
+
+# Error handler. Errors from jobs come without an update, and callback
+# queries have no update.message, so reply through the chat if there is one.
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
+    UPDATE_ERRORS.inc(type(context.error).__name__)
     
     # Send a message to the user
-    await update.message.reply_text(
-        "क्षमस्व, तांत्रिक समस्या आली आहे. कृपया नंतर पुन्हा प्रयत्न करा.",
-        reply_markup=main_menu_keyboard()
+    if isinstance(update, Update) and update.effective_chat:
+        outbox.send_message(
+            update.effective_chat.id,
+            "क्षमस्व, तांत्रिक समस्या आली आहे. कृपया नंतर पुन्हा प्रयत्न करा.",
+            reply_markup=main_menu_keyboard()
+        )
+
+# Request wrapper that times every Bot API call per method and counts
+# failures, whether the call went through the outbox or straight from a
+# handler
+class InstrumentedRequest(BaseRequest):
+    def __init__(self, request):
+        self.request = request
+    
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+    
+    async def initialize(self):
+        await self.request.initialize()
+    
+    async def shutdown(self):
+        await self.request.shutdown()
+    
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await self.request.do_request(url, method, request_data, **timeouts)
+        except Exception:
+            API_ERRORS.inc(api_method)
+            raise
+        finally:
+            API_SECONDS.observe(api_method, time.perf_counter() - start)
+        if code >= 400:
+            API_ERRORS.inc(api_method)
+        return code, payload
+
+# Samples how late a short sleep wakes up; anything above zero is time the
+# loop spent busy with other work
+class LoopLagMonitor:
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last = 0.0
+        self._task = None
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(loop.time() - expected, 0.0)
+            LOOP_LAG.observe(None, self.last)
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+loop_lag = LoopLagMonitor()
+metrics.gauge('policebot_event_loop_lag_last_seconds', "Most recent event loop lag sample", lambda: loop_lag.last)
+
+# Serves GET /metrics in the Prometheus text format on METRICS_LISTEN
+class MetricsServer:
+    def __init__(self, registry, listen=METRICS_LISTEN, port=METRICS_PORT):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._runner = None
+    
+    async def handle_metrics(self, request):
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info("Metrics available on http://%s:%s/metrics", self.listen, self.port)
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics_server = MetricsServer(metrics)
+
+# Seconds spent in each startup stage, including the background ones
+startup_timings = {}
+metrics.gauge('policebot_startup_seconds', "Time spent in each startup stage",
+              lambda: startup_timings, label='stage')
+content_task = None
+
+async def run_stage(name, step, *args):
+    started = time.perf_counter()
+    try:
+        return await step(*args)
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+# Question bank, difficulty estimates and daily content, loaded in the
+# background while updates are already being served. Exams and practice
+# wait on question_store.loaded, which is set even if loading failed so
+# that nothing waits forever.
+async def load_content():
+    try:
+        await run_stage('question_bank', load_question_bank)
+        await run_stage('question_stats', question_difficulty.load)
+        await run_stage('daily_content', load_daily_content)
+    except Exception:
+        logger.exception("Loading content failed")
+    finally:
+        question_store.loaded.set()
+    content_watcher.start()
+    logger.info("Content ready: %s", ", ".join(
+        f"{name} {seconds * 1000:.1f} ms" for name, seconds in startup_timings.items()
+    ))
+
+# Startup pipeline, run once the application is initialized: schema
+# migrations, background writers and the outbox, then sessions, timers
+# and jobs. Content loads in a background task, so the time to serve
+# the first update does not grow with the question bank.
+async def on_startup(application: Application):
+    global content_task
+    if METRICS_ENABLED:
+        metrics.gauge(
+            'policebot_active_exams', "Exams currently in progress",
+            lambda: sum(1 for data in application.user_data.values() if 'question_ids' in data)
+        )
+        loop_lag.start()
+        await metrics_server.start()
+    await run_stage('schema', asyncio.to_thread, migrate_database)
+    await run_stage('write_behind', write_behind.start)
+    content_task = asyncio.create_task(load_content())
+    outbox.start(application.bot)
+    await run_stage('exam_sessions', restore_exam_sessions, application)
+    application.job_queue.run_repeating(run_timer_wheel, interval=TIMER_TICK, first=TIMER_TICK, name="timer_wheel")
+    
+    # Catch up on reminders missed while the bot was down, then keep the window filled
+    await run_stage('reminders', reminder_engine.refresh)
+    application.job_queue.run_repeating(
+        reminder_engine.refresh_job, interval=REMINDER_WINDOW / 2, first=REMINDER_WINDOW / 2, name="reminders"
     )
+    
+    # Finish any broadcast cut short, then push the daily one at BROADCAST_TIME
+    await broadcast_engine.resume()
+    if BROADCAST_TIME:
+        hour, minute = map(int, BROADCAST_TIME.split(':'))
+        local_time = datetime.now().astimezone().timetz()
+        application.job_queue.run_daily(
+            broadcast_daily, local_time.replace(hour=hour, minute=minute, second=0, microsecond=0),
+            name="broadcast"
+        )
+    
+    # Mock exams: pick up running ones, and draw each paper ahead of its start
+    await run_stage('mock_exams', mock_exams.restore)
+    if MOCK_EXAM_TIME:
+        application.job_queue.run_repeating(schedule_mock_exams, interval=60, first=1, name="mock_exams")
 
-# Main function
-def main():
+# Deliver queued messages while the bot can still send them
+async def on_stop(application: Application):
+    broadcast_engine.halt()
+    mock_exams.halt()
+    await outbox.stop()
+    await broadcast_engine.stop()
+    await mock_exams.stop()
+
+# Flush buffered writes and release database resources when the application stops
+async def on_shutdown(application: Application):
+    if content_task is not None and not content_task.done():
+        content_task.cancel()
+        try:
+            await content_task
+        except asyncio.CancelledError:
+            pass
+    await metrics_server.stop()
+    await loop_lag.stop()
+    await content_watcher.stop()
+    await leaderboards.stop()
+    await write_behind.stop()
+    db.close()
+
+# Webhook receiver. Telegram POSTs updates to WEBHOOK_PATH; each one is
+# checked against the secret token and put on the application's bounded
+# update queue. When the queue is full the request is answered with 503
+# so Telegram retries later instead of the bot buffering without limit.
+# /healthz reports liveness, /readyz whether updates are being accepted.
+class WebhookServer:
+    def __init__(self, application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                 path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.rejected = 0
+        self._runner = None
+    
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        app.router.add_get('/readyz', self.handle_ready)
+        return app
+    
+    async def handle_update(self, request):
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), self.secret_token
+        ):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError("update must be an object")
+            accepted = self.accept(data)
+        except (ValueError, TypeError, KeyError):
+            return web.Response(status=400)
+        if not accepted:
+            self.rejected += 1
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        return web.Response()
+    
+    # Hand an update to the application; False when its queue is full
+    def accept(self, data):
+        update = Update.de_json(data, self.application.bot)
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+    
+    async def handle_health(self, request):
+        return web.Response(text="ok")
+    
+    async def handle_ready(self, request):
+        queue = self.application.update_queue
+        if not self.application.running or queue.full():
+            return web.Response(status=503, text="not ready")
+        return web.json_response({'queued': queue.qsize(), 'capacity': queue.maxsize})
+    
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info("Webhook server listening on %s:%s%s", self.listen, self.port, self.path)
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Serve updates through the webhook server until SIGINT/SIGTERM
+async def run_webhook(application: Application):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    server = WebhookServer(application)
+    metrics.gauge('policebot_webhook_rejected_total', "Webhook updates refused with 503",
+                  lambda: server.rejected, kind='counter')
+    await application.initialize()
+    await on_startup(application)
+    await application.start()
+    await server.start()
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+    try:
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        await on_stop(application)
+        await application.shutdown()
+        await on_shutdown(application)
+
+# Sharded deployment. The front process receives the webhook and passes
+# each update, still as JSON, to the worker process that owns its user
+# (user_id % workers), so a user's session state and timers always live
+# in one worker. Workers send every write to a single writer thread in
+# the front process, and only the front imports the question bank.
+
+# The user an update belongs to, falling back to its chat
+def update_user_id(data):
+    for value in data.values():
+        if isinstance(value, dict):
+            for field in ('from', 'user', 'chat'):
+                ident = value.get(field)
+                if isinstance(ident, dict) and 'id' in ident:
+                    return ident['id']
+    return 0
+
+# Single writer for the whole deployment. Workers send every write as a
+# list of (sql, rows) statements, tagged (worker, request_id, batch,
+# isolate); the front applies each batch as one transaction on its own
+# database writer thread, the same one its bank imports use, and answers
+# on that worker's reply queue with (request_id, error, result) once it
+# is committed.
+class ShardWriter:
+    def __init__(self, context, workers, database=db):
+        self.database = database
+        self.requests = context.Queue()
+        self.replies = [context.Queue() for _ in range(workers)]
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="shard-writer", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            worker, request_id, batch, isolate = request
+            apply = apply_statements_isolated if isolate else apply_statements
+            try:
+                result = self.database.run_transaction(functools.partial(apply, batch=batch))
+                error = None
+            except Exception as e:
+                logger.exception("Write batch from worker %s failed", worker)
+                result, error = None, str(e) or type(e).__name__
+            self.replies[worker].put((request_id, error, result))
+    
+    # Called once every worker has exited, so no batch is left unanswered
+    def stop(self):
+        if self._thread:
+            self.requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+# Worker side of the shard writer: the database's remote, through which
+# every write of a worker goes
+class ShardWriterClient:
+    def __init__(self, worker, requests, replies):
+        self.worker = worker
+        self.requests = requests
+        self.replies = replies
+        self._ids = itertools.count()
+        self._waiting = {}
+        self._loop = None
+        self._thread = None
+    
+    def _receive(self):
+        while True:
+            request_id, error, result = self.replies.get()
+            self._loop.call_soon_threadsafe(self._resolve, request_id, error, result)
+    
+    def _resolve(self, request_id, error, result):
+        future = self._waiting.pop(request_id, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(sqlite3.OperationalError(error))
+        else:
+            future.set_result(result)
+    
+    # Commit a batch in the front; returns the last statement's (lastrowid,
+    # rowcount), or with isolate the rows that failed
+    async def write(self, batch, isolate=False):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target=self._receive, name="shard-replies", daemon=True)
+            self._thread.start()
+        request_id = next(self._ids)
+        future = self._waiting[request_id] = self._loop.create_future()
+        self.requests.put((self.worker, request_id, batch, isolate))
+        return await future
+
+# Webhook front: same endpoint as WebhookServer, but an update goes onto
+# its user's worker queue. A full worker queue answers 503.
+class ShardFrontServer(WebhookServer):
+    def __init__(self, inboxes, processes, **kwargs):
+        super().__init__(None, **kwargs)
+        self.inboxes = inboxes
+        self.processes = processes
+    
+    def accept(self, data):
+        inbox = self.inboxes[update_user_id(data) % len(self.inboxes)]
+        try:
+            inbox.put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+    
+    async def handle_ready(self, request):
+        if not all(process.is_alive() for process in self.processes):
+            return web.Response(status=503, text="worker down")
+        if any(inbox.full() for inbox in self.inboxes):
+            return web.Response(status=503, text="not ready")
+        return web.json_response({'workers': len(self.processes)})
+
+# Worker process: serve the updates routed to this shard with a full
+# application of its own
+def run_shard_worker(index, count, inbox, writer_requests, writer_replies):
+    global SHARD_INDEX, SHARD_COUNT, BANK_IMPORTER, outbox
+    configure_logging()
+    SHARD_INDEX, SHARD_COUNT = index, count
+    BANK_IMPORTER = False
+    if write_behind.journal_path:
+        logger.warning("Write-behind journal is not supported in sharded mode, ignoring it")
+        write_behind.journal_path = None
+    db.remote = ShardWriterClient(index, writer_requests, writer_replies)
+    
+    # Telegram's overall limit is per bot, so each worker gets its share
+    outbox = OutboundQueue(global_rate=OUTBOUND_GLOBAL_RATE / count)
+    metrics_server.port = METRICS_PORT + index
+    asyncio.run(serve_shard(build_application(), inbox))
+
+async def serve_shard(application: Application, inbox):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    async def enqueue(data):
+        try:
+            update = Update.de_json(data, application.bot)
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Dropping malformed update")
+            return
+        await application.update_queue.put(update)
+    
+    # Blocking reads from the process queue run on a daemon thread. Waiting
+    # for room on the update queue pushes back on the front, which then
+    # answers 503 once this worker's queue fills up. None means shut down.
+    def pump():
+        while True:
+            data = inbox.get()
+            if data is None:
+                loop.call_soon_threadsafe(stop_event.set)
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(enqueue(data), loop).result()
+            except RuntimeError:
+                return
+    
+    await application.initialize()
+    await on_startup(application)
+    await application.start()
+    threading.Thread(target=pump, name="shard-inbox", daemon=True).start()
+    logger.info("Shard %d/%d ready", SHARD_INDEX, SHARD_COUNT)
+    try:
+        await stop_event.wait()
+    finally:
+        await application.stop()
+        await on_stop(application)
+        await application.shutdown()
+        await on_shutdown(application)
+
+# Front process: import the question bank, start the single writer and
+# the workers, then route webhook updates until SIGINT/SIGTERM. The front
+# is the only process that imports the bank, now and on every reload.
+def run_sharded(workers=SHARD_WORKERS):
+    # Workers then find the schema current and the bank snapshot fresh
+    # instead of racing to migrate and import
+    migrate_database()
+    asyncio.run(load_question_bank())
+    
+    context = multiprocessing.get_context('spawn')
+    writer = ShardWriter(context, workers)
+    inboxes = [context.Queue(SHARD_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(
+            target=run_shard_worker,
+            args=(index, workers, inboxes[index], writer.requests, writer.replies[index]),
+            name=f"shard-{index}"
+        )
+        for index in range(workers)
+    ]
+    writer.start()
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(serve_front(ShardFrontServer(inboxes, processes)))
+    finally:
+        for inbox in inboxes:
+            try:
+                inbox.put(None, timeout=5)
+            except queue.Full:
+                pass
+        for process in processes:
+            process.join(30)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop, terminating it", process.name)
+                process.terminate()
+        # Updates a dead worker never read must not block our exit
+        for inbox in inboxes:
+            inbox.cancel_join_thread()
+        writer.stop()
+        db.close()
+
+async def serve_front(server: ShardFrontServer):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    await server.start()
+    if WEBHOOK_URL:
+        async with build_application().bot as bot:
+            await bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+    content_watcher.start()
+    try:
+        await stop_event.wait()
+    finally:
+        await content_watcher.stop()
+        await server.stop()
+
+# Create the application and register every handler. A custom request
+# object replaces the HTTP client, e.g. a fake Bot API for load tests.
+def build_application(request=None):
     # Create Application
-    application = Application.builder().token("8034142571:AAFEUhf8UEPz0lE6p60wPwcIHzAN09OPjuQ").build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(ChatSerializedProcessor(CONCURRENT_UPDATES))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if METRICS_ENABLED:
+        request = InstrumentedRequest(request or HTTPXRequest(connection_pool_size=256))
+    if request is not None:
+        builder.request(request)
+    if BOT_API_URL:
+        builder.base_url(BOT_API_URL.rstrip('/') + '/bot')
+        builder.base_file_url(BOT_API_URL.rstrip('/') + '/file/bot')
+    application = builder.build()
     
     # Add conversation handler for the start command
     conv_handler = ConversationHandler(
@@ -753,44 +4927,53 @@ def main():
         states={
             0: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_name)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        allow_reentry=True
     )
     
     # Add handlers
     application.add_handler(conv_handler)
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(MessageHandler(filters.Regex("^📝 परीक्षा सुरू करा$"), start_exam))
-    application.add_handler(MessageHandler(filters.Regex("^📘 विषय निवडा$"), 
-                                         lambda update, context: update.message.reply_text(
-                                             "विषय निवडा:", reply_markup=subject_keyboard())))
-    application.add_handler(MessageHandler(filters.Regex("^💡 दैनंदिन विचार$"), daily_thought))
-    application.add_handler(MessageHandler(filters.Regex("^📰 बातम्या$"), news_updates))
-    application.add_handler(MessageHandler(filters.Regex("^⏰ रिमाइंडर सेट करा$"), set_reminder))
-    application.add_handler(MessageHandler(filters.Regex("^🕒 वेळ आणि तारीख$"), show_time_date))
-    
-    # Add callback query handlers
-    application.add_handler(CallbackQueryHandler(select_subject, pattern="^subject_"))
-    application.add_handler(CallbackQueryHandler(main_menu, pattern="^main_menu$"))
-    application.add_handler(CallbackQueryHandler(handle_answer, pattern="^answer_"))
-    application.add_handler(CallbackQueryHandler(exit_exam, pattern="^exit_exam$"))
-    application.add_handler(CallbackQueryHandler(confirm_exit, pattern="^confirm_exit$"))
-    application.add_handler(CallbackQueryHandler(cancel_exit, pattern="^cancel_exit$"))
-    
-    # Add conversation handler for setting reminders
-    reminder_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex("^⏰ रिमाइंडर सेट करा$"), set_reminder)],
+    application.add_handler(CommandHandler("mystats", my_stats))
+    application.add_handler(CommandHandler("leaderboard", show_leaderboard))
+    application.add_handler(CommandHandler("practice", start_practice))
+    
+    # Menu buttons go through one router; the reminder and answer-sheet
+    # buttons (and /sheet) open a conversation that waits for the reminder
+    # text or the answers, and pressing another button while it waits
+    # re-enters the router
+    menu_handler = ConversationHandler(
+        entry_points=[MessageHandler(menu_buttons, route_menu), CommandHandler("sheet", start_answer_sheet)],
         states={
-            SETTING_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_reminder_input)]
+            SETTING_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_reminder_input)],
+            SUBMITTING_SHEET: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_answer_sheet)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        allow_reentry=True
     )
-    application.add_handler(reminder_handler)
+    application.add_handler(menu_handler)
+    
+    # All inline buttons go through one dispatcher
+    application.add_handler(CallbackQueryHandler(dispatch_callback))
     
     # Add error handler
     application.add_error_handler(error_handler)
+    return application
+
+# Main function
+def main():
+    configure_logging()
+    if not BOT_TOKEN:
+        raise SystemExit("POLICE_BOT_TOKEN is not set")
+    if BOT_MODE == 'sharded':
+        run_sharded()
+        return
+    application = build_application()
     
     # Start the Bot
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
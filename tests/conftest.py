@@ -0,0 +1,34 @@
+# The bot reads its settings from the environment at import time, so point
+# it at a throwaway database and a dummy token before any test imports it.
+# Scheduled jobs that would send on their own are turned off.
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('POLICE_BOT_DB', os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('POLICE_BOT_TOKEN', '123456:test')
+os.environ.setdefault('POLICE_BOT_BROADCAST_TIME', '')
+os.environ.setdefault('POLICE_BOT_MOCK_TIME', '')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+# Path of a fresh database with the current schema
+@pytest.fixture
+def db_path(tmp_path):
+    import srcpython as bot
+    path = str(tmp_path / 'bot.db')
+    bot.migrate_database(path)
+    return path
+
+# Build a write-behind queue for `database` with every stream the bot registers
+@pytest.fixture
+def make_write_behind():
+    import srcpython as bot
+    def make(database, **kwargs):
+        writes = bot.WriteBehindQueue(database, **kwargs)
+        for stream, (sql, keyed, durable) in bot.write_behind._statements.items():
+            writes.register(stream, sql, keyed=keyed, durable=durable)
+        return writes
+    return make
@@ -0,0 +1,56 @@
+# Answer-sheet parsing and grading
+import pytest
+
+import srcpython as bot
+
+A, B, C, D, E = range(5)
+BLANK = None
+
+def parsed(text, length):
+    result = bot.parse_answer_sheet(text, length)
+    if result is None:
+        return None
+    sheet, ignored = result
+    return [None if choice == bot.SHEET_BLANK else choice for choice in sheet], ignored
+
+@pytest.mark.parametrize('text, length, expected', [
+    # Numbered entries, with or without separators
+    ("1A 2C 3B", 3, ([A, C, B], 0)),
+    ("1-A 2.C 3:B 4)D 5=E", 5, ([A, C, B, D, E], 0)),
+    ("1. A, 2) b, 3 c", 3, ([A, B, C], 0)),
+    ("3B 1A", 3, ([A, BLANK, B], 0)),
+    ("10C 1A", 10, ([A] + [BLANK] * 8 + [C], 0)),
+    # A later entry for the same question wins
+    ("1A 1B", 2, ([B, BLANK], 0)),
+    # Devanagari digits and option letters
+    ("१अ २ब ३क ४ड", 4, ([A, B, C, D], 0)),
+    ("1 क 2 अ", 2, ([C, A], 0)),
+    # Compact: one letter per question in order, "-" for a blank
+    ("ACBD", 4, ([A, C, B, D], 0)),
+    ("a-cd", 4, ([A, BLANK, C, D], 0)),
+    ("A, B; C", 3, ([A, B, C], 0)),
+    ("अबकड", 4, ([A, B, C, D], 0)),
+    ("AC", 4, ([A, C, BLANK, BLANK], 0)),
+    # Answers beyond the paper are counted, not applied
+    ("1A 5B", 3, ([A, BLANK, BLANK], 1)),
+    ("ACEB", 3, ([A, C, E], 1)),
+])
+def test_parse(text, length, expected):
+    assert parsed(text, length) == expected
+
+@pytest.mark.parametrize('text', [
+    "",
+    "उत्तरे माहीत नाहीत",
+    "---",
+    "5B",
+    # G is past the compact letters
+    "AGB",
+])
+def test_unreadable_sheets(text):
+    assert bot.parse_answer_sheet(text, 3) is None
+
+def test_grading_marks_each_question():
+    sheet, _ = bot.parse_answer_sheet("1A 2C 4D 5B", 5)
+    key = bytes([A, B, C, D, B])
+    assert bot.grade_sheet(sheet, key) == bytes([1, 0, 0, 1, 1])
+    assert sum(bot.grade_sheet(sheet, key)) == 3
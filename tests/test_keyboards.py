@@ -0,0 +1,32 @@
+# Shared question keyboards and the server-side check of their buttons
+from array import array
+
+import srcpython as bot
+
+OPTIONS = ["एक", "दोन", "तीन", "चार"]
+
+def buttons(markup):
+    return [bot.decode_callback(row[0].callback_data) for row in markup.inline_keyboard]
+
+def test_one_markup_per_question_for_every_exam():
+    assert bot.question_keyboard(901, OPTIONS) is bot.question_keyboard(901, OPTIONS)
+    assert bot.question_keyboard(901, OPTIONS) is not bot.question_keyboard(902, OPTIONS)
+    assert bot.question_keyboard(901, OPTIONS) is not bot.question_keyboard(901, OPTIONS, practice=True)
+
+def test_buttons_carry_the_question_id():
+    assert buttons(bot.question_keyboard(903, OPTIONS)) == [
+        (bot.CB_ANSWER, [903, 0]), (bot.CB_ANSWER, [903, 1]),
+        (bot.CB_ANSWER, [903, 2]), (bot.CB_ANSWER, [903, 3]),
+        (bot.CB_EXIT, [903]),
+    ]
+    assert buttons(bot.question_keyboard(903, OPTIONS, practice=True))[-1] == (bot.CB_PRACTICE_STOP, [903])
+
+def test_current_question_id_follows_the_cursor():
+    user_data = {'question_ids': array('q', [5, 7, 9]), 'current_question': 0}
+    assert bot.current_question_id(user_data) == 5
+    user_data['current_question'] = 2
+    assert bot.current_question_id(user_data) == 9
+    # Finished, or no exam at all: every exam button is stale
+    user_data['current_question'] = 3
+    assert bot.current_question_id(user_data) is None
+    assert bot.current_question_id({}) is None
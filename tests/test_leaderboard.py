@@ -0,0 +1,60 @@
+# Weekly leaderboard cache against a real database and write-behind buffer
+import asyncio
+
+import srcpython as bot
+
+SUBJECT = bot.SUBJECTS[0]
+WEEK = '2026-W42'
+
+def run_with_cache(db_path, make_write_behind, scenario):
+    async def main():
+        database = bot.Database(db_path)
+        writes = make_write_behind(database, journal_path='')
+        try:
+            return await scenario(bot.LeaderboardCache(database, writes), writes)
+        finally:
+            database.close()
+    return asyncio.run(asyncio.wait_for(main(), 10))
+
+def test_concurrent_results_on_an_unloaded_board_are_all_kept(db_path, make_write_behind):
+    async def scenario(cache, writes):
+        await asyncio.gather(*(cache.record(SUBJECT, WEEK, user_id, 50.0 + user_id) for user_id in range(5)))
+        return [await cache.rank(SUBJECT, WEEK, user_id) for user_id in range(5)]
+
+    assert run_with_cache(db_path, make_write_behind, scenario) == [(5 - user_id, 5) for user_id in range(5)]
+
+# As record_exam_result() does: the result is buffered and the board
+# update queued, then the user asks for their rank straight away
+def test_rank_right_after_a_result_sees_it(db_path, make_write_behind):
+    async def scenario(cache, writes):
+        writes.add('leaderboard', [SUBJECT, WEEK, 1, 80.0, '2026-10-12 10:00:00'])
+        cache.add(SUBJECT, WEEK, 1, 80.0)
+        rank = await cache.rank(SUBJECT, WEEK, 1)
+        await cache.stop()
+        return rank
+
+    assert run_with_cache(db_path, make_write_behind, scenario) == (1, 1)
+
+def test_load_includes_committed_and_buffered_results(db_path, make_write_behind):
+    async def scenario(cache, writes):
+        writes.add('leaderboard', [SUBJECT, WEEK, 1, 90.0, '2026-10-12 10:00:00'])
+        await writes.flush()
+        # Still buffered: a better score for user 1 and a first one for user 2
+        writes.add('leaderboard', [SUBJECT, WEEK, 1, 95.0, '2026-10-13 10:00:00'])
+        writes.add('leaderboard', [SUBJECT, WEEK, 2, 70.0, '2026-10-13 11:00:00'])
+        # Other boards are not mixed in
+        writes.add('leaderboard', [SUBJECT, '2026-W41', 3, 100.0, '2026-10-06 10:00:00'])
+        writes.add('leaderboard', [bot.SUBJECTS[1], WEEK, 4, 100.0, '2026-10-13 10:00:00'])
+        return [await cache.rank(SUBJECT, WEEK, user_id) for user_id in (1, 2, 3, 4)]
+
+    assert run_with_cache(db_path, make_write_behind, scenario) == [(1, 2), (2, 2), None, None]
+
+def test_lower_score_does_not_replace_the_best(db_path, make_write_behind):
+    async def scenario(cache, writes):
+        await cache.record(SUBJECT, WEEK, 1, 60.0)
+        await cache.record(SUBJECT, WEEK, 2, 70.0)
+        await cache.record(SUBJECT, WEEK, 1, 80.0)
+        await cache.record(SUBJECT, WEEK, 1, 10.0)
+        return await cache.rank(SUBJECT, WEEK, 1), await cache.rank(SUBJECT, WEEK, 2)
+
+    assert run_with_cache(db_path, make_write_behind, scenario) == ((1, 2), (2, 2))
@@ -0,0 +1,143 @@
+# Schema migrations from a database as it was before schema versioning
+import calendar
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import srcpython as bot
+
+USERS = [
+    (1, 'ramesh', 'रमेश', 'पुरुष', '2026-01-05 08:00:00'),
+    (2, 'sita', 'सीता', 'स्त्री', '2026-01-06 09:00:00'),
+    (3, None, 'Alex', 'इतर', '2026-01-07 10:00:00'),
+    (4, 'nogender', 'चार', None, '2026-01-08 11:00:00'),
+]
+# (user_id, subject, score, total_questions, exam_date)
+PROGRESS = [
+    (1, "मराठी", 8, 10, '2026-10-12 10:00:00'),
+    (1, "मराठी", 9, 10, '2026-10-13 10:00:00'),
+    (1, "गणित", 3, 10, '2026-10-14 10:00:00'),
+    (2, "मराठी", 10, 10, '2026-10-05 12:30:00'),
+    (2, "जुना विषय", 5, 10, '2026-09-01 07:15:00'),
+    (3, "गणित", None, 10, '2026-10-15 18:00:00'),
+    (None, "मराठी", 5, 10, '2026-10-12 10:00:00'),
+    (4, None, 5, 10, '2026-10-12 10:00:00'),
+]
+REMINDERS = [
+    (1, "अभ्यास", '2026-10-18 09:00:00'),
+    (2, "व्यायाम", '2026-10-19 06:00:00'),
+]
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    # The original tables, without schema_version
+    conn.execute(
+        "CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, full_name TEXT, "
+        "gender TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.execute(
+        "CREATE TABLE user_progress (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+        "subject TEXT, score INTEGER, total_questions INTEGER, "
+        "exam_date DATETIME DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users (user_id))"
+    )
+    conn.execute(
+        "CREATE TABLE reminders (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+        "reminder_text TEXT, reminder_time DATETIME, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+        "FOREIGN KEY (user_id) REFERENCES users (user_id))"
+    )
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)", USERS)
+    conn.executemany(
+        "INSERT INTO user_progress (user_id, subject, score, total_questions, exam_date) VALUES (?, ?, ?, ?, ?)",
+        PROGRESS
+    )
+    conn.executemany("INSERT INTO reminders (user_id, reminder_text, reminder_time) VALUES (?, ?, ?)", REMINDERS)
+    conn.commit()
+    conn.close()
+    return path
+
+def query(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        return list(conn.iterdump())
+    finally:
+        conn.close()
+
+def epoch(text):
+    return calendar.timegm(datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timetuple())
+
+def test_legacy_database_reaches_the_current_schema(legacy_db):
+    assert bot.migrate_database(legacy_db) == len(bot.MIGRATIONS)
+    assert query(legacy_db, "SELECT version FROM schema_version") == [(len(bot.MIGRATIONS),)]
+
+def test_users_keep_their_rows_and_gender_becomes_a_code(legacy_db):
+    bot.migrate_database(legacy_db)
+    assert query(legacy_db, "SELECT user_id, username, full_name, gender, created_at FROM users ORDER BY user_id") == [
+        (1, 'ramesh', 'रमेश', bot.GENDER_MALE, '2026-01-05 08:00:00'),
+        (2, 'sita', 'सीता', bot.GENDER_FEMALE, '2026-01-06 09:00:00'),
+        (3, None, 'Alex', bot.GENDER_OTHER, '2026-01-07 10:00:00'),
+        (4, 'nogender', 'चार', bot.GENDER_OTHER, '2026-01-08 11:00:00'),
+    ]
+
+def test_results_get_subject_ids_and_epoch_dates(legacy_db):
+    bot.migrate_database(legacy_db)
+    subjects = dict(query(legacy_db, "SELECT name, id FROM subjects"))
+    # Every known subject, plus those only found in old results
+    assert set(bot.SUBJECTS) | {"जुना विषय", bot.MOCK_EXAM_SUBJECT} == set(subjects)
+    rows = query(
+        legacy_db,
+        "SELECT p.user_id, s.name, p.score, p.total_questions, p.exam_date "
+        "FROM user_progress p JOIN subjects s ON s.id = p.subject_id ORDER BY p.id"
+    )
+    # Results without a user or subject are dropped, a missing score is 0
+    assert rows == [
+        (user_id, subject, score or 0, total, epoch(exam_date))
+        for user_id, subject, score, total, exam_date in PROGRESS
+        if user_id is not None and subject is not None
+    ]
+
+def test_aggregates_and_leaderboard_are_built_from_results(legacy_db):
+    bot.migrate_database(legacy_db)
+    stats = query(
+        legacy_db,
+        "SELECT t.user_id, s.name, t.attempts, t.best_percentage FROM user_subject_stats t "
+        "JOIN subjects s ON s.id = t.subject_id ORDER BY t.user_id, s.name"
+    )
+    assert stats == [
+        (1, "गणित", 1, 30.0), (1, "मराठी", 2, 90.0),
+        (2, "जुना विषय", 1, 50.0), (2, "मराठी", 1, 100.0),
+        (3, "गणित", 1, 0.0),
+    ]
+    board = query(
+        legacy_db,
+        "SELECT s.name, l.week, l.user_id, l.best_percentage, l.achieved_at FROM leaderboard l "
+        "JOIN subjects s ON s.id = l.subject_id WHERE l.user_id = 1 AND s.name = 'मराठी'"
+    )
+    best = datetime.fromtimestamp(epoch('2026-10-13 10:00:00'))
+    assert board == [("मराठी", bot.week_key(best), 1, 90.0, best.strftime('%Y-%m-%d %H:%M:%S'))]
+
+def test_reminders_are_kept_and_pending(legacy_db):
+    bot.migrate_database(legacy_db)
+    assert query(legacy_db, "SELECT user_id, reminder_text, reminder_time, status FROM reminders ORDER BY id") == [
+        (user_id, text, when, bot.REMINDER_PENDING) for user_id, text, when in REMINDERS
+    ]
+
+def test_running_again_changes_nothing(legacy_db):
+    bot.migrate_database(legacy_db)
+    before = dump(legacy_db)
+    assert bot.migrate_database(legacy_db) == len(bot.MIGRATIONS)
+    assert dump(legacy_db) == before
+
+def test_fresh_database_gets_the_same_tables(legacy_db, db_path):
+    bot.migrate_database(legacy_db)
+    tables = "SELECT name FROM sqlite_master WHERE type IN ('table', 'index') ORDER BY name"
+    assert query(legacy_db, tables) == query(db_path, tables)
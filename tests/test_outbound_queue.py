@@ -0,0 +1,193 @@
+# OutboundQueue against a fake bot that records every call instead of
+# talking to Telegram
+import asyncio
+import time
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import srcpython as bot
+
+class FakeBot:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self.failures = {}
+
+    # Make the next `count` calls for a chat raise `error`
+    def fail(self, chat_id, error, count=1):
+        self.failures[chat_id] = [error] * count
+
+    async def _call(self, method, chat_id, **params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        pending = self.failures.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.calls.append((method, chat_id, params.get('text'), time.monotonic()))
+        return {'method': method, 'chat_id': chat_id, 'text': params.get('text')}
+
+    async def send_message(self, chat_id, **params):
+        return await self._call('send_message', chat_id, **params)
+
+    async def edit_message_text(self, chat_id, **params):
+        return await self._call('edit_message_text', chat_id, **params)
+
+def unlimited(fake, **kwargs):
+    kwargs.setdefault('global_rate', 1e6)
+    kwargs.setdefault('chat_rate', 1e6)
+    kwargs.setdefault('chat_burst', 1e6)
+    return bot.OutboundQueue(fake, **kwargs)
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+def test_each_chat_receives_its_messages_in_order():
+    async def scenario():
+        fake = FakeBot(latency=0.001)
+        outbox = unlimited(fake)
+        outbox.start()
+        futures = [
+            outbox.send_message(chat_id, f"{chat_id}-{n}")
+            for n in range(20) for chat_id in (1, 2, 3)
+        ]
+        await asyncio.gather(*futures)
+        await outbox.stop()
+        return fake, outbox
+
+    fake, outbox = run(scenario())
+    for chat_id in (1, 2, 3):
+        texts = [text for _, chat, text, _ in fake.calls if chat == chat_id]
+        assert texts == [f"{chat_id}-{n}" for n in range(20)]
+    assert outbox.metrics['sent'] == 60
+    assert outbox.depth == 0
+
+def test_higher_priority_goes_first():
+    async def scenario():
+        fake = FakeBot()
+        outbox = unlimited(fake, concurrency=1)
+        bulk = outbox.send_message(1, "bulk", priority=bot.PRIORITY_BULK)
+        feedback = outbox.send_message(2, "feedback", priority=bot.PRIORITY_FEEDBACK)
+        question = outbox.send_message(3, "question", priority=bot.PRIORITY_QUESTION)
+        outbox.start()
+        await asyncio.gather(bulk, feedback, question)
+        await outbox.stop()
+        return fake
+
+    fake = run(scenario())
+    assert [text for _, _, text, _ in fake.calls] == ["question", "feedback", "bulk"]
+
+def test_queued_edits_of_one_message_coalesce():
+    async def scenario():
+        fake = FakeBot()
+        outbox = unlimited(fake)
+        first = outbox.edit_message_text(1, 10, "first")
+        second = outbox.edit_message_text(1, 10, "second")
+        other = outbox.edit_message_text(1, 11, "other message")
+        last = outbox.edit_message_text(1, 10, "last")
+        outbox.start()
+        results = await asyncio.gather(first, second, other, last)
+        await outbox.stop()
+        return fake, outbox, results
+
+    fake, outbox, results = run(scenario())
+    assert [text for _, _, text, _ in fake.calls] == ["other message", "last"]
+    assert results[0] is None and results[1] is None
+    assert results[3]['text'] == "last"
+    assert outbox.metrics['coalesced'] == 2
+
+def test_per_chat_rate_limit_spaces_messages():
+    async def scenario():
+        fake = FakeBot()
+        outbox = bot.OutboundQueue(fake, global_rate=1e6, chat_rate=20, chat_burst=1)
+        outbox.start()
+        await asyncio.gather(*(outbox.send_message(1, str(n)) for n in range(4)))
+        await outbox.stop()
+        return fake
+
+    fake = run(scenario())
+    times = [at for *_, at in fake.calls]
+    # One message per 50 ms after the first
+    assert times[-1] - times[0] >= 0.14
+
+def test_retry_after_resends_the_same_message():
+    async def scenario():
+        fake = FakeBot()
+        fake.fail(1, RetryAfter(0.05))
+        outbox = unlimited(fake)
+        outbox.start()
+        result = await outbox.send_message(1, "hello")
+        await outbox.stop()
+        return fake, outbox, result
+
+    fake, outbox, result = run(scenario())
+    assert result['text'] == "hello"
+    assert [text for _, _, text, _ in fake.calls] == ["hello"]
+    assert outbox.metrics['retried'] == 1
+    assert outbox.metrics['errors'] == 0
+
+def test_errors_reach_the_caller_and_do_not_block_the_chat():
+    async def scenario():
+        fake = FakeBot()
+        fake.fail(1, Forbidden("bot was blocked by the user"))
+        outbox = unlimited(fake)
+        outbox.start()
+        blocked = outbox.send_message(1, "lost")
+        after = outbox.send_message(1, "delivered")
+        with pytest.raises(Forbidden):
+            await blocked
+        result = await after
+        await outbox.stop()
+        return outbox, result
+
+    outbox, result = run(scenario())
+    assert result['text'] == "delivered"
+    assert outbox.metrics['errors'] == 1
+
+def test_unchanged_edit_is_not_an_error():
+    async def scenario():
+        fake = FakeBot()
+        fake.fail(1, BadRequest("Message is not modified"))
+        outbox = unlimited(fake)
+        outbox.start()
+        result = await outbox.edit_message_text(1, 10, "same")
+        await outbox.stop()
+        return outbox, result
+
+    outbox, result = run(scenario())
+    assert result is None
+    assert outbox.metrics['errors'] == 0
+
+def test_cosmetic_messages_are_dropped_when_full():
+    async def scenario():
+        fake = FakeBot()
+        outbox = unlimited(fake, max_pending=1)
+        kept = outbox.send_message(1, "question", priority=bot.PRIORITY_QUESTION)
+        dropped = outbox.edit_message_text(2, 10, "cosmetic")
+        assert dropped.done() and dropped.result() is None
+        # Questions are never dropped, however full the queue is
+        also_kept = outbox.send_message(3, "question 2", priority=bot.PRIORITY_QUESTION)
+        outbox.start()
+        await asyncio.gather(kept, also_kept)
+        await outbox.stop()
+        return fake, outbox
+
+    fake, outbox = run(scenario())
+    assert sorted(text for _, _, text, _ in fake.calls) == ["question", "question 2"]
+    assert outbox.metrics['dropped'] == 1
+
+def test_stop_resolves_what_was_never_sent():
+    async def scenario():
+        fake = FakeBot()
+        outbox = bot.OutboundQueue(fake, global_rate=1e6, chat_rate=0.01, chat_burst=1)
+        outbox.start()
+        sent = outbox.send_message(1, "first")
+        waiting = outbox.send_message(1, "second")
+        await sent
+        await outbox.stop(timeout=0.1)
+        return outbox, waiting
+
+    outbox, waiting = run(scenario())
+    assert waiting.done() and waiting.result() is None
+    assert outbox.metrics['dropped'] == 1
+    assert outbox.depth == 0
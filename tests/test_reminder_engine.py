@@ -0,0 +1,49 @@
+# Reminder engine against a real database, timer wheel and write-behind buffer
+import asyncio
+from datetime import datetime, timedelta
+
+import srcpython as bot
+
+def run_with_engine(db_path, make_write_behind, scenario):
+    async def main():
+        database = bot.Database(db_path)
+        writes = make_write_behind(database, journal_path='')
+        engine = bot.ReminderEngine(database, bot.TimerWheel(), writes)
+        try:
+            return await scenario(engine, database, writes)
+        finally:
+            database.close()
+    return asyncio.run(asyncio.wait_for(main(), 10))
+
+def due_reminders(engine):
+    return [payload[0] for _, payload in engine.wheel.advance(datetime.now().timestamp() + 5)]
+
+def test_delivered_reminder_is_not_scheduled_again_before_its_status_is_written(db_path, make_write_behind):
+    async def scenario(engine, database, writes):
+        reminder_id = await database.add_reminder(1, 1, "अभ्यास", datetime.now() - timedelta(minutes=1))
+        assert await engine.refresh() == 1
+        assert due_reminders(engine) == [reminder_id]
+        engine.mark(reminder_id, bot.REMINDER_SENT)
+        
+        # The status update is still buffered, so the row reads as pending
+        assert await engine.refresh() == 0
+        assert due_reminders(engine) == []
+        
+        await writes.flush()
+        assert await engine.refresh() == 0
+        assert reminder_id not in engine._scheduled
+        return await database.fetchone("SELECT status FROM reminders WHERE id = ?", (reminder_id,))
+
+    assert run_with_engine(db_path, make_write_behind, scenario) == (bot.REMINDER_SENT,)
+
+def test_refresh_picks_up_only_the_window(db_path, make_write_behind):
+    async def scenario(engine, database, writes):
+        now = datetime.now()
+        soon = await database.add_reminder(1, 1, "लवकर", now + timedelta(seconds=engine.window / 2))
+        await database.add_reminder(1, 1, "नंतर", now + timedelta(seconds=engine.window * 2))
+        added = await engine.refresh()
+        return added, soon, set(engine._scheduled)
+
+    added, soon, scheduled = run_with_engine(db_path, make_write_behind, scenario)
+    assert added == 1
+    assert scheduled == {soon}
@@ -0,0 +1,52 @@
+# Reminder text parsing. The phrasing corpus is shared with
+# `python bench.py reminders`, which times the same parser.
+from datetime import datetime, timedelta
+
+import pytest
+
+import srcpython as bot
+from bench import REMINDER_CORPUS, REMINDER_NOW
+
+def resolved(text, now=REMINDER_NOW):
+    return bot.parse_reminder_time(text, now).strftime('%Y-%m-%d %H:%M')
+
+@pytest.mark.parametrize('text, expected', REMINDER_CORPUS)
+def test_corpus(text, expected):
+    assert resolved(text) == expected
+
+@pytest.mark.parametrize('devanagari, ascii', [
+    ("९:३० वाजता", "9:30 वाजता"),
+    ("उद्या सकाळी ७ वाजता", "उद्या सकाळी 7 वाजता"),
+    ("४५ मिनिटांनी", "45 मिनिटांनी"),
+])
+def test_devanagari_and_ascii_digits_agree(devanagari, ascii):
+    assert bot.parse_reminder_spec(devanagari) == bot.parse_reminder_spec(ascii)
+
+def test_spec_does_not_depend_on_the_current_time():
+    # The cached spec is resolved against each call's own `now`
+    text = "५ वाजता"
+    assert resolved(text, datetime(2026, 10, 17, 10, 30)) == "2026-10-17 17:00"
+    assert resolved(text, datetime(2026, 10, 17, 4, 0)) == "2026-10-17 05:00"
+    assert resolved(text, datetime(2026, 10, 17, 18, 0)) == "2026-10-18 05:00"
+
+def test_offsets_add_up():
+    assert resolved("१ तास ३० मिनिटांनी") == "2026-10-17 12:00"
+    assert resolved("उद्या २ तासांनी") == "2026-10-18 12:30"
+
+def test_weekday_already_past_today_moves_a_week():
+    # REMINDER_NOW is a Saturday
+    assert resolved("शनिवारी सकाळी ९ वाजता") == "2026-10-24 09:00"
+    assert resolved("शनिवारी संध्याकाळी ७ वाजता") == "2026-10-17 19:00"
+
+def test_impossible_clock_times_are_ignored():
+    # No usable time at all falls back to an hour from now
+    assert resolved("२५:०० वाजता") == "2026-10-17 11:30"
+    assert resolved("उद्या ९:७५") == "2026-10-18 09:00"
+
+def test_reminders_are_never_in_the_past():
+    texts = [text for text, _ in REMINDER_CORPUS]
+    start = datetime(2026, 10, 17)
+    for step in range(0, 24 * 60, 17):
+        now = start + timedelta(minutes=step)
+        for text in texts:
+            assert bot.parse_reminder_time(text, now) > now, (text, now)
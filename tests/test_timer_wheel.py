@@ -0,0 +1,81 @@
+# Timer wheel scheduling, cancelling and catching up on missed deadlines
+import time
+
+import srcpython as bot
+
+T0 = 1_000_000.0
+
+def wheel(size=8):
+    timers = bot.TimerWheel(tick=1.0, size=size)
+    assert timers.advance(T0) == []
+    return timers
+
+def test_entry_fires_on_its_tick_and_only_once():
+    timers = wheel()
+    timers.schedule('a', T0 + 3.5, 'payload')
+    assert len(timers) == 1
+    assert timers.advance(T0 + 2.9) == []
+    assert timers.advance(T0 + 3.0) == [('a', 'payload')]
+    assert len(timers) == 0
+    assert timers.advance(T0 + 4.0) == []
+
+def test_entries_due_together_fire_in_one_batch():
+    timers = wheel()
+    timers.schedule('a', T0 + 2, 1)
+    timers.schedule('b', T0 + 2.7, 2)
+    timers.schedule('c', T0 + 5, 3)
+    assert sorted(timers.advance(T0 + 2)) == [('a', 1), ('b', 2)]
+    assert timers.advance(T0 + 5) == [('c', 3)]
+
+def test_rescheduling_replaces_the_entry():
+    timers = wheel()
+    timers.schedule('a', T0 + 2, 'old')
+    timers.schedule('a', T0 + 4, 'new')
+    assert len(timers) == 1
+    assert timers.advance(T0 + 3) == []
+    assert timers.advance(T0 + 4) == [('a', 'new')]
+
+def test_cancelled_entry_never_fires():
+    timers = wheel()
+    timers.schedule('a', T0 + 2, 1)
+    timers.schedule('b', T0 + 2, 2)
+    timers.cancel('a')
+    # Cancelling twice, or something never scheduled, is harmless
+    timers.cancel('a')
+    timers.cancel('missing')
+    assert len(timers) == 1
+    assert timers.advance(T0 + 10) == [('b', 2)]
+
+def test_deadline_beyond_one_turn_waits_for_its_own_turn():
+    timers = wheel(size=8)
+    timers.schedule('late', T0 + 20, 'x')
+    # Its slot comes round at +4 and +12 first
+    assert timers.advance(T0 + 4) == []
+    assert timers.advance(T0 + 12) == []
+    assert timers.advance(T0 + 20) == [('late', 'x')]
+
+def test_missed_ticks_are_caught_up():
+    timers = wheel(size=8)
+    timers.schedule('a', T0 + 1, 1)
+    timers.schedule('b', T0 + 6, 2)
+    timers.schedule('c', T0 + 30, 3)
+    # The loop was busy for more than a whole turn of the wheel
+    assert sorted(timers.advance(T0 + 25)) == [('a', 1), ('b', 2)]
+    assert timers.advance(T0 + 30) == [('c', 3)]
+
+def test_deadline_already_past_fires_on_the_next_tick():
+    timers = wheel()
+    timers.schedule('overdue', T0 - 3600, 'x')
+    assert timers.advance(T0 + 1) == [('overdue', 'x')]
+
+# As restore_exam_sessions() does after a restart: a fresh wheel is given
+# deadlines that passed while the bot was down
+def test_fresh_wheel_fires_deadlines_missed_while_down():
+    timers = bot.TimerWheel()
+    now = time.time()
+    timers.schedule(('exam_expiry', 1), now - 3600, (1, 1))
+    timers.schedule(('exam_warning', 1), now - 4200, (1, 1))
+    timers.schedule(('exam_expiry', 2), now + 3600, (2, 2))
+    due = timers.advance(now + timers.tick)
+    assert sorted(key for key, _ in due) == [('exam_expiry', 1), ('exam_warning', 1)]
+    assert len(timers) == 1
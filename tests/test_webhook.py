@@ -0,0 +1,173 @@
+# WebhookServer fed synthetic Update JSON the way Telegram POSTs it
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+from telegram.request import BaseRequest
+
+import srcpython as bot
+
+SECRET = 'test-secret'
+
+# Bot API stand-in that answers every call and records which methods were called
+class FakeRequest(BaseRequest):
+    def __init__(self):
+        self.calls = []
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        endpoint = url.rsplit('/', 1)[1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, params))
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'test', 'username': 'test_bot'}
+        elif endpoint == 'sendMessage':
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': params.get('text', '')
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+_update_ids = itertools.count(1)
+
+def message_update(user_id, text):
+    payload = {
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': next(_update_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Examinee'},
+            'text': text
+        }
+    }
+    if text.startswith('/'):
+        payload['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return payload
+
+# Run `scenario(server, client, request)` against a webhook server that is
+# served in-process but whose application is never started
+def with_client(scenario, secret_token=SECRET):
+    async def main():
+        request = FakeRequest()
+        application = bot.build_application(request=request)
+        server = bot.WebhookServer(application, path='/telegram', secret_token=secret_token)
+        async with TestClient(TestServer(server.make_app())) as client:
+            return await scenario(server, client, request)
+    return asyncio.run(asyncio.wait_for(main(), 30))
+
+def post(client, payload, secret=SECRET, **kwargs):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret is not None else {}
+    if payload is not None:
+        kwargs['json'] = payload
+    return client.post('/telegram', headers=headers, **kwargs)
+
+def test_valid_update_is_queued():
+    async def scenario(server, client, request):
+        payload = message_update(42, "/start")
+        response = await post(client, payload)
+        assert response.status == 200
+        queue = server.application.update_queue
+        assert queue.qsize() == 1
+        update = queue.get_nowait()
+        assert isinstance(update, Update)
+        assert update.update_id == payload['update_id']
+        assert update.effective_user.id == 42
+        assert update.message.text == "/start"
+
+    with_client(scenario)
+
+def test_wrong_or_missing_secret_is_forbidden():
+    async def scenario(server, client, request):
+        assert (await post(client, message_update(42, "hi"), secret='wrong')).status == 403
+        assert (await post(client, message_update(42, "hi"), secret=None)).status == 403
+        assert server.application.update_queue.empty()
+
+    with_client(scenario)
+
+def test_secret_is_not_checked_when_unset():
+    async def scenario(server, client, request):
+        assert (await post(client, message_update(42, "hi"), secret=None)).status == 200
+
+    with_client(scenario, secret_token='')
+
+def test_malformed_body_is_rejected():
+    async def scenario(server, client, request):
+        assert (await post(client, None, data=b'{not json')).status == 400
+        assert (await post(client, [1, 2, 3])).status == 400
+        assert (await post(client, "update")).status == 400
+        assert server.application.update_queue.empty()
+        assert server.rejected == 0
+
+    with_client(scenario)
+
+def test_full_queue_answers_503():
+    async def scenario(server, client, request):
+        queue = server.application.update_queue
+        while not queue.full():
+            queue.put_nowait(object())
+        response = await post(client, message_update(42, "hi"))
+        assert response.status == 503
+        assert response.headers['Retry-After'] == '1'
+        assert server.rejected == 1
+        assert queue.qsize() == queue.maxsize
+        assert (await client.get('/readyz')).status == 503
+
+    with_client(scenario)
+
+def test_health_and_readiness():
+    async def scenario(server, client, request):
+        response = await client.get('/healthz')
+        assert response.status == 200
+        assert await response.text() == "ok"
+        # Not ready until the application is running
+        assert (await client.get('/readyz')).status == 503
+
+    with_client(scenario)
+
+# Full path: the update goes through the webhook, the running application
+# and the /start handler, which answers through the Bot API. Shutting the
+# application down closes the module's database, so this runs last.
+def test_start_command_is_answered():
+    async def main():
+        request = FakeRequest()
+        application = bot.build_application(request=request)
+        server = bot.WebhookServer(application, path='/telegram', secret_token=SECRET)
+        await application.initialize()
+        await bot.on_startup(application)
+        await application.start()
+        try:
+            async with TestClient(TestServer(server.make_app())) as client:
+                response = await client.get('/readyz')
+                assert response.status == 200
+                assert (await response.json())['capacity'] == application.update_queue.maxsize
+                assert (await post(client, message_update(4242, "/start"))).status == 200
+                await asyncio.wait_for(application.update_queue.join(), 10)
+        finally:
+            await application.stop()
+            await bot.on_stop(application)
+            await application.shutdown()
+            await bot.on_shutdown(application)
+        return request
+
+    request = asyncio.run(asyncio.wait_for(main(), 60))
+    replies = [params for endpoint, params in request.calls if endpoint == 'sendMessage']
+    assert len(replies) == 1
+    assert int(replies[0]['chat_id']) == 4242
@@ -0,0 +1,161 @@
+# Write-behind buffer against a real database
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import srcpython as bot
+
+SUBJECT = bot.SUBJECTS[0]
+
+def run_with_queue(db_path, make_write_behind, scenario, **kwargs):
+    async def main():
+        database = bot.Database(db_path)
+        writes = make_write_behind(database, **kwargs)
+        try:
+            return await scenario(writes, database)
+        finally:
+            database.close()
+    return asyncio.run(asyncio.wait_for(main(), 10))
+
+def test_a_row_that_never_commits_is_dropped_after_max_attempts(db_path, make_write_behind):
+    async def scenario(writes, database):
+        writes.add('user_progress', [1, SUBJECT, 5, 10])
+        # No such subject: the subject_id subquery is NULL in a NOT NULL column
+        writes.add('user_progress', [2, "अज्ञात विषय", 5, 10])
+        writes.add('users', [1, 'one', 'एक', bot.GENDER_OTHER], key=1)
+        for attempt in range(writes.max_attempts):
+            with pytest.raises(Exception):
+                await writes.flush()
+        # Rows buffered while the flush kept failing go in with the rest
+        writes.add('user_progress', [3, SUBJECT, 7, 10])
+        await writes.flush()
+        progress = await database.fetchall("SELECT user_id FROM user_progress ORDER BY user_id")
+        users = await database.fetchall("SELECT user_id FROM users")
+        return progress, users, writes.metrics
+
+    progress, users, metrics = run_with_queue(db_path, make_write_behind, scenario, journal_path='', max_attempts=2)
+    assert progress == [(1,), (3,)]
+    assert users == [(1,)]
+    assert metrics['dropped'] == 1
+    assert metrics['written'] == 3
+
+def test_flush_goes_back_to_whole_batches_after_recovering(db_path, make_write_behind):
+    async def scenario(writes, database):
+        writes.add('user_progress', [2, "अज्ञात विषय", 5, 10])
+        with pytest.raises(Exception):
+            await writes.flush()
+        await writes.flush()
+        writes.add('user_progress', [2, "अज्ञात विषय", 5, 10])
+        # A fresh failure is retried again before anything is dropped
+        with pytest.raises(Exception):
+            await writes.flush()
+        return writes.metrics['dropped']
+
+    assert run_with_queue(db_path, make_write_behind, scenario, journal_path='', max_attempts=1) == 1
+
+# Journal replay. A crash is simulated by dropping a queue without
+# stopping it; a fresh queue on the same journal then starts up.
+def journaled(make_write_behind, database, journal):
+    return make_write_behind(database, journal_path=journal, max_batch=10**6, max_delay=3600)
+
+async def crash(writes):
+    writes._task.cancel()
+    try:
+        await writes._task
+    except asyncio.CancelledError:
+        pass
+    os.close(writes._journal_fd)
+
+def add_results(writes, user_ids):
+    for user_id in user_ids:
+        writes.add('user_progress', [user_id, SUBJECT, user_id, 10])
+
+async def progress_rows(database):
+    return await database.fetchall("SELECT user_id FROM user_progress ORDER BY user_id")
+
+def test_rows_journaled_before_a_crash_are_replayed_once(db_path, make_write_behind, tmp_path):
+    journal = str(tmp_path / 'journal')
+
+    async def scenario(writes, database):
+        await writes.start()
+        add_results(writes, [1, 2, 3])
+        await crash(writes)
+        assert await progress_rows(database) == []
+        
+        restarted = journaled(make_write_behind, database, journal)
+        await restarted.start()
+        assert await progress_rows(database) == [(1,), (2,), (3,)]
+        # A second crash right after the replay flush replays nothing
+        await crash(restarted)
+        again = journaled(make_write_behind, database, journal)
+        await again.start()
+        await again.stop()
+        return await progress_rows(database)
+
+    rows = run_with_queue(db_path, make_write_behind, scenario,
+                          journal_path=journal, max_batch=10**6, max_delay=3600)
+    assert rows == [(1,), (2,), (3,)]
+
+def test_crash_between_commit_and_journal_truncation_is_not_applied_twice(db_path, make_write_behind, tmp_path):
+    journal = str(tmp_path / 'journal')
+
+    async def scenario(writes, database):
+        await writes.start()
+        add_results(writes, [1, 2])
+        with open(journal, 'rb') as f:
+            before_flush = f.read()
+        await writes.flush()
+        add_results(writes, [3])
+        await crash(writes)
+        # The flush committed, but its truncation of the journal never made it
+        with open(journal, 'ab') as f:
+            f.write(before_flush)
+        
+        restarted = journaled(make_write_behind, database, journal)
+        await restarted.start()
+        await restarted.stop()
+        return await progress_rows(database)
+
+    rows = run_with_queue(db_path, make_write_behind, scenario,
+                          journal_path=journal, max_batch=10**6, max_delay=3600)
+    assert rows == [(1,), (2,), (3,)]
+
+def test_torn_final_line_is_skipped(db_path, make_write_behind, tmp_path):
+    journal = str(tmp_path / 'journal')
+
+    async def scenario(writes, database):
+        await writes.start()
+        add_results(writes, [1])
+        await crash(writes)
+        with open(journal, 'ab') as f:
+            f.write(b'[99, "user_progress", null, [2, ')
+        
+        restarted = journaled(make_write_behind, database, journal)
+        await restarted.start()
+        await restarted.stop()
+        return await progress_rows(database)
+
+    rows = run_with_queue(db_path, make_write_behind, scenario,
+                          journal_path=journal, max_batch=10**6, max_delay=3600)
+    assert rows == [(1,)]
+
+def test_keyed_rows_replay_their_latest_value(db_path, make_write_behind, tmp_path):
+    journal = str(tmp_path / 'journal')
+
+    async def scenario(writes, database):
+        await writes.start()
+        writes.add('reminder_status', [bot.REMINDER_SENT, '2026-10-17 10:00:00', 1], key=1)
+        await database.add_reminder(1, 1, "अभ्यास", datetime(2026, 10, 17, 10, 0))
+        writes.add('reminder_status', [bot.REMINDER_FAILED, '2026-10-17 10:01:00', 1], key=1)
+        await crash(writes)
+        
+        restarted = journaled(make_write_behind, database, journal)
+        await restarted.start()
+        await restarted.stop()
+        return await database.fetchone("SELECT status, sent_at FROM reminders WHERE id = 1")
+
+    row = run_with_queue(db_path, make_write_behind, scenario,
+                         journal_path=journal, max_batch=10**6, max_delay=3600)
+    assert row == (bot.REMINDER_FAILED, '2026-10-17 10:01:00')